@@ -60,7 +60,8 @@ class Apps(Extension):
                 f"Found {len(ctx.target.attachments)} embeds in message {ctx.target.id}: {ctx.target.attachments}"
             )
             # run the update command
-            await self.messageLib.update(ctx)
+            # a refresh asked for by the user always probes the server
+            await self.messageLib.update(ctx, max_age=0)
             await ctx.send(
                 embed=self.messageLib.standard_embed(
                     title="Success",
@@ -124,7 +124,7 @@ class Buttons(Extension):
             )
 
             # get the pipeline and index from the message
-            total = self.databaseLib.count(pipeline)
+            total = await self.databaseLib.async_count(pipeline)
             if index + 1 >= total:
                 index = 0
             else:
@@ -186,7 +186,7 @@ class Buttons(Extension):
             )
 
             # get the pipeline and index from the message
-            total = self.databaseLib.count(pipeline)
+            total = await self.databaseLib.async_count(pipeline)
             if index - 1 >= 0:
                 index -= 1
             else:
@@ -350,7 +350,7 @@ class Buttons(Extension):
             index, pipeline = await self.messageLib.get_pipe(org)
 
             # get the total number of servers
-            total = self.databaseLib.count(pipeline)
+            total = await self.databaseLib.async_count(pipeline)
 
             # create the text input
             text_input = ShortText(
@@ -536,7 +536,8 @@ class Buttons(Extension):
                     case "last_scan":
                         sort_method = {"$sort": {"lastSeen": -1}}
                     case "random":
-                        sort_method = {"$sample": {"size": 1000}}
+                        sort_method = None
+                        extra = self.databaseLib.random_stages()
                     case _:
                         await ctx.send(
                             embed=self.messageLib.standard_embed(
@@ -557,16 +558,28 @@ class Buttons(Extension):
                     ephemeral=True,
                 )
 
-                extra.extend(pipeline)
-                pipeline = extra
-
-                # loop through the pipeline and replace the sort method
-                for i, pipe in enumerate(pipeline):
-                    if "$sort" in pipe or "$sample" in pipe:
-                        pipeline[i] = sort_method
-                        break
+                # drop the seed and order of a previous random sort
+                pipeline = self.databaseLib.strip_random(pipeline)
+
+                if sort_method is None:
+                    # the random stages go after the filters of the pipeline
+                    pipeline = [
+                        pipe
+                        for pipe in pipeline
+                        if "$sort" not in pipe and "$sample" not in pipe
+                    ]
+                    pipeline.extend(extra)
                 else:
-                    pipeline.append(sort_method)
+                    extra.extend(pipeline)
+                    pipeline = extra
+
+                    # loop through the pipeline and replace the sort method
+                    for i, pipe in enumerate(pipeline):
+                        if "$sort" in pipe or "$sample" in pipe:
+                            pipeline[i] = sort_method
+                            break
+                    else:
+                        pipeline.append(sort_method)
 
                 # loop through the pipeline and remove the limit
                 for i, pipe in enumerate(pipeline):
@@ -625,7 +638,8 @@ class Buttons(Extension):
             ephemeral=True,
             delete_after=2,
         )
-        await self.messageLib.update(ctx)
+        # a refresh asked for by the user always probes the server
+        await self.messageLib.update(ctx, max_age=0)
 
     # button to show mods
     @component_callback("mods")
@@ -644,7 +658,7 @@ class Buttons(Extension):
             # get the pipeline
             self.logger.print(f"pipeline: {pipeline}")
 
-            host = self.databaseLib.get_doc_at_index(pipeline, index)
+            host = await self.databaseLib.async_get_doc_at_index(pipeline, index)
 
             if "mods" not in host.keys() or "modpackData" not in host.keys():
                 await ctx.send(
@@ -758,7 +772,7 @@ class Buttons(Extension):
             # get the pipeline
             self.logger.print(f"pipeline: {pipeline}")
 
-            host = self.databaseLib.get_doc_at_index(pipeline, 0)
+            host = await self.databaseLib.async_get_doc_at_index(pipeline, 0)
 
             if host["lastSeen"] < time.time() - 300:
                 await ctx.send(
@@ -962,7 +976,7 @@ class Buttons(Extension):
                 return
 
             # try and join the server
-            host = self.databaseLib.get_doc_at_index(pipeline, index)
+            host = await self.databaseLib.async_get_doc_at_index(pipeline, index)
             ServerType = self.mcLib.ServerType
 
             res: ServerType = await self.mcLib.join(
@@ -1008,31 +1022,21 @@ class Buttons(Extension):
 
         await ctx.defer(ephemeral=True)
 
-        data = self.databaseLib.get_doc_at_index(pipeline, index)
-
-        streams = []
-        raw_streams = await self.twitchLib.async_get_streamers()
+        # the doc the message shows, if its session still has it
+        session = self.messageLib.sessions.get(org.id)
+        if session is not None and session["doc"] is not None:
+            data = session["doc"]
+        else:
+            data = await self.databaseLib.async_get_doc_at_index(pipeline, index)
 
-        users_streaming: list[str] = [i["user_name"] for i in raw_streams]
+        # answered from the index of live streams, twitch is only called if it is stale
         server_players = [player["name"]
                           for player in data["players"]["sample"]]
-
-        streaming_players = list(
-            set(server_players)
-            - set(users_streaming).symmetric_difference(set(server_players))
-        )
-        self.logger.debug(f"Found {len(streaming_players)} streams in server")
-
-        for player in streaming_players:
-            stream = raw_streams[users_streaming.index(player)]
-            if stream is not None and stream not in streams:
-                streams.append(
-                    f"{stream['user_name']}: [{stream['title']}](https://twitch.tv/{stream['user_login']})"
-                )
-
-            if len(streams) >= len(users_streaming):
-                # already added all the streams
-                break
+        streams = [
+            f"{stream['user_name']}: [{stream['title']}](https://twitch.tv/{stream['user_login']})"
+            for stream in await self.twitchLib.async_live_streams(*server_players)
+        ]
+        self.logger.debug(f"Found {len(streams)} streams in server")
 
         if len(streams) == 0:
             await ctx.send(
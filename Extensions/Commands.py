@@ -1,4 +1,5 @@
 import asyncio
+import io
 import json
 import os
 import re
@@ -8,7 +9,6 @@ from threading import Thread
 
 import aiohttp
 import country_converter
-import requests
 import sentry_sdk
 from interactions import (
     slash_command,
@@ -75,6 +75,8 @@ class Commands(Extension):
         self.client_id = client_id
         self.client_secret = client_secret
         self.upload_serv = upload_serv
+        # made on the first /graph, so plotly is only imported when needed
+        self.graphs = None
 
     @slash_command(
         name="find",
@@ -82,7 +84,7 @@ class Commands(Extension):
         options=[
             SlashCommandOption(
                 name="ip",
-                description="The ip of the server or a subnet mask (ex:10.0.0.0/24)",
+                description="The ip of the server or subnets (ex:10.0.0.0/24, 10.1.0.0/16)",
                 type=OptionType.STRING,
                 required=False,
             ),
@@ -219,10 +221,11 @@ class Commands(Extension):
                 components=self.messageLib.buttons(),
             )
 
-            # default pipeline
+            # default pipeline, in a random order that is stable across pages
             pipeline = [
                 base_match,
-                {"$sample": {"size": 10000}},
+                *self.databaseLib.random_stages(),
+                {"$limit": 10000},
             ]
 
             if player is not None:
@@ -259,8 +262,9 @@ class Commands(Extension):
                     f"Finding servers with player {player} on them ({uuid})"
                 )
 
+                # every server the player was seen on, from the players collection
                 pipeline[0]["$match"]["$and"].append(
-                    {"players.sample.id": uuid},
+                    await self.databaseLib.players.async_server_match(uuid)
                 )
 
             if version is not None:
@@ -348,6 +352,11 @@ class Commands(Extension):
                     )
                     return
             if sign is not None:
+                # the trigram index narrows the docs, the regex does the real match
+                grams = self.textLib.regex_grams(sign)
+                if grams:
+                    pipeline[0]["$match"]["$and"].append(
+                        {"signGrams": {"$all": grams}})
                 pipeline[0]["$match"]["$and"].append(
                     {"world.signs": {"$elemMatch": {"text": {"$regex": f".*{sign}.*"}}}}
                 )
@@ -379,6 +388,12 @@ class Commands(Extension):
                     )
                     return
 
+                # the trigram index narrows the docs, the regex does the real match
+                grams = self.textLib.regex_grams(description)
+                if grams:
+                    pipeline[0]["$match"]["$and"].append(
+                        {"motdGrams": {"$all": grams}})
+
                 # case-insensitive regex, search through desc.text and through desc.extra.text
                 pipeline[0]["$match"]["$and"].append(
                     {
@@ -448,45 +463,27 @@ class Commands(Extension):
             if cracked is not None:
                 pipeline[0]["$match"]["$and"].append({"cracked": cracked})
             if ip is not None:
-                # test if the ip is a valid subnet mask like 10.0.0.0/24
-                if "/" in ip:
-                    mask = ip.split("/")[1]
-                    ip = ip.split("/")[0]
-                    if mask.isnumeric():
-                        ip = ip.split(".")
-                        match mask:
-                            case "8":
-                                exp = rf"{ip[0]}\.{ip[1]}\.{ip[2]}\.\d+"
-                            case "16":
-                                exp = rf"{ip[0]}\.{ip[1]}\.\d+\.\d+"
-                            case "24":
-                                exp = rf"{ip[0]}\.\d+\.\d+\.\d+"
-                            case "32":
-                                exp = rf"{ip[0]}\.{ip[1]}\.{ip[2]}\.{ip[3]}"
-                            case _:
-                                await msg.edit(
-                                    embed=self.messageLib.standard_embed(
-                                        title="Error",
-                                        description=f"Mask `{mask}` not a valid mask",
-                                        color=RED,
-                                    ),
-                                    components=self.messageLib.buttons(),
-                                )
-                                return
-
-                        pipeline[0]["$match"]["$and"].append(
-                            {"ip": {"$regex": f"^{exp}$", "$options": "i"}}
-                        )
-                    else:
+                # subnets like 10.0.0.0/24, comma separated, are ranges of ipInt
+                if "/" in ip or "," in ip:
+                    try:
+                        ranges = self.textLib.parse_cidrs(ip)
+                    except ValueError:
                         await msg.edit(
                             embed=self.messageLib.standard_embed(
                                 title="Error",
-                                description=f"Mask `{mask}` not a valid mask",
+                                description=f"`{ip}` is not a valid subnet",
                                 color=RED,
                             ),
                             components=self.messageLib.buttons(),
                         )
                         return
+
+                    ip_ranges = [
+                        {"ipInt": {"$gte": lo, "$lte": hi}} for lo, hi in ranges
+                    ]
+                    pipeline[0]["$match"]["$and"].append(
+                        ip_ranges[0] if len(ip_ranges) == 1 else {"$or": ip_ranges}
+                    )
                 else:
                     pipeline[0]["$match"]["$and"].append({"ip": ip})
             if country is not None:
@@ -499,7 +496,7 @@ class Commands(Extension):
                 pipeline[0]["$match"]["$and"].append(
                     {"whitelist": whitelisted})
 
-            total = self.databaseLib.count(pipeline)
+            total = await self.databaseLib.async_count(pipeline)
 
             if total == 0:
                 await msg.edit(
@@ -598,8 +595,8 @@ class Commands(Extension):
             )
 
             # test if the server is online
-            if self.databaseLib.count([{"$match": pipeline}]) == 0:
-                doc = self.serverLib.update(host=ip, port=port)
+            if await self.databaseLib.async_count([{"$match": pipeline}]) == 0:
+                doc = await self.serverLib.async_update(host=ip, port=port)
                 if doc is None:
                     await ctx.send(
                         embed=self.messageLib.standard_embed(
@@ -765,45 +762,28 @@ class Commands(Extension):
                     ),
                 )
 
-            names = [i["user_name"] for i in streams]
-
-            # get the servers
-            # by case-insensitive name of streamer and players.sample is greater than 0
-            pipeline = [
-                base_match,
-                {
-                    "$project": {
-                        "_id": 1,
-                    }
-                },
-            ]
-
-            total = self.databaseLib.count(pipeline)
-            self.logger.debug(f"Got {total} servers")
-            msg = await msg.edit(
-                embed=self.messageLib.standard_embed(
-                    title="Loading...",
-                    description="Found " +
-                    str(total) + " servers in the database",
-                    color=BLUE,
-                ),
+            logins = sorted(
+                {i["user_login"].lower() for i in streams}
+                | {i["user_name"].lower() for i in streams}
             )
 
-            _ids = [i["_id"] for i in self.databaseLib.aggregate(pipeline)]
-
-            self.logger.debug(f"Got {len(_ids)} ids")
-
+            # get the servers the streamers were seen on, with the index of the
+            # lowercase sample names
             pipeline = [
                 {
                     "$match": {
                         "$and": [
-                            {"_id": {"$in": _ids}},
-                            {"players.sample": {"$exists": True}},
+                            *base_match["$match"]["$and"],
+                            {"players.sampleNames": {"$in": logins}},
                         ]
                     }
-                }
+                },
+                {"$sort": {"lastSeen": -1}},
             ]
 
+            total = await self.databaseLib.async_count(pipeline)
+            self.logger.debug(f"Got {total} servers")
+
             if total == 0:
                 await msg.edit(
                     embed=self.messageLib.standard_embed(
@@ -918,10 +898,9 @@ class Commands(Extension):
             )
 
             # load the file
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file.url) as resp:
-                    data = await resp.read()
-                    lines = data.decode("utf-8").split("\n")
+            async with self.messageLib.http.get(file.url) as resp:
+                data = await resp.read()
+                lines = data.decode("utf-8").split("\n")
             # remove the newlines
             lines = delimiter.join(lines)
             lines = lines.split(delimiter)
@@ -1021,271 +1000,104 @@ class Commands(Extension):
                 embed=main_embed,
             )
 
-            # get the stats
-            total_servers = self.databaseLib.col.count_documents({})
+            # every stat comes from the rollup document, see pyutils/stats.py
+            stats = await self.databaseLib.stats.async_read()
+            total_servers = stats["servers"]
+            total_players = stats["players"]
+            total_sample_players = stats["samplePlayers"]
 
             main_embed.add_field(
                 name="Servers",
                 value=f"{total_servers:,}",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the total player count, ignoring servers with over 150k players and less than one player,
-            # and the version name is not Unknown, or UNKNOWN or null
-            pipeline = [
-                {
-                    "$match": {
-                        "$and": [
-                            {"players.online": {"$lt": 150000}},
-                            {"players.online": {"$gt": 0}},
-                            {"version.name": {
-                                "$nin": ["Unknown", "UNKNOWN", None]}},
-                        ]
-                    }
-                },
-                {"$group": {"_id": None, "total": {"$sum": "$players.online"}}},
-            ]
-            total_players = self.databaseLib.aggregate(
-                pipeline).try_next()["total"]
-
             main_embed.add_field(
                 name="Players",
                 value=f"{total_players:,}",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the total number of players in players.sample
-            pipeline = [
-                {"$unwind": "$players.sample"},
-                {"$group": {"_id": None, "total": {"$sum": 1}}},
-            ]
-            total_sample_players = self.databaseLib.aggregate(pipeline).try_next()[
-                "total"
-            ]
-
             main_embed.add_field(
                 name="Logged Players",
-                value=f"{total_sample_players:,} ({round(total_sample_players / total_players * 100, 2)}%)",
+                value=f"{total_sample_players:,} ({round(total_sample_players / max(total_players, 1) * 100, 2)}%)",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the number of players which do not have a player id of "00000000-0000-0000-0000-000000000000"
-            pipeline = [
-                {
-                    "$match": {
-                        "players.sample.id": {
-                            "$ne": "00000000-0000-0000-0000-000000000000"
-                        }
-                    }
-                },
-                {"$group": {"_id": None, "total": {"$sum": 1}}},
-            ]
-            total_real_players = self.databaseLib.aggregate(pipeline).try_next()[
-                "total"
-            ]
-
             main_embed.add_field(
                 name="Real Players",
-                value=f"{total_real_players:,} ({round(total_real_players / total_sample_players * 100, 2)}%)",
+                value=f"{stats['realPlayers']:,} ({round(stats['realPlayers'] / max(total_sample_players, 1) * 100, 2)}%)",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the number of players which have a player id of "00000000-0000-0000-0000-000000000000"
-            pipeline = [
-                {
-                    "$match": {
-                        "players.sample.id": "00000000-0000-0000-0000-000000000000"
-                    }
-                },
-                {"$group": {"_id": None, "total": {"$sum": 1}}},
-            ]
-            total_fake_players = self.databaseLib.aggregate(pipeline).try_next()[
-                "total"
-            ]
-
             main_embed.add_field(
                 name="Fake Players",
-                value=f"{total_fake_players:,} ({round(total_fake_players / total_sample_players * 100, 2)}%)",
+                value=f"{stats['fakePlayers']:,} ({round(stats['fakePlayers'] / max(total_sample_players, 1) * 100, 2)}%)",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
 
             # top three orgs
-            pipeline = [
-                {"$match": {"org": {"$ne": None}}},
-                {"$group": {"_id": "$org", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": 3},
-            ]
-            top_three_orgs = list(self.databaseLib.aggregate(pipeline))
-
             main_embed.add_field(
                 name="Top Three Orgs",
                 value="```css\n"
                 + "\n".join(
                     [
-                        f"{i['_id']}: {round(i['count'] / total_servers * 100, 2)}%"
-                        for i in top_three_orgs
+                        f"{org}: {round(count / total_servers * 100, 2)}%"
+                        for org, count in self.databaseLib.stats.top(stats["orgs"], 3)
                     ]
                 )
                 + "\n```",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the five most common server version names
-            pipeline = [
-                {
-                    "$match": {
-                        "$and": [
-                            {"players.online": {"$lt": 150000}},
-                            {"players.online": {"$gt": 0}},
-                            {"version.name": {
-                                "$nin": ["Unknown", "UNKNOWN", None]}},
-                        ]
-                    }
-                },
-                {"$group": {"_id": "$version.name", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": 5},
-            ]
-            top_five_versions = list(self.databaseLib.aggregate(pipeline))
 
+            # the five most common server version names
             main_embed.add_field(
                 name="Top Five Versions",
                 value="```css\n"
                 + "\n".join(
                     [
-                        f"{i['_id']}: {round(i['count'] / total_servers * 100, 2)}%"
-                        for i in top_five_versions
+                        f"{name}: {round(count / total_servers * 100, 2)}%"
+                        for name, count in self.databaseLib.stats.top(
+                            stats["versions"], 5
+                        )
                     ]
                 )
                 + "\n```",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the five most common server version ids
-            pipeline = [
-                {
-                    "$match": {
-                        "$and": [
-                            {"players.online": {"$lt": 150000}},
-                            {"players.online": {"$gt": 0}},
-                            {"version.name": {
-                                "$nin": ["Unknown", "UNKNOWN", None]}},
-                        ]
-                    }
-                },
-                {"$group": {"_id": "$version.protocol", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}},
-                {"$limit": 5},
-            ]
-            top_five_version_ids = list(self.databaseLib.aggregate(pipeline))
 
+            # the five most common server version ids
             main_embed.add_field(
                 name="Top Five Version IDs",
                 value="```css\n"
                 + "\n".join(
                     [
-                        f"{self.textLib.protocol_str(i['_id'])}: {round(i['count'] / total_servers * 100, 2)}%"
-                        for i in top_five_version_ids
+                        f"{self.textLib.protocol_str(protocol)}: {round(count / total_servers * 100, 2)}%"
+                        for protocol, count in self.databaseLib.stats.top(
+                            stats["protocols"], 5
+                        )
                     ]
                 )
                 + "\n```",
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the percentage of servers which are cracked (cracked == True)
-            pipeline = [
-                {"$match": {"cracked": True}},
-                {"$group": {"_id": None, "count": {"$sum": 1}}},
-            ]
-            cracked = list(self.databaseLib.aggregate(pipeline))[0]["count"]
 
             main_embed.add_field(
                 name="Cracked",
-                value=self.textLib.percent_bar(cracked, total_servers),
+                value=self.textLib.percent_bar(stats["cracked"], total_servers),
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the percentage of servers which have favicons (hasFavicon == True)
-            pipeline = [
-                {"$match": {"hasFavicon": True}},
-                {"$group": {"_id": None, "count": {"$sum": 1}}},
-            ]
-            has_favicon = list(self.databaseLib.aggregate(pipeline))
-
             main_embed.add_field(
                 name="Has Favicon",
-                value=self.textLib.percent_bar(
-                    has_favicon[0]["count"], total_servers),
+                value=self.textLib.percent_bar(stats["hasFavicon"], total_servers),
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the percentage of servers which have forge mods (hasForgeData == True)
-            pipeline = [
-                {"$match": {"hasForgeData": True}},
-                {"$group": {"_id": None, "count": {"$sum": 1}}},
-            ]
-            has_forge_data = list(self.databaseLib.aggregate(pipeline))[
-                0]["count"]
-
             main_embed.add_field(
                 name="Has Forge Data",
-                value=self.textLib.percent_bar(has_forge_data, total_servers),
+                value=self.textLib.percent_bar(stats["hasForgeData"], total_servers),
                 inline=True,
             )
-            msg = await msg.edit(
-                embed=main_embed,
-            )
-
-            # get the percentage of servers that are whitelisted
-            pipeline = [
-                {"$match": {"whitelist": {"$exists": True}}},
-                {"$group": {"_id": None, "count": {"$sum": 1}}},
-            ]
-            have_whitelist = list(self.databaseLib.aggregate(pipeline))[
-                0]["count"]
-
-            pipeline = [
-                {"$match": {"whitelist": True}},
-                {"$group": {"_id": None, "count": {"$sum": 1}}},
-            ]
-            whitelist_enabled = list(self.databaseLib.aggregate(pipeline))[
-                0]["count"]
-
             main_embed.add_field(
                 name="Whitelisted",
                 value=self.textLib.percent_bar(
-                    whitelist_enabled, have_whitelist),
+                    stats["whitelisted"], stats["whitelistKnown"]
+                ),
                 inline=True,
             )
             msg = await msg.edit(
@@ -1328,6 +1140,9 @@ class Commands(Extension):
         try:
             import pyutils.graph as graph
 
+            if self.graphs is None:
+                self.graphs = graph.GraphRenderer()
+
             await ctx.defer()
             embed = self.messageLib.standard_embed(
                 title="Graph",
@@ -1339,7 +1154,7 @@ class Commands(Extension):
             )
 
             # get the total number of servers
-            total_servers = self.databaseLib.col.count_documents({})
+            total_servers = await self.databaseLib.async_count_documents({})
 
             # get the top 20 versions
             pipeline = [
@@ -1363,24 +1178,28 @@ class Commands(Extension):
                 {"$sort": {"size": -1}},
                 {"$limit": 20},
             ]
-            versions = list(self.databaseLib.aggregate(pipeline))
+            versions = await self.databaseLib.async_aggregate(pipeline)
 
-            vers_fig = graph.draw_pie(versions, "Versions")
-            self.logger.debug("Made version graph")
+            # rendered png of each graph, and the html of the graphs
+            pngs = {}
+            htmls = []
 
-            # hide the labels before saving
-            vers_fig.update_layout(
-                showlegend=False,
-            )
-            vers_fig.write_image("assets/graphs/vers.png")
-            # show the labels again
-            vers_fig.update_layout(
-                showlegend=True,
+            def files():
+                # a File reads its buffer, so every edit needs new ones
+                return [
+                    File(io.BytesIO(png), file_name=name) for name, png in pngs.items()
+                ]
+
+            # hide the labels in the png
+            pngs["vers.png"], html = await self.graphs.render(
+                "pie", versions, "Versions", legend=False
             )
+            htmls.append(html)
+            self.logger.debug("Made version graph")
 
             msg = await msg.edit(
                 embed=embed,
-                files=[File("assets/graphs/vers.png")],
+                files=files(),
             )
 
             # get the percentage of servers that are cracked
@@ -1389,7 +1208,7 @@ class Commands(Extension):
                 {"$group": {"_id": None, "count": {"$sum": 1}}},
             ]
             cracked = (
-                list(self.databaseLib.aggregate(pipeline))[
+                (await self.databaseLib.async_aggregate(pipeline))[
                     0]["count"] / total_servers
             )
 
@@ -1399,7 +1218,7 @@ class Commands(Extension):
                 {"$group": {"_id": None, "count": {"$sum": 1}}},
             ]
             has_favicon = (
-                list(self.databaseLib.aggregate(pipeline))[
+                (await self.databaseLib.async_aggregate(pipeline))[
                     0]["count"] / total_servers
             )
 
@@ -1409,7 +1228,7 @@ class Commands(Extension):
                 {"$group": {"_id": None, "count": {"$sum": 1}}},
             ]
             has_forge_data = (
-                list(self.databaseLib.aggregate(pipeline))[
+                (await self.databaseLib.async_aggregate(pipeline))[
                     0]["count"] / total_servers
             )
 
@@ -1419,7 +1238,7 @@ class Commands(Extension):
                 {"$group": {"_id": None, "count": {"$sum": 1}}},
             ]
             is_whitelist = (
-                list(self.databaseLib.aggregate(pipeline))[
+                (await self.databaseLib.async_aggregate(pipeline))[
                     0]["count"] / total_servers
             )
 
@@ -1429,7 +1248,7 @@ class Commands(Extension):
                 {"$group": {"_id": None, "count": {"$sum": 1}}},
             ]
             enforces_secure_chat = (
-                list(self.databaseLib.aggregate(pipeline))[
+                (await self.databaseLib.async_aggregate(pipeline))[
                     0]["count"] / total_servers
             )
 
@@ -1443,13 +1262,12 @@ class Commands(Extension):
             ]
             # sort data
             data = sorted(data, key=lambda pnt: pnt["size"], reverse=True)
-            misc_fig = graph.draw_bar(data, "Misc")
+            pngs["misc.png"], html = await self.graphs.render("bar", data, "Misc")
+            htmls.append(html)
             self.logger.debug("Made misc graph")
-            misc_fig.write_image("assets/graphs/misc.png")
             msg = await msg.edit(
                 embed=embed,
-                files=[File("assets/graphs/vers.png"),
-                       File("assets/graphs/misc.png")],
+                files=files(),
             )
 
             # get the top 2000 servers based on players.online
@@ -1480,18 +1298,16 @@ class Commands(Extension):
                     }
                 },
             ]
-            top_servers = list(self.databaseLib.aggregate(pipeline))
+            top_servers = await self.databaseLib.async_aggregate(pipeline)
 
-            map_fig = graph.draw_geoheatmap(top_servers, "Top Servers")
+            pngs["map.png"], html = await self.graphs.render(
+                "geoheatmap", top_servers, "Top Servers"
+            )
+            htmls.append(html)
             self.logger.debug("Made map graph")
-            map_fig.write_image("assets/graphs/map.png")
             msg = await msg.edit(
                 embed=embed,
-                files=[
-                    File("assets/graphs/vers.png"),
-                    File("assets/graphs/misc.png"),
-                    File("assets/graphs/map.png"),
-                ],
+                files=files(),
             )
 
             # get the sum of all the server's players.online for each country
@@ -1514,7 +1330,7 @@ class Commands(Extension):
                     }
                 },
             ]
-            country_players = list(self.databaseLib.aggregate(pipeline))
+            country_players = await self.databaseLib.async_aggregate(pipeline)
 
             for i, country in enumerate(country_players):
                 country_players[i]["label"] = country["_id"]
@@ -1524,18 +1340,13 @@ class Commands(Extension):
                     to="ISO3",
                 )
 
-            world_fig = graph.draw_choropleth(
-                country_players, "Players Per Country")
-
-            world_fig.write_image("assets/graphs/world.png")
+            pngs["world.png"], html = await self.graphs.render(
+                "choropleth", country_players, "Players Per Country"
+            )
+            htmls.append(html)
             msg = await msg.edit(
                 embed=embed,
-                files=[
-                    File("assets/graphs/vers.png"),
-                    File("assets/graphs/misc.png"),
-                    File("assets/graphs/map.png"),
-                    File("assets/graphs/world.png"),
-                ],
+                files=files(),
             )
 
             # get the top 2000 servers based on players.online# get the top 2000 servers based on players.online
@@ -1568,42 +1379,35 @@ class Commands(Extension):
                     }
                 },
             ]
-            top_servers = list(self.databaseLib.aggregate(pipeline))
-
-            top_fig = graph.draw_scatter(top_servers, "Top Servers")
-            top_fig.update_layout(
-                xaxis_title="Max Players",
-                yaxis_title="Online Players",
+            top_servers = await self.databaseLib.async_aggregate(pipeline)
+
+            pngs["top.png"], html = await self.graphs.render(
+                "scatter",
+                top_servers,
+                "Top Servers",
+                layout_updates={
+                    "xaxis_title": "Max Players",
+                    "yaxis_title": "Online Players",
+                },
             )
+            htmls.append(html)
             self.logger.debug("Made top graph")
-            top_fig.write_image("assets/graphs/top.png")
             msg = await msg.edit(
                 embed=embed,
-                files=[
-                    File("assets/graphs/vers.png"),
-                    File("assets/graphs/misc.png"),
-                    File("assets/graphs/map.png"),
-                    File("assets/graphs/world.png"),
-                    File("assets/graphs/top.png"),
-                ],
-            )
-
-            # save the graphs to an html file
-            graph.save_graphs_html(
-                vers_fig, misc_fig, map_fig, world_fig, top_fig, filename="test.html"
+                files=files(),
             )
-            self.logger.debug("Saved graphs to html file")
 
             if self.upload_serv is not None and self.upload_serv != "...":
-                # upload the html file to a server
-                with open("test.html", "r") as f:
-                    html_string = f.read()
-                    r = requests.post(
-                        self.upload_serv,
-                        files={
-                            "file": ("graph.html", html_string, "text/html")},
-                    )
-                    print(r.status_code)
+                # upload the html of the graphs to a server
+                form = aiohttp.FormData()
+                form.add_field(
+                    "file",
+                    graph.graphs_html(*htmls),
+                    filename="graph.html",
+                    content_type="text/html",
+                )
+                async with self.messageLib.http.post(self.upload_serv, data=form) as r:
+                    self.logger.debug(f"Uploaded graphs: {r.status}")
         except Exception as err:
             if "403|Forbidden" in str(err):
                 await ctx.send(
@@ -1657,10 +1461,13 @@ class Commands(Extension):
 
             await ctx.defer()
 
-            # get the profile
-            profile = await self.playerLib.async_get_profile(uuid)
+            # get the servers, most recently seen first
+            servers = (
+                await self.databaseLib.players.async_servers_of(uuid) if uuid else []
+            )
 
-            if not profile:
+            # only ask mojang when the player was never seen
+            if len(servers) == 0 and not await self.playerLib.async_get_profile(uuid):
                 await ctx.send(
                     embed=self.messageLib.standard_embed(
                         title="Error",
@@ -1671,34 +1478,6 @@ class Commands(Extension):
                 )
                 return
 
-            uuid = profile["id"].replace("-", "")
-            uuid = f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
-
-            pipeline = [
-                {
-                    "$match": {
-                        "players.sample.id": uuid,
-                    }
-                },
-                {
-                    "$project": {
-                        "ip": 1,
-                        "port": 1,
-                        "lastSeen": 1,
-                        "players": {
-                            "$filter": {
-                                "input": "$players.sample",
-                                "as": "player",
-                                "cond": {"$eq": ["$$player.id", uuid]},
-                            }
-                        },
-                    }
-                },
-            ]
-
-            # get the servers
-            servers = list(self.databaseLib.aggregate(pipeline))
-
             if len(servers) == 0:
                 await ctx.send(
                     embed=self.messageLib.standard_embed(
@@ -1710,10 +1489,6 @@ class Commands(Extension):
                 )
                 return
 
-            # sort the servers by lastSeen
-            servers = sorted(
-                servers, key=lambda serv: serv["lastSeen"], reverse=True)
-
             header = (
                 "```\n|"
                 + "Server:Port".center(22)
@@ -1737,9 +1512,8 @@ class Commands(Extension):
             for i, server in enumerate(servers):
                 ip = server["ip"]
                 port = server["port"]
-                player = server["players"][0]
-                lastSeen_ply = player["lastSeen"]
-                lastSeen_serv = server["lastSeen"]
+                lastSeen_ply = server["lastSeen"]
+                lastSeen_serv = server.get("serverLastSeen") or 0
 
                 lastSeen_serv = datetime.fromtimestamp(
                     lastSeen_serv, tz=datetime.now().astimezone().tzinfo
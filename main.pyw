@@ -6,6 +6,7 @@
 import asyncio
 import os
 import sys
+import threading
 import time
 import traceback
 
@@ -122,6 +123,18 @@ textLib = utils.text
 serverLib = utils.server
 mcLib = utils.mc
 
+
+def db_maintenance():
+    # create missing indexes, then fill in fields that older docs are missing
+    databaseLib.indexes.ensure()
+    databaseLib.players.indexes.ensure()
+    databaseLib.backfill()
+    # build the /stats rollup, if there is none yet
+    databaseLib.stats.read()
+
+
+threading.Thread(target=db_maintenance, name="db-maintenance", daemon=True).start()
+
 bot = Client(
     token=DISCORD_TOKEN,
     status=Status.IDLE,
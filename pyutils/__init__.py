@@ -2,11 +2,15 @@ import pymongo
 import sentry_sdk
 
 from .database import Database
+from .geo import GeoResolver
+from .httpclient import HTTPClient
 from .logger import Logger
 from .message import Message
 from .minecraft import Minecraft
 from .player import Player
+from .prober import Prober
 from .server import Server
+from .session import SessionStore
 from .text import Text
 from .twitch import Twitch
 
@@ -51,27 +55,43 @@ class Utils:
 
         self.logger.clear()
 
+        # one pooled HTTP client for every class
+        self.http = HTTPClient(logger=self.logger)
+        self.logger.http = self.http
+
         self.database = Database(self.col, self.logger)
 
         self.text = Text(logger=self.logger)
         self.twitch = Twitch(
-            logger=self.logger, client_id=client_id, client_secret=client_secret
+            logger=self.logger,
+            client_id=client_id,
+            client_secret=client_secret,
+            http=self.http,
         )
 
+        self.prober = Prober(logger=self.logger)
+        self.geo = GeoResolver(logger=self.logger, ipinfo_token=info_token)
         self.server = Server(
             db=self.database,
             logger=self.logger,
             text=self.text,
             ipinfo_token=info_token,
+            prober=self.prober,
+            geo=self.geo,
         )
 
-        self.player = Player(logger=self.logger, server=self.server, db=self.database)
+        self.player = Player(
+            logger=self.logger, server=self.server, db=self.database, http=self.http
+        )
+        self.sessions = SessionStore(logger=self.logger)
         self.message = Message(
             logger=self.logger,
             db=self.database,
             text=self.text,
             server=self.server,
             twitch=self.twitch,
+            sessions=self.sessions,
+            http=self.http,
         )
 
         self.mc = Minecraft(
@@ -79,4 +99,5 @@ class Utils:
             player=self.player,
             server=self.server,
             text=self.text,
+            http=self.http,
         )
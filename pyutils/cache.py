@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """A thread safe, size bounded LRU cache whose entries expire after a timeout"""
+
+    _missing = object()
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        """Initializes the cache
+
+        Args:
+            maxsize (int, optional): The max number of entries, the least recently used
+                entry is evicted first. Defaults to 1024.
+            ttl (float, optional): The default seconds an entry lives for. Defaults to 60.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # key -> (expires, stored, value)
+        self._data: OrderedDict[Hashable, tuple[float, float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, key: Hashable, default: Any = None, max_age: Optional[float] = None
+    ) -> Any:
+        """Returns the value of a key if it has not expired
+
+        Args:
+            key (Hashable): The key
+            default (Any, optional): Returned on a miss. Defaults to None.
+            max_age (float, optional): Treat entries older than this many seconds as
+                missing. Defaults to None.
+
+        Returns:
+            Any: The value, or the default
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, self._missing)
+            if entry is self._missing:
+                self.misses += 1
+                return default
+
+            expires, stored, value = entry
+            if now >= expires:
+                del self._data[key]
+                self.misses += 1
+                return default
+            if max_age is not None and now - stored > max_age:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores a value
+
+        Args:
+            key (Hashable): The key
+            value (Any): The value
+            ttl (float, optional): Seconds the entry lives for, defaults to the cache ttl
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), now, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Returns how many seconds ago a key was stored, or None if it is missing"""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or time.monotonic() >= entry[0]:
+            return None
+        return time.monotonic() - entry[1]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes a key and returns its value"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of the cache"""
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+        return entry is not None and time.monotonic() < entry[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -1,16 +1,53 @@
+import asyncio
+import functools
+import hashlib
+import random
+import threading
 import time
 import traceback
-from itertools import zip_longest
-from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import pymongo
 import sentry_sdk
+from bson import ObjectId, json_util
+from pymongo import UpdateMany, UpdateOne
 from pymongo.results import UpdateResult
 
 # noinspection PyProtectedMember
 from sentry_sdk import trace
 
+from .cache import TTLCache
+from .indexes import IndexAdvisor
 from .logger import Logger
+from .players import Players
+from .stats import Stats
+from .text import Text
+from .writer import BulkWriter
+
+
+class Snapshot:
+    """The ordered `_id`s of a pipeline's results, packed into bytes when they are ObjectIds"""
+
+    def __init__(self, ids: list):
+        self.length = len(ids)
+        if all(isinstance(_id, ObjectId) for _id in ids):
+            self._packed = b"".join(_id.binary for _id in ids)
+            self._ids = None
+        else:
+            self._packed = None
+            self._ids = ids
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        if self._ids is not None:
+            return self._ids[index]
+        return ObjectId(self._packed[index * 12 : index * 12 + 12])
 
 
 class Database:
@@ -20,41 +57,98 @@ class Database:
         self,
         col: pymongo.collection.Collection,
         logger: "Logger",
+        max_workers: int = 8,
+        timeout: float = 120,
     ):
+        """Initializes the database class
+
+        Args:
+            col (pymongo.collection.Collection): The collection to use
+            logger (Logger): The logger class
+            max_workers (int, optional): Threads running the async api. Defaults to 8.
+            timeout (float, optional): Default seconds an async call is waited for,
+                and its maxTimeMS. Defaults to 120.
+        """
         self.col = col
         self.logger = logger
 
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="database"
+        )
+        self.timeout = timeout
+        self._local = threading.local()
+
+        # pipeline hash -> {index: sort values}, used for keyset pagination
+        self.cursors: OrderedDict[str, dict] = OrderedDict()
+        self.cursor_lock = threading.Lock()
+        self.max_cursors = 256
+        self.max_anchors = 64
+
+        # pipeline hash -> the ordered _ids of its results
+        self.snapshot_limit = 10000
+        self.snapshots = TTLCache(maxsize=32, ttl=30 * 60)
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_locks: dict[str, threading.Lock] = {}
+
+        # count pipeline hash -> number of documents
+        self.count_ttl = 300
+        self.counts = TTLCache(maxsize=512, ttl=self.count_ttl)
+
+        # coalesced write-behind upserts, see `queue_upsert`
+        self.writer = BulkWriter(col, logger)
+
+        # declared indexes, and explain sampling of the pipelines that run
+        self.indexes = IndexAdvisor(col, logger)
+
+        # the rollup read by /stats, kept up to date by the server writes
+        self.stats = Stats(col, logger, executor=self.executor)
+
+        # the players seen on each server, kept up to date by the server writes
+        self.players = Players(col, logger, executor=self.executor)
+
     @trace
     def get_doc_at_index(
         self,
         pipeline: list,
         index: int = 0,
     ) -> Optional[dict]:
+        """Gets the document at an index of a pipeline's results
+
+        Bounded pipelines (with a $limit or $sample) are read from a snapshot of their
+        results. Other sorted pipelines are paged with keyset (cursor) pagination, the sort
+        key and `_id` of every document returned is remembered, so the neighbouring pages
+        resume from a range predicate instead of skipping over every earlier document.
+
+        Args:
+            pipeline (list): The pipeline to page through
+            index (int, optional): The index of the document. Defaults to 0.
+
+        Returns:
+            Optional[dict]: The document, or None if there is no document at that index
+        """
+        new_pipeline = []
         try:
             tStart = time.perf_counter()
-            new_pipeline = pipeline.copy()
-
-            if isinstance(new_pipeline, dict):
-                new_pipeline = [new_pipeline]
-
-            for i, stage in enumerate(new_pipeline):
-                if "$limit" in stage:
-                    del new_pipeline[i]
-                if "$skip" in stage:
-                    del new_pipeline[i]
-                if "$sample" in stage:
-                    del new_pipeline[i]
-                    new_pipeline.insert(i, {"$sample": {"size": 1}})
-
-            if index > 0:
-                new_pipeline.append({"$limit": index + 1})
-                new_pipeline.append({"$skip": index})
+            new_pipeline = self.strip_paging(pipeline)
+            snapshot = self.snapshot(pipeline) if self.is_bounded(pipeline) else None
+
+            if snapshot is not None:
+                # the results are materialized, so this is a direct _id fetch
+                result = (
+                    self._aggregate(
+                        self.fetch_pipeline(pipeline, snapshot[index])
+                    ).try_next()
+                    if 0 <= index < len(snapshot)
+                    else None
+                )
+            elif any("$sample" in stage for stage in new_pipeline):
+                # random order has no stable position, so just take one random document
+                for i, stage in enumerate(new_pipeline):
+                    if "$sample" in stage:
+                        new_pipeline[i] = {"$sample": {"size": 1}}
+                result = self.logger.timer(self._aggregate, new_pipeline).try_next()
             else:
-                new_pipeline.append({"$limit": 1})
-
-            result = self.logger.timer(
-                self.col.aggregate, new_pipeline, allowDiskUse=True
-            ).try_next()
+                result = self._get_doc_keyset(new_pipeline, index)
 
             sentry_sdk.set_measurement(
                 "duration", time.perf_counter() - tStart, "seconds"
@@ -71,12 +165,368 @@ class Database:
 
             return None
 
+    def _get_doc_keyset(self, pipeline: list, index: int) -> Optional[dict]:
+        """Gets the document at an index, resuming from the closest known cursor
+
+        Args:
+            pipeline (list): The pipeline, without any $limit or $skip stages
+            index (int): The index of the document
+
+        Returns:
+            Optional[dict]: The document
+        """
+        key = self.pipeline_hash(pipeline)
+        sort_i, sort = self.keyset_sort(pipeline)
+
+        if sort is None:
+            # the pipeline can't be paged by a range, fall back to skipping
+            new_pipeline = pipeline + [{"$skip": index}, {"$limit": 1}]
+            return self.logger.timer(self._aggregate, new_pipeline).try_next()
+
+        pipeline = pipeline.copy()
+        if sort_i is None:
+            sort_i = len(pipeline)
+            pipeline.append({"$sort": sort})
+        else:
+            pipeline[sort_i] = {"$sort": sort}
+
+        with self.cursor_lock:
+            anchors = self.cursors.get(key, {}).copy()
+
+        if index - 1 in anchors:
+            # the next page, continue after the previous document
+            new_pipeline = pipeline.copy()
+            new_pipeline.insert(sort_i, self.keyset_match(sort, anchors[index - 1]))
+            new_pipeline.append({"$limit": 1})
+        elif index + 1 in anchors:
+            # the previous page, walk backwards from the following document
+            new_pipeline = pipeline.copy()
+            new_pipeline[sort_i] = {"$sort": {k: -v for k, v in sort.items()}}
+            new_pipeline.insert(
+                sort_i, self.keyset_match(sort, anchors[index + 1], reverse=True)
+            )
+            new_pipeline.append({"$limit": 1})
+        else:
+            # a jump, start from the closest cursor before the index (if any)
+            new_pipeline = pipeline.copy()
+            lower = [i for i in anchors if i < index]
+            skip = index
+            if lower:
+                start = max(lower)
+                skip = index - start - 1
+                new_pipeline.insert(sort_i, self.keyset_match(sort, anchors[start]))
+            if skip > 0:
+                new_pipeline.append({"$skip": skip})
+            new_pipeline.append({"$limit": 1})
+
+        result = self.logger.timer(self._aggregate, new_pipeline).try_next()
+
+        if result is not None:
+            self._save_cursor(key, index, sort, result)
+
+        return result
+
+    def _save_cursor(self, key: str, index: int, sort: dict, doc: dict):
+        """Remembers the sort key of the document at an index
+
+        Args:
+            key (str): The pipeline hash
+            index (int): The index of the document
+            sort (dict): The sort specification, ending with `_id`
+            doc (dict): The document at the index
+        """
+        values = [self.get_path(doc, k) for k in sort]
+        if values[-1] is None:
+            # the `_id` tie break is what makes a position unique
+            return
+        # a missing field is kept as None, keyset_match places it below every value
+
+        with self.cursor_lock:
+            anchors = self.cursors.pop(key, {})
+            anchors[index] = values
+            while len(anchors) > self.max_anchors:
+                # forget the cursor furthest from where the user is now
+                del anchors[max(anchors, key=lambda i: abs(i - index))]
+            self.cursors[key] = anchors
+
+            while len(self.cursors) > self.max_cursors:
+                self.cursors.popitem(last=False)
+
+    def snapshot(
+        self, pipeline: list | dict, fresh: bool = False
+    ) -> Optional["Snapshot"]:
+        """Materializes the `_id`s of a pipeline's results, in order
+
+        Snapshots are shared by every identical pipeline, so the same query from different
+        users is only run once, and a $sample pipeline keeps the same order on every page.
+
+        Args:
+            pipeline (list | dict): The pipeline
+            fresh (bool, optional): Run the pipeline again even if it has a snapshot.
+                Defaults to False.
+
+        Returns:
+            Optional[Snapshot]: The snapshot, or None if there are more than
+                `snapshot_limit` results
+        """
+        if isinstance(pipeline, dict):
+            pipeline = [pipeline]
+
+        key = self.pipeline_hash(pipeline)
+        if not fresh:
+            snapshot = self.snapshots.get(key)
+            if snapshot is not None:
+                # False marks a pipeline with too many results to snapshot
+                return None if snapshot is False else snapshot
+
+        with self.snapshot_lock:
+            lock = self.snapshot_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            # another caller may have made the snapshot while we waited
+            snapshot = None if fresh else self.snapshots.get(key)
+            if snapshot is None:
+                ids = self._snapshot_ids(pipeline)
+                seed = self.random_seed(pipeline)
+                limit = self.pipeline_limit(pipeline)
+                if seed is not None and len(ids) < min(limit, self.snapshot_limit + 1):
+                    # the walk from the seed ran out, wrap around to the docs below it
+                    ids += self._snapshot_ids(
+                        self.random_wrap(pipeline, seed)
+                        + [{"$limit": limit - len(ids)}]
+                    )
+
+                snapshot = Snapshot(ids) if len(ids) <= self.snapshot_limit else False
+                self.snapshots.set(key, snapshot)
+
+        with self.snapshot_lock:
+            self.snapshot_locks.pop(key, None)
+
+        return None if snapshot is False else snapshot
+
+    def _snapshot_ids(self, pipeline: list) -> list:
+        new_pipeline = list(pipeline) + [
+            {"$project": {"_id": 1}},
+            {"$limit": self.snapshot_limit + 1},
+        ]
+        return [doc["_id"] for doc in self.logger.timer(self._aggregate, new_pipeline)]
+
+    @staticmethod
+    def pipeline_limit(pipeline: list) -> int:
+        """Returns the most documents a pipeline can return, by its $limit and $sample
+        stages"""
+        limit = 10**9
+        for stage in pipeline:
+            if "$limit" in stage:
+                limit = min(limit, stage["$limit"])
+            if "$sample" in stage:
+                limit = min(limit, stage["$sample"]["size"])
+        return limit
+
+    # random order
+    # ---------------------------------------------
+    # every doc gets a uniform `rand` key when it is inserted. A random order is a walk
+    # of the `rand` index from a seed kept in the pipeline, wrapping around to the docs
+    # below the seed, so every page of a query sees the same order
+
+    @staticmethod
+    def random_stages(seed: float = None) -> list[dict]:
+        """Returns the stages that order a pipeline randomly
+
+        Args:
+            seed (float, optional): Where the walk starts, in [0, 1). Defaults to a
+                new random seed.
+
+        Returns:
+            list[dict]: The $match and $sort stages
+        """
+        if seed is None:
+            seed = random.random()
+        return [{"$match": {"rand": {"$gte": seed}}}, {"$sort": {"rand": 1}}]
+
+    @staticmethod
+    def is_random_stage(stage: dict) -> bool:
+        """Returns whether a stage is one of the `random_stages`"""
+        match = stage.get("$match")
+        if isinstance(match, dict) and list(match) == ["rand"]:
+            return isinstance(match["rand"], dict) and list(match["rand"]) == ["$gte"]
+        return stage.get("$sort") == {"rand": 1}
+
+    @staticmethod
+    def random_seed(pipeline: list) -> Optional[float]:
+        """Returns the seed of a randomly ordered pipeline, None if it is not random"""
+        for stage in pipeline:
+            if "$match" in stage and Database.is_random_stage(stage):
+                return stage["$match"]["rand"]["$gte"]
+        return None
+
+    @staticmethod
+    def random_wrap(pipeline: list, seed: float) -> list:
+        """Returns the part of a random walk below the seed, without its paging"""
+        return [
+            (
+                {"$match": {"rand": {"$lt": seed}}}
+                if "$match" in stage and Database.is_random_stage(stage)
+                else stage
+            )
+            for stage in Database.strip_paging(pipeline)
+        ]
+
+    @staticmethod
+    def strip_random(pipeline: list) -> list:
+        """Returns a copy of a pipeline without its `random_stages`"""
+        return [stage for stage in pipeline if not Database.is_random_stage(stage)]
+
+    @staticmethod
+    def fetch_pipeline(pipeline: list | dict, _id) -> list:
+        """Returns the pipeline fetching one snapshotted document of a pipeline
+
+        The filtering and ordering stages are replaced by an `_id` match, the stages
+        shaping the documents ($addFields, $project, ...) are kept.
+
+        Args:
+            pipeline (list | dict): The snapshotted pipeline
+            _id (Any): The `_id` of the document
+
+        Returns:
+            list: The pipeline
+        """
+        if isinstance(pipeline, dict):
+            pipeline = [pipeline]
+
+        skipped = ("$match", "$sort", "$limit", "$skip", "$sample")
+        return [{"$match": {"_id": _id}}] + [
+            stage for stage in pipeline if not any(key in stage for key in skipped)
+        ]
+
+    @staticmethod
+    def is_bounded(pipeline: list | dict) -> bool:
+        """Returns whether a pipeline has a $limit or $sample stage"""
+        if isinstance(pipeline, dict):
+            pipeline = [pipeline]
+
+        return any("$limit" in stage or "$sample" in stage for stage in pipeline)
+
+    @staticmethod
+    def strip_paging(pipeline: list | dict) -> list:
+        """Returns a copy of a pipeline without $limit and $skip stages
+
+        Args:
+            pipeline (list | dict): The pipeline
+
+        Returns:
+            list: The pipeline without paging stages
+        """
+        if isinstance(pipeline, dict):
+            pipeline = [pipeline]
+
+        return [
+            stage
+            for stage in pipeline
+            if "$limit" not in stage and "$skip" not in stage
+        ]
+
+    @staticmethod
+    def keyset_sort(pipeline: list) -> Tuple[Optional[int], Optional[dict]]:
+        """Returns the position and the keyset sort of a pipeline
+
+        The sort always ends with `_id` so every document has a unique position.
+
+        Args:
+            pipeline (list): The pipeline, without any $limit or $skip stages
+
+        Returns:
+            Tuple[Optional[int], Optional[dict]]: The index of the $sort stage (None if one
+                has to be appended) and the sort, or (None, None) if the pipeline can't be
+                paged by a range
+        """
+        sort_i = None
+        for i, stage in enumerate(pipeline):
+            if "$sort" in stage:
+                sort_i = i
+
+        if sort_i is None:
+            return None, {"_id": 1}
+
+        # later stages have to keep the documents in the same order
+        if any(
+            not set(stage).issubset({"$project", "$addFields", "$set"})
+            for stage in pipeline[sort_i + 1 :]
+        ):
+            return None, None
+
+        sort = pipeline[sort_i]["$sort"].copy()
+        if any(v not in (1, -1) for v in sort.values()):
+            return None, None
+        sort.pop("_id", None)
+        sort["_id"] = pipeline[sort_i]["$sort"].get("_id", 1)
+
+        return sort_i, sort
+
+    @staticmethod
+    def keyset_match(sort: dict, values: list, reverse: bool = False) -> dict:
+        """Returns a $match stage for every document after a cursor
+
+        Mongo sorts a missing or null field before every value, so walking a field
+        downwards also matches the documents without it, and walking upwards from a
+        cursor without the field matches every document that has it.
+
+        Args:
+            sort (dict): The sort specification
+            values (list): The sort values of the cursor, in the same order as the sort
+            reverse (bool, optional): Match the documents before the cursor instead.
+                Defaults to False.
+
+        Returns:
+            dict: The $match stage
+        """
+        keys = list(sort.items())
+        clauses = []
+        for i, (field, direction) in enumerate(keys):
+            if reverse:
+                direction = -direction
+
+            clause = {keys[j][0]: values[j] for j in range(i)}
+            if values[i] is None:
+                if direction == -1:
+                    # nothing sorts below a missing field
+                    continue
+                clause[field] = {"$ne": None}
+            elif direction == 1:
+                clause[field] = {"$gt": values[i]}
+            else:
+                # {field: None} matches the documents missing the field too
+                clause["$or"] = [{field: {"$lt": values[i]}}, {field: None}]
+            clauses.append(clause)
+
+        if len(clauses) == 1:
+            return {"$match": clauses[0]}
+        return {"$match": {"$or": clauses}}
+
+    @staticmethod
+    def get_path(doc: dict, path: str):
+        """Returns the value at a dotted path of a document
+
+        Args:
+            doc (dict): The document
+            path (str): The path, ex: `players.online`
+
+        Returns:
+            Any: The value, or None if the path does not exist
+        """
+        for part in path.split("."):
+            if not isinstance(doc, dict) or part not in doc:
+                return None
+            doc = doc[part]
+
+        return doc
+
     def find_one(
         self,
         query: dict,
     ) -> Optional[dict]:
         try:
-            return self.col.find_one(query)
+            return self.col.find_one(query, max_time_ms=self._max_time_ms())
         except StopIteration:
             self.logger.print(f"No matches for query: {query}")
             return None
@@ -86,7 +536,7 @@ class Database:
         query: dict,
     ) -> Optional[List[dict]]:
         try:
-            return list(self.col.find(query))
+            return list(self.col.find(query, max_time_ms=self._max_time_ms()))
         except StopIteration:
             self.logger.print(f"No matches for query: {query}")
             return None
@@ -103,55 +553,307 @@ class Database:
             self.logger.print(f"No matches for query: {query}")
             return None
 
+    def queue_upsert(self, query: dict, update: dict, key=None) -> None:
+        """Queues an upsert to be written in the next bulk write
+
+        Args:
+            query (dict): The filter of the upsert
+            update (dict): The update operators
+            key (Hashable, optional): Queued upserts with the same key are merged,
+                defaults to the query
+        """
+        self.writer.put(query, update, key)
+
     def update_many(
         self,
         query: dict,
         update: dict,
     ) -> Optional[UpdateResult]:
         try:
+            # a bulk change can move many documents in or out of a cached count
+            self.invalidate_counts()
             return self.col.update_many(query, update)
         except StopIteration:
             self.logger.print(f"No matches for query: {query}")
             return None
 
+    def bulk_update(self, updates: List[Tuple[dict, dict]]) -> None:
+        """Applies many `update_many`s in one unordered bulk write
+
+        Unlike `update_many`, cached counts are kept, use it for fields no count
+        filters on.
+
+        Args:
+            updates (List[Tuple[dict, dict]]): (query, update) pairs
+        """
+        if not updates:
+            return
+        self.col.bulk_write(
+            [UpdateMany(query, update) for query, update in updates], ordered=False
+        )
+
     def count(
         self,
         pipeline: list,
-    ):
-        """Counts the number of documents in a pipeline"""
+        fresh: bool = False,
+    ) -> int:
+        """Counts the number of documents in a pipeline
+
+        Counts are cached by the fingerprint of the counting pipeline, so paging through
+        one result set (in any order) only aggregates once per `count_ttl` seconds.
+
+        Args:
+            pipeline (list): The pipeline to count
+            fresh (bool, optional): Skip the cache. Defaults to False.
+
+        Returns:
+            int: The number of documents
+        """
+
+        if self.is_bounded(pipeline):
+            snapshot = self.snapshot(pipeline, fresh=fresh)
+            if snapshot is not None:
+                return len(snapshot)
 
+        new_pipeline = self.count_pipeline(pipeline)
+
+        key = self.pipeline_hash(new_pipeline)
+        if not fresh:
+            total = self.counts.get(key)
+            if total is not None:
+                return total
+
+        result = self._aggregate(new_pipeline).try_next()
+        total = 0 if result is None else result["count"]
+        self.counts.set(key, total)
+
+        return total
+
+    @staticmethod
+    def count_pipeline(pipeline: list | dict) -> list:
+        """Returns the pipeline used to count the documents of a pipeline
+
+        Args:
+            pipeline (list | dict): The pipeline to count
+
+        Returns:
+            list: The counting pipeline
+        """
         new_pipeline = pipeline.copy()
 
         if type(new_pipeline) is dict:
             new_pipeline = [new_pipeline]
 
-        match = {}
+        match = {"$match": {}}
         limit = {"$limit": 10**9}
         for stage in new_pipeline:
-            if "$match" in stage:
+            if "$match" in stage and not Database.is_random_stage(stage):
                 match = stage
             if "$limit" in stage:
                 limit = stage
             if "$sample" in stage:
                 limit = {"$limit": stage["$sample"]["size"]}
 
-        new_pipeline = [
+        return [
             match,
             limit,
             {"$group": {"_id": None, "count": {"$sum": 1}}},
             {"$project": {"_id": 0, "count": 1}},
         ]
 
-        result = self.col.aggregate(new_pipeline, allowDiskUse=True).try_next()
-        if result is None:
-            return 0
-        return result["count"]
+    def invalidate_counts(self, pipeline: list = None) -> None:
+        """Drops cached counts
+
+        Args:
+            pipeline (list, optional): Only drop the count of this pipeline. Defaults to None.
+        """
+        if pipeline is None:
+            self.counts.clear()
+        else:
+            self.counts.pop(self.pipeline_hash(self.count_pipeline(pipeline)))
 
     def aggregate(self, pipeline: list, **kwargs):
+        self.indexes.sample(pipeline)
+        max_time_ms = self._max_time_ms()
+        if max_time_ms is not None:
+            kwargs.setdefault("maxTimeMS", max_time_ms)
         return self.col.aggregate(pipeline, **kwargs)
 
+    def _aggregate(self, pipeline: list):
+        return self.aggregate(pipeline, allowDiskUse=True)
+
+    def count_documents(self, query: dict) -> int:
+        max_time_ms = self._max_time_ms()
+        if max_time_ms is not None:
+            return self.col.count_documents(query, maxTimeMS=max_time_ms)
+        return self.col.count_documents(query)
+
+    # backfills
+    # ---------------------------------------------
+    # fields derived by Server.update_db, filled in for the docs written before the
+    # field existed
+
+    def backfill(self) -> None:
+        """Runs every backfill, safe to run again as only missing fields are filled"""
+        self.backfill_ip_ints()
+        self.backfill_search_grams()
+        self.backfill_random()
+        self.backfill_sample_names()
+        self.players.backfill()
+
+    def backfill_field(
+        self,
+        query: dict,
+        compute: callable,
+        projection: dict,
+        batch_size: int = 1000,
+    ) -> int:
+        """Sets fields computed from other fields on every doc matching a query
+
+        Args:
+            query (dict): The docs to fill, ex: `{"field": {"$exists": False}}`
+            compute (callable): Returns the fields to set for a doc
+            projection (dict): The fields `compute` needs
+            batch_size (int, optional): Docs per bulk write. Defaults to 1000.
+
+        Returns:
+            int: The number of docs updated
+        """
+        total = 0
+        batch = []
+        for doc in self.col.find(query, projection).batch_size(batch_size):
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": compute(doc)}))
+            if len(batch) >= batch_size:
+                total += self.col.bulk_write(batch, ordered=False).modified_count
+                batch = []
+                self.logger.debug(f"Backfilled {total} docs")
+        if batch:
+            total += self.col.bulk_write(batch, ordered=False).modified_count
+
+        if total:
+            self.logger.print(f"Backfilled {total} docs for {list(query)}")
+        return total
+
+    def backfill_ip_ints(self) -> int:
+        """Stores the integer form of every IPv4 `ip` as `ipInt`, None for hostnames"""
+
+        def compute(doc: dict) -> dict:
+            try:
+                return {"ipInt": Text.ip_int(doc["ip"])}
+            except (KeyError, ValueError):
+                return {"ipInt": None}
+
+        return self.backfill_field(
+            {"ipInt": {"$exists": False}}, compute, {"_id": 1, "ip": 1}
+        )
+
+    def backfill_search_grams(self) -> int:
+        """Stores the `motdGrams` and `signGrams` of every doc, see `Text.search_grams`"""
+        return self.backfill_field(
+            {"motdGrams": {"$exists": False}},
+            Text.search_grams,
+            {"_id": 1, "description": 1, "world.signs": 1},
+        )
+
+    def backfill_random(self) -> int:
+        """Gives every doc the `rand` key of `random_stages`"""
+        return self.backfill_field(
+            {"rand": {"$exists": False}},
+            lambda doc: {"rand": random.random()},
+            {"_id": 1},
+        )
+
+    def backfill_sample_names(self) -> int:
+        """Stores the `players.sampleNames` of every doc, see `Text.sample_names`"""
+        return self.backfill_field(
+            {"players.sampleNames": {"$exists": False}},
+            lambda doc: {"players.sampleNames": Text.sample_names(doc)},
+            {"_id": 1, "players.sample": 1},
+        )
+
+    # async api
+    # ---------------------------------------------
+    # each method runs its sync counterpart on a bounded thread pool, so a slow query
+    # never blocks the event loop. A timed out or cancelled await only stops waiting,
+    # the query keeps its pool thread until it ends. The timeout is also sent to mongo
+    # as maxTimeMS, which is what bounds how long that is.
+
+    def _max_time_ms(self) -> Optional[int]:
+        return getattr(self._local, "max_time_ms", None)
+
+    def _call_with_limit(self, func: callable, max_time_ms: int, *args, **kwargs):
+        self._local.max_time_ms = max_time_ms
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.max_time_ms = None
+
+    async def _run(self, func: callable, *args, timeout: float = None, **kwargs):
+        """Runs a blocking database call in the executor
+
+        Args:
+            func (callable): The function to run
+            timeout (float, optional): Seconds the call is waited for and may run on
+                the server, defaults to `self.timeout`
+
+        Raises:
+            asyncio.TimeoutError: If the call took longer than the timeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor,
+            functools.partial(
+                self._call_with_limit, func, int(timeout * 1000), *args, **kwargs
+            ),
+        )
+        return await asyncio.wait_for(future, timeout)
+
+    async def async_get_doc_at_index(
+        self, pipeline: list, index: int = 0, timeout: float = None
+    ) -> Optional[dict]:
+        return await self._run(self.get_doc_at_index, pipeline, index, timeout=timeout)
+
+    async def async_find_one(
+        self, query: dict, timeout: float = None
+    ) -> Optional[dict]:
+        return await self._run(self.find_one, query, timeout=timeout)
+
+    async def async_find(
+        self, query: dict, timeout: float = None
+    ) -> Optional[List[dict]]:
+        return await self._run(self.find, query, timeout=timeout)
+
+    async def async_update_one(
+        self, query: dict, update: dict, timeout: float = None, **kwargs
+    ) -> Optional[UpdateResult]:
+        return await self._run(
+            self.update_one, query, update, timeout=timeout, **kwargs
+        )
+
+    async def async_update_many(
+        self, query: dict, update: dict, timeout: float = None
+    ) -> Optional[UpdateResult]:
+        return await self._run(self.update_many, query, update, timeout=timeout)
+
+    async def async_count(
+        self, pipeline: list, fresh: bool = False, timeout: float = None
+    ) -> int:
+        return await self._run(self.count, pipeline, fresh, timeout=timeout)
+
+    async def async_count_documents(self, query: dict, timeout: float = None) -> int:
+        return await self._run(self.count_documents, query, timeout=timeout)
+
+    async def async_aggregate(
+        self, pipeline: list, timeout: float = None, **kwargs
+    ) -> List[dict]:
+        """Runs an aggregation and returns all of its documents"""
+        return await self._run(
+            lambda: list(self.aggregate(pipeline, **kwargs)), timeout=timeout
+        )
+
     def hash_dict(self, d: dict) -> tuple:
-        """Returns a hash of a dict
+        """Returns a hashable version of a dict, keeping the key order
 
         Args:
             d (dict): The dict to hash
@@ -159,19 +861,13 @@ class Database:
         Returns:
             tuple: the hashable object
         """
-        out = tuple()
-        for k, v in d.items():
-            if type(v) is dict:
-                out += (k, self.hash_dict(v))
-            elif type(v) is list:
-                out += (k, self.hash_list(v))
-            else:
-                out += (k, v)
-
-        return out
+        return (
+            "dict",
+            tuple((k, self._hash_value(v)) for k, v in d.items()),
+        )
 
     def hash_list(self, l: list) -> tuple:
-        """Returns a hash of a list
+        """Returns a hashable version of a list
 
         Args:
             l (list): The list to hash
@@ -179,18 +875,16 @@ class Database:
         Returns:
             tuple: the hashable object
         """
-        out = tuple()
-        for v in l:
-            if type(v) is dict:
-                out += (self.hash_dict(v),)
-            elif type(v) is list:
-                out += (self.hash_list(v),)
-            else:
-                out += (v,)
+        return "list", tuple(self._hash_value(v) for v in l)
 
-        return out
+    def _hash_value(self, v):
+        if isinstance(v, dict):
+            return self.hash_dict(v)
+        elif isinstance(v, list):
+            return self.hash_list(v)
+        return v
 
-    def hashable_pipeline(self, pipe: list) -> tuple:
+    def hashable_pipeline(self, pipe: list | dict) -> tuple:
         """Returns a hashable pipeline
 
         Args:
@@ -199,54 +893,49 @@ class Database:
         Returns:
             tuple: the hashable object
         """
-        out = tuple()
-        for stage in pipe:
-            for k, v in stage.items():
-                if type(v) is dict:
-                    out += (k, self.hash_dict(v))
-                elif type(v) is list:
-                    out += (k, self.hash_list(v))
-                else:
-                    out += (k, v)
+        if isinstance(pipe, dict):
+            pipe = [pipe]
+
+        return tuple(self.hash_dict(stage) for stage in pipe)
+
+    @staticmethod
+    def pipeline_hash(pipe: list | dict) -> str:
+        """Returns a stable fingerprint of a pipeline
+
+        The key order is kept, as it matters for stages like $sort, and the hash is the
+        same between runs (unlike `hash()`).
+
+        Args:
+            pipe (list[dict]): The pipeline to hash
+
+        Returns:
+            str: the hex digest of the pipeline
+        """
+        if isinstance(pipe, dict):
+            pipe = [pipe]
 
-        return out
+        return hashlib.sha1(
+            json_util.dumps(pipe).encode("utf-8"), usedforsecurity=False
+        ).hexdigest()
 
     def unhash_dict(self, hashed: tuple) -> dict:
         """Returns a dict from a hashable object"""
 
-        out = {}
-        for k, v in hashed.items():
-            if type(v) is tuple:
-                out[k] = self.unhash_dict(v)
-            elif type(v) is list:
-                out[k] = self.unhash_list(v)
-            else:
-                out[k] = v
-
-        return out
+        return {k: self._unhash_value(v) for k, v in hashed[1]}
 
     def unhash_list(self, hashed: tuple) -> list:
         """Returns a list from a hashable object"""
 
-        out = []
-        for v in hashed:
-            if type(v) is tuple:
-                out.append(self.unhash_dict(v))
-            elif type(v) is list:
-                out.append(self.unhash_list(v))
-            else:
-                out.append(v)
+        return [self._unhash_value(v) for v in hashed[1]]
 
-        return out
+    def _unhash_value(self, v):
+        if isinstance(v, tuple) and len(v) == 2 and v[0] == "dict":
+            return self.unhash_dict(v)
+        elif isinstance(v, tuple) and len(v) == 2 and v[0] == "list":
+            return self.unhash_list(v)
+        return v
 
-    def unhash_pipeline(self, hashed: tuple) -> dict:
+    def unhash_pipeline(self, hashed: tuple) -> list:
         """Returns a pipeline from a hashable object"""
 
-        out = []
-        for stage, v in zip_longest(hashed[::2], hashed[1::2]):
-            if type(v) is tuple:
-                out.append({stage: self.unhash_dict(v)})
-            else:
-                out.append({stage: v})
-
-        return out
+        return [self.unhash_dict(stage) for stage in hashed]
@@ -0,0 +1,283 @@
+import bisect
+import csv
+import json
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+import ipinfo
+
+from .cache import TTLCache
+from .logger import Logger
+from .text import Text
+
+
+class GeoResolver:
+    """Resolves the geo and org of IPs without blocking the caller
+
+    Lookups go through tiers, the first hit wins:
+
+    1. an in-memory LRU cache
+    2. a persistent sqlite cache
+    3. an optional local CSV of IP ranges, searched with bisect
+    4. ipinfo, queried in batches by a background thread
+
+    Misses return None right away, callbacks get the result once the batch is done.
+    """
+
+    def __init__(
+        self,
+        logger: "Logger",
+        ipinfo_token: str = None,
+        cache_path: Optional[str] = "geo.sqlite",
+        ranges_path: Optional[str] = None,
+        ttl: float = 7 * 24 * 60 * 60,
+        batch_size: int = 100,
+        interval: float = 10,
+    ):
+        """Initializes the resolver
+
+        Args:
+            logger (Logger): The logger class
+            ipinfo_token (str, optional): The ipinfo token. Defaults to None.
+            cache_path (str, optional): The sqlite file of the persistent cache, None to
+                only cache in memory. Defaults to "geo.sqlite".
+            ranges_path (str, optional): A CSV of IP ranges with the columns
+                `start,end,lat,lon,country,city,org`, start and end being IPs or ints.
+                Defaults to None.
+            ttl (float, optional): Seconds a result is trusted for. Defaults to 7 days.
+            batch_size (int, optional): Max IPs per ipinfo batch. Defaults to 100.
+            interval (float, optional): Max seconds an IP waits for a batch.
+                Defaults to 10.
+        """
+        self.logger = logger
+        self.handler = ipinfo.getHandler(ipinfo_token)
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.cache = TTLCache(maxsize=65536, ttl=ttl)
+
+        self.db_lock = threading.Lock()
+        self.db: Optional[sqlite3.Connection] = None
+        if cache_path is not None:
+            try:
+                self.db = sqlite3.connect(cache_path, check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS geo "
+                    "(ip TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+                )
+                self.db.commit()
+            except sqlite3.Error as err:
+                self.logger.warning(f"Failed to open the geo cache: {err}")
+                self.db = None
+
+        # sorted, non overlapping ranges: starts[i] <= ip <= ends[i] -> geos[i]
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.geos: list[dict] = []
+        if ranges_path is not None:
+            self.load_ranges(ranges_path)
+
+        # ips waiting for ipinfo
+        self.pending: set[str] = set()
+        self.cond = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.callbacks: list[Callable[[dict[str, dict]], None]] = []
+
+        self.hits = {"memory": 0, "disk": 0, "ranges": 0}
+        self.misses = 0
+        self.fetched = 0
+
+    def load_ranges(self, path: str) -> None:
+        """Loads a CSV of IP ranges, replacing the loaded ranges
+
+        Args:
+            path (str): The CSV file, with the columns `start,end,lat,lon,country,city,org`
+        """
+        rows = []
+        try:
+            with open(path, newline="", encoding="utf8") as f:
+                for row in csv.DictReader(f):
+                    geo = {
+                        "lat": float(row["lat"]),
+                        "lon": float(row["lon"]),
+                        "country": row["country"],
+                        "city": row["city"],
+                    }
+                    if row.get("org"):
+                        geo["org"] = row["org"]
+                    rows.append(
+                        (Text.ip_int(row["start"]), Text.ip_int(row["end"]), geo)
+                    )
+        except (OSError, KeyError, ValueError) as err:
+            self.logger.warning(f"Failed to load IP ranges from {path}: {err}")
+            return
+
+        rows.sort(key=lambda i: i[0])
+        self.starts = [i[0] for i in rows]
+        self.ends = [i[1] for i in rows]
+        self.geos = [i[2] for i in rows]
+        self.logger.print(f"Loaded {len(rows)} IP ranges")
+
+    def lookup(self, ip: str) -> Optional[dict]:
+        """Returns the geo of an IP if it is known, otherwise queues it for ipinfo
+
+        Args:
+            ip (str): The IP
+
+        Returns:
+            Optional[dict]: `{"lat", "lon", "country", "city", "org"?}`, `{}` if ipinfo
+                has nothing for the IP, or None if it is not known yet
+        """
+        geo = self.cache.get(ip)
+        if geo is not None:
+            self.hits["memory"] += 1
+            return geo
+
+        geo = self._disk_get(ip)
+        if geo is None:
+            geo = self._range_get(ip)
+            if geo is None:
+                self.misses += 1
+                self.queue(ip)
+                return None
+            self.hits["ranges"] += 1
+        else:
+            self.hits["disk"] += 1
+
+        self.cache.set(ip, geo)
+        return geo
+
+    def _disk_get(self, ip: str) -> Optional[dict]:
+        if self.db is None:
+            return None
+        with self.db_lock:
+            row = self.db.execute(
+                "SELECT data, updated FROM geo WHERE ip = ?", (ip,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def _range_get(self, ip: str) -> Optional[dict]:
+        if not self.starts:
+            return None
+        try:
+            value = Text.ip_int(ip)
+        except ValueError:
+            return None
+
+        i = bisect.bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.geos[i]
+        return None
+
+    def store(self, results: dict[str, dict]) -> None:
+        """Caches resolved IPs in memory and on disk
+
+        Args:
+            results (dict[str, dict]): ip -> geo
+        """
+        for ip, geo in results.items():
+            self.cache.set(ip, geo)
+
+        if self.db is None:
+            return
+        now = time.time()
+        with self.db_lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO geo (ip, data, updated) VALUES (?, ?, ?)",
+                [(ip, json.dumps(geo), now) for ip, geo in results.items()],
+            )
+            self.db.commit()
+
+    def queue(self, ip: str) -> None:
+        """Queues an IP for the next ipinfo batch"""
+        with self.cond:
+            self.pending.add(ip)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="geo-resolver", daemon=True
+                )
+                self.thread.start()
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    @staticmethod
+    def parse(details: dict) -> dict:
+        """Converts an ipinfo result to the geo format of the database
+
+        Args:
+            details (dict): The ipinfo result
+
+        Returns:
+            dict: The geo, `{}` if ipinfo has no location for the IP
+        """
+        if not isinstance(details, dict) or details.get("bogon"):
+            return {}
+
+        lat, lon = details.get("latitude"), details.get("longitude")
+        if (lat is None or lon is None) and "loc" in details:
+            lat, lon = details["loc"].split(",")
+        if lat is None or lon is None:
+            return {}
+
+        geo = {
+            "lat": float(lat),
+            "lon": float(lon),
+            "country": str(details.get("country")),
+            "city": str(details.get("city")),
+        }
+        if "org" in details:
+            geo["org"] = str(details["org"])
+        return geo
+
+    def fetch(self, ips: list[str]) -> dict[str, dict]:
+        """Resolves IPs with one ipinfo batch request
+
+        Args:
+            ips (list[str]): The IPs
+
+        Returns:
+            dict[str, dict]: ip -> geo, for the IPs ipinfo answered
+        """
+        details = self.handler.getBatchDetails(ips, batch_size=self.batch_size)
+        results = {ip: self.parse(details[ip]) for ip in ips if ip in details}
+        self.fetched += len(results)
+        return results
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: len(self.pending) >= self.batch_size, self.interval
+                )
+                batch = []
+                while self.pending and len(batch) < self.batch_size:
+                    batch.append(self.pending.pop())
+
+            if not batch:
+                continue
+
+            try:
+                results = self.fetch(batch)
+                self.store(results)
+                for callback in self.callbacks:
+                    callback(results)
+            except Exception as err:
+                self.logger.warning(f"Failed to get geo for {len(batch)} IPs")
+                self.logger.print(err)
+                self.logger.print(f"{traceback.format_exc()}")
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of every tier"""
+        return {
+            "hits": self.hits.copy(),
+            "misses": self.misses,
+            "fetched": self.fetched,
+            "pending": len(self.pending),
+            "ranges": len(self.starts),
+        }
@@ -1,7 +1,14 @@
+import asyncio
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
 import country_converter as coco
 import plotly.express as px
 import plotly.io as pio
 
+from .cache import TTLCache
+
 layout = {"plot_bgcolor": "black", "paper_bgcolor": "black", "font": {"color": "white"}}
 geo_layout = {
     "showcountries": True,
@@ -142,19 +149,17 @@ def draw_scatter(data, title):
     return fig
 
 
-def save_graphs_html(*graphs, filename):
+def graphs_html(*fragments):
     """
-    Saves the given graphs to the given filename.
+    Joins rendered graphs into one html page.
 
-    :param graphs: The graphs to save.
-    :param filename: The filename to save the graphs to.
+    :param fragments: The html of the graphs, from `render`.
 
-    :return: None
+    :return: The html page.
     """
-    with open(filename, "w") as f:
-        f.write("<html>")
-        f.write(
-            """
+    return (
+        "<html>"
+        + """
 <head>
     <style>
     div {
@@ -163,13 +168,140 @@ def save_graphs_html(*graphs, filename):
     </style>
     <title>Very Awsome Graphs</title>
 </head>"""
-        )
-        f.write('<body style="background-color: black;">')
-        for graph in graphs:
-            graph.update_layout(layout)
-            f.write(pio.to_html(graph, include_plotlyjs="cdn", full_html=False))
-        f.write("</body></html>")
+        + '<body style="background-color: black;">'
+        + "".join(fragments)
+        + "</body></html>"
+    )
+
+
+def save_graphs_html(*graphs, filename):
+    """
+    Saves the given graphs to the given filename.
+
+    :param graphs: The graphs to save.
+    :param filename: The filename to save the graphs to.
+
+    :return: None
+    """
+    fragments = []
+    for graph in graphs:
+        graph.update_layout(layout)
+        fragments.append(pio.to_html(graph, include_plotlyjs="cdn", full_html=False))
+
+    with open(filename, "w") as f:
+        f.write(graphs_html(*fragments))
 
 
 def iso2_to_3(*before):
     return coco.convert(names=before, to="ISO3")
+
+
+# the figure builders `render` can run in a worker process
+DRAWERS = {
+    "pie": draw_pie,
+    "bar": draw_bar,
+    "map": draw_map,
+    "choropleth": draw_choropleth,
+    "geoheatmap": draw_geoheatmap,
+    "scatter": draw_scatter,
+}
+
+
+def render(kind, data, title, layout_updates=None, legend=True):
+    """
+    Builds a figure and renders it, runs in the worker processes of `GraphRenderer`.
+
+    :param kind: The figure, a key of `DRAWERS`.
+    :param data: The data of the figure.
+    :param title: The title of the figure.
+    :param layout_updates: Extra layout of the figure.
+    :param legend: Whether the png shows the legend, the html always does.
+
+    :return: The png bytes and the html of the figure.
+    """
+    fig = DRAWERS[kind](data, title)
+    if layout_updates:
+        fig.update_layout(**layout_updates)
+    html = pio.to_html(fig, include_plotlyjs="cdn", full_html=False)
+
+    fig.update_layout(showlegend=legend)
+    png = fig.to_image(format="png")
+    return png, html
+
+
+def _warm_worker():
+    """
+    Starts kaleido in a new worker, so the first real render doesn't pay for it.
+    """
+    try:
+        px.bar({"x": [0], "y": [0]}, x="x", y="y").to_image(format="png")
+    except Exception:
+        # the render will raise the error
+        pass
+
+
+class GraphRenderer:
+    """
+    Renders figures in a process pool, off the event loop.
+
+    Results are cached by a hash of their input, so a repeat of the same data is
+    served from memory, and identical renders in flight are only done once.
+    """
+
+    def __init__(self, workers=2, ttl=30 * 60):
+        """
+        :param workers: The number of render processes.
+        :param ttl: Seconds a rendered figure is kept.
+        """
+        self.workers = workers
+        self.pool = None
+        self.cache = TTLCache(maxsize=64, ttl=ttl)
+        # cache key -> the future of the render in flight
+        self.flights = {}
+
+        self.hits = 0
+        self.renders = 0
+
+    @staticmethod
+    def key(*args):
+        """
+        Returns the cache key of a render.
+
+        :param args: The arguments of `render`.
+
+        :return: The sha256 of the arguments.
+        """
+        dumped = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha256(dumped.encode()).hexdigest()
+
+    async def render(self, kind, data, title, layout_updates=None, legend=True):
+        """
+        Renders a figure, see `render`.
+
+        :return: The png bytes and the html of the figure.
+        """
+        key = self.key(kind, data, title, layout_updates, legend)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        if key not in self.flights:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_warm_worker
+                )
+            self.renders += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self.pool, render, kind, data, title, layout_updates, legend
+            )
+            self.flights[key] = future
+
+            def done(fut):
+                self.flights.pop(key, None)
+                if not fut.cancelled() and fut.exception() is None:
+                    self.cache.set(key, fut.result())
+
+            future.add_done_callback(done)
+
+        return await asyncio.shield(self.flights[key])
@@ -0,0 +1,246 @@
+import asyncio
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .logger import Logger
+
+# statuses worth another try, the request itself was fine
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HTTPClient:
+    """The HTTP client shared by every pyutils class
+
+    Each event loop gets one `aiohttp.ClientSession`, so connections to twitch, mojang
+    and discord are kept alive and reused, and DNS lookups are cached. Requests to a
+    host are limited to `per_host` at once, idempotent requests are retried with
+    exponential backoff, and the latency and errors of every host are counted.
+    """
+
+    def __init__(
+        self,
+        logger: "Logger",
+        limit: int = 100,
+        per_host: int = 10,
+        host_limits: dict[str, int] = None,
+        retries: int = 2,
+        backoff: float = 0.5,
+        timeout: float = 30,
+        dns_ttl: int = 300,
+    ):
+        """Initializes the client
+
+        Args:
+            logger (Logger): The logger class
+            limit (int, optional): Max open connections. Defaults to 100.
+            per_host (int, optional): Max requests to a host at once. Defaults to 10.
+            host_limits (dict[str, int], optional): host -> max requests at once, for
+                the hosts that need another limit. Defaults to None.
+            retries (int, optional): Retries of idempotent requests. Defaults to 2.
+            backoff (float, optional): Seconds before the first retry, doubled for each
+                retry. Defaults to 0.5.
+            timeout (float, optional): Total seconds of a request. Defaults to 30.
+            dns_ttl (int, optional): Seconds DNS results are cached. Defaults to 300.
+        """
+        self.logger = logger
+        self.limit = limit
+        self.per_host = per_host
+        self.host_limits = host_limits or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.dns_ttl = dns_ttl
+
+        # loop -> its session, and loop -> {host: semaphore}
+        self.sessions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+        # host -> counters
+        self.metrics: dict[str, dict] = {}
+
+        self._sync: Optional[requests.Session] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the session of the running loop"""
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=30,
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self.sessions[loop] = session
+        return session
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphores = self.semaphores.setdefault(loop, {})
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(
+                self.host_limits.get(host, self.per_host)
+            )
+        return semaphores[host]
+
+    def _metric(self, host: str) -> dict:
+        if host not in self.metrics:
+            self.metrics[host] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "statuses": {},
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+            }
+        return self.metrics[host]
+
+    def _record(self, host: str, seconds: float, status: Optional[int]) -> None:
+        metric = self._metric(host)
+        metric["requests"] += 1
+        metric["total_seconds"] += seconds
+        metric["max_seconds"] = max(metric["max_seconds"], seconds)
+        if status is None or status >= 500:
+            metric["errors"] += 1
+        if status is not None:
+            metric["statuses"][status] = metric["statuses"].get(status, 0) + 1
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        try:
+            return min(float(retry_after), 60)
+        except (TypeError, ValueError):
+            # full jitter, so retries of many requests don't line up
+            return random.uniform(0, self.backoff * 2**attempt)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, retries: int = None, **kwargs):
+        """Sends a request, use it like `aiohttp.ClientSession.request`
+
+        ex: `async with http.request("GET", url) as resp:`
+
+        Args:
+            method (str): The HTTP method
+            url (str): The url
+            retries (int, optional): Retries on errors and `RETRY_STATUSES`. Defaults
+                to `retries` for GET and HEAD, 0 otherwise.
+            **kwargs: Passed to `aiohttp.ClientSession.request`
+
+        Yields:
+            aiohttp.ClientResponse: The response
+        """
+        method = method.upper()
+        if retries is None:
+            retries = self.retries if method in ("GET", "HEAD") else 0
+        host = urlsplit(url).hostname or ""
+
+        # the slot is held until the headers arrive, not while the caller reads the
+        # body, so a caller can send another request to the host from its block
+        async with self._semaphore(host):
+            attempt = 0
+            while True:
+                start = time.perf_counter()
+                try:
+                    resp = await self.session().request(method, url, **kwargs)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    self._record(host, time.perf_counter() - start, None)
+                    if attempt >= retries:
+                        raise
+                    self.logger.debug(f"Retrying {method} {host}: {err!r}")
+                else:
+                    self._record(host, time.perf_counter() - start, resp.status)
+                    if resp.status not in RETRY_STATUSES or attempt >= retries:
+                        break
+                    retry_after = resp.headers.get("Retry-After")
+                    resp.release()
+                    self.logger.debug(f"Retrying {method} {host}: {resp.status}")
+                    await asyncio.sleep(self._delay(attempt, retry_after))
+                    attempt += 1
+                    self._metric(host)["retries"] += 1
+                    continue
+
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                self._metric(host)["retries"] += 1
+
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    async def close(self) -> None:
+        """Closes the session of the running loop"""
+        session = self.sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def run(self, coro):
+        """Runs a coroutine in a new loop, like `asyncio.run`, closing the loop's
+        session after it"""
+
+        async def main():
+            try:
+                return await coro
+            finally:
+                await self.close()
+
+        return asyncio.run(main())
+
+    @property
+    def sync(self) -> requests.Session:
+        """A pooled `requests.Session`, for the blocking code paths"""
+        if self._sync is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=self.limit,
+                pool_maxsize=self.per_host,
+                max_retries=Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=("GET", "HEAD"),
+                    respect_retry_after_header=True,
+                ),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.hooks["response"].append(self._record_sync)
+            self._sync = session
+        return self._sync
+
+    def _record_sync(self, resp: requests.Response, *_, **__) -> None:
+        self._record(
+            urlsplit(resp.url).hostname or "",
+            resp.elapsed.total_seconds(),
+            resp.status_code,
+        )
+
+    def stats(self) -> dict:
+        """Returns the counters of every host, with the average latency"""
+        return {
+            host: {
+                **metric,
+                "statuses": metric["statuses"].copy(),
+                "avg_seconds": (
+                    metric["total_seconds"] / metric["requests"]
+                    if metric["requests"]
+                    else 0
+                ),
+            }
+            for host, metric in self.metrics.items()
+        }
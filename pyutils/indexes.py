@@ -0,0 +1,251 @@
+"""Declares the indexes the bot's queries need, and reports queries that scan the
+collection.
+
+Run `python -m pyutils.indexes` from the repo root to create the indexes with the
+settings of `privVars.py`, add `--explain` to also explain the common pipelines.
+"""
+
+import random
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pymongo
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .cache import TTLCache
+from .logger import Logger
+
+ASC, DESC = pymongo.ASCENDING, pymongo.DESCENDING
+
+# query shapes of /find, /player, the sort button and the rescanner
+INDEXES = [
+    # upserts and lookups of a single server
+    IndexModel([("ip", ASC), ("port", ASC)], name="ip_port"),
+    # subnet ranges
+    IndexModel([("ipInt", ASC)], name="ipInt", sparse=True),
+    # /player and the player filter of /find
+    IndexModel([("players.sample.id", ASC)], name="sample_id"),
+    # /streamers, the lowercase sample names, see Text.sample_names
+    IndexModel([("players.sampleNames", ASC)], name="sample_names"),
+    # the base match of /find, and the players sort
+    IndexModel([("players.max", ASC), ("players.online", DESC)], name="players"),
+    IndexModel([("players.online", DESC)], name="online"),
+    # the last scan sort, and the other filters sorted by it
+    IndexModel([("lastSeen", DESC)], name="lastSeen"),
+    IndexModel([("geo.country", ASC), ("lastSeen", DESC)], name="country"),
+    IndexModel([("version.protocol", ASC), ("lastSeen", DESC)], name="protocol"),
+    IndexModel([("version.name", ASC)], name="version_name"),
+    IndexModel([("version.id", DESC)], name="version_id"),
+    IndexModel([("cracked", ASC), ("lastSeen", DESC)], name="cracked"),
+    IndexModel([("hasFavicon", ASC), ("lastSeen", DESC)], name="hasFavicon"),
+    IndexModel([("whitelist", ASC), ("lastSeen", DESC)], name="whitelist"),
+    # random sorts, a walk of rand, alone or after a common filter
+    IndexModel([("rand", ASC)], name="rand"),
+    IndexModel([("geo.country", ASC), ("rand", ASC)], name="country_rand"),
+    IndexModel([("version.protocol", ASC), ("rand", ASC)], name="protocol_rand"),
+    IndexModel([("cracked", ASC), ("rand", ASC)], name="cracked_rand"),
+    # trigrams of the description and sign searches, see Text.search_grams
+    IndexModel([("motdGrams", ASC)], name="motdGrams"),
+    IndexModel([("signGrams", ASC)], name="signGrams"),
+]
+
+
+class IndexAdvisor:
+    """Creates the declared indexes and samples `explain` of live pipelines"""
+
+    def __init__(
+        self,
+        col: pymongo.collection.Collection,
+        logger: "Logger",
+        indexes: list[IndexModel] = None,
+        sample_rate: float = 0.01,
+    ):
+        """Initializes the advisor
+
+        Args:
+            col (pymongo.collection.Collection): The collection to index
+            logger (Logger): The logger class
+            indexes (list[IndexModel], optional): The indexes to create.
+                Defaults to INDEXES.
+            sample_rate (float, optional): The share of pipelines explained, 0 to
+                disable. Defaults to 0.01.
+        """
+        self.col = col
+        self.logger = logger
+        self.indexes = INDEXES if indexes is None else indexes
+        self.sample_rate = sample_rate
+
+        # pipeline shape -> True, each shape is explained at most once an hour
+        self.explained = TTLCache(maxsize=1024, ttl=60 * 60)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock = threading.Lock()
+
+        self.collscans = 0
+
+    @staticmethod
+    def key_of(keys) -> tuple:
+        """Returns the comparable key spec of an index"""
+        return tuple(
+            (field, direction if isinstance(direction, str) else int(direction))
+            for field, direction in keys
+        )
+
+    def ensure(self) -> list[str]:
+        """Creates the declared indexes that do not exist, safe to run any time
+
+        Returns:
+            list[str]: The names of the created indexes
+        """
+        try:
+            existing = {
+                self.key_of(info["key"])
+                for info in self.col.index_information().values()
+            }
+        except PyMongoError as err:
+            self.logger.error(f"Failed to list indexes: {err}")
+            return []
+
+        created = []
+        for index in self.indexes:
+            if self.key_of(index.document["key"].items()) in existing:
+                continue
+            try:
+                created.extend(self.col.create_indexes([index]))
+            except OperationFailure as err:
+                # ex: an index with the same name but other keys
+                self.logger.error(f"Failed to create index {index.document['name']}")
+                self.logger.error(err)
+
+        if created:
+            self.logger.print(f"Created indexes: {', '.join(created)}")
+        return created
+
+    @staticmethod
+    def shape(value):
+        """Returns a pipeline with every value replaced, so queries that only differ
+        by their values have the same shape"""
+        if isinstance(value, dict):
+            return tuple((k, IndexAdvisor.shape(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return tuple(IndexAdvisor.shape(v) for v in value)
+        return type(value).__name__
+
+    @staticmethod
+    def find_stages(plan, name: str) -> list[dict]:
+        """Returns every plan stage called `name` in an explain output"""
+        found = []
+        if isinstance(plan, dict):
+            if plan.get("stage") == name:
+                found.append(plan)
+            for value in plan.values():
+                found.extend(IndexAdvisor.find_stages(value, name))
+        elif isinstance(plan, list):
+            for value in plan:
+                found.extend(IndexAdvisor.find_stages(value, name))
+        return found
+
+    @staticmethod
+    def winning_plan(explain: dict) -> Optional[dict]:
+        """Returns the first winning plan of an explain output"""
+        if isinstance(explain, dict):
+            if "winningPlan" in explain:
+                return explain["winningPlan"]
+            values = explain.values()
+        elif isinstance(explain, list):
+            values = explain
+        else:
+            return None
+
+        for value in values:
+            plan = IndexAdvisor.winning_plan(value)
+            if plan is not None:
+                return plan
+        return None
+
+    def explain(self, pipeline: list) -> Optional[dict]:
+        """Explains a pipeline and logs it if it scans the collection
+
+        Args:
+            pipeline (list): The pipeline
+
+        Returns:
+            Optional[dict]: The winning plan
+        """
+        try:
+            explain = self.col.database.command(
+                "aggregate", self.col.name, pipeline=pipeline, explain=True
+            )
+        except PyMongoError as err:
+            self.logger.debug(f"Failed to explain pipeline: {err}")
+            return None
+
+        plan = self.winning_plan(explain)
+        if self.find_stages(plan, "COLLSCAN"):
+            self.collscans += 1
+            self.logger.warning(
+                f"Collection scan for pipeline {pipeline}, winning plan: {plan}"
+            )
+        else:
+            self.logger.debug(f"Winning plan for pipeline {pipeline}: {plan}")
+        return plan
+
+    def sample(self, pipeline: list) -> None:
+        """Explains a share of pipelines in the background, once per shape an hour
+
+        Args:
+            pipeline (list): A pipeline that is about to run
+        """
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+
+        key = self.shape(pipeline)
+        if key in self.explained:
+            return
+        self.explained.set(key, True)
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="explain"
+                )
+        self.executor.submit(self.explain, pipeline)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    sys.path.append(".")
+    DISCORD_WEBHOOK, MONGO_URL, db_name, col_name = ("...",) * 4
+    DEBUG = False
+    try:
+        from privVars import *  # skipcq: PYL-W0614
+    except ImportError:
+        sys.exit("Please add your mongo url to 'privVars.py'")
+
+    client = MongoClient(MONGO_URL)
+    db = client["MCSS" if db_name == "..." else db_name]
+    collection = db["scannedServers" if col_name == "..." else col_name]
+
+    log = Logger(debug=DEBUG, discord_webhook=DISCORD_WEBHOOK)
+    advisor = IndexAdvisor(collection, log)
+    try:
+        log.print(f"Created {len(advisor.ensure())} indexes")
+
+        if "--explain" in sys.argv:
+            base = {"players.max": {"$gt": 0}, "players.online": {"$gte": 0}}
+            for pipe in (
+                [{"$match": base}, {"$sort": {"lastSeen": -1}}, {"$limit": 1}],
+                [{"$match": {**base, "geo.country": "US"}}, {"$limit": 1}],
+                [{"$match": {**base, "version.protocol": 47}}, {"$limit": 1}],
+                [{"$match": {"players.sample.id": ""}}, {"$limit": 1}],
+                [{"$match": {"whitelist": {"$exists": False}}}, {"$limit": 1}],
+            ):
+                advisor.explain(pipe)
+            log.print(f"{advisor.collscans} pipelines scan the collection")
+    except Exception:
+        log.error(traceback.format_exc())
+        sys.exit(1)
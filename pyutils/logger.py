@@ -1,9 +1,18 @@
 import asyncio
-import inspect
+import atexit
+import gzip
+import io
 import logging
+import os
+import queue
 import re
+import shutil
 import sys
+import threading
 import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler
+from typing import Optional
 
 import aiohttp
 import sentry_sdk
@@ -43,32 +52,406 @@ class StreamToLogger:
         return text1 + "\n" + text2
 
 
+# messages that are never logged, checked on every record so the patterns are
+# compiled once
+FILTERED_TEXT = (
+    "To sign in, use a web browser to open the page",
+    "email_modal",
+    "Sending data to websocket: {",
+    "event.ctx.responses",
+)
+FILTERED_RE = re.compile(
+    r"(POST|PATCH)::https://discord.com/api/v\d{1,2}/\S+\s[1-5][0-9]{2}" r"|\s*\^\s*$"
+)
+HEARTBEAT_RE = re.compile("heartbeat", re.IGNORECASE)
+
+
 def filter_msg(msg: str) -> str | None:
-    if any(
-        (
-            "To sign in, use a web browser to open the page" in msg,
-            "email_modal" in msg,
-            "heartbeat" in msg.lower(),
-            "Sending data to websocket: {" in msg,
-            "event.ctx.responses" in msg,
-            re.match(
-                r"(POST|PATCH)::https://discord.com/api/v\d{1,2}/\S+\s[1-5][0-9]{2}",
-                msg,
-            )
-            is not None,
-            msg.startswith("[http_client."),
-            re.match(r"^\s*\^\s*$", msg) is not None,
-        )
+    if (
+        any(text in msg for text in FILTERED_TEXT)
+        or HEARTBEAT_RE.search(msg) is not None
+        or FILTERED_RE.match(msg) is not None
+        or msg.startswith("[http_client.")
     ):
         return
     return msg
 
 
-class EmailFileHandler(logging.FileHandler):
-    def emit(self, record):
-        if filter_msg(record.getMessage()) is None:
+class Lazy:
+    """A log argument formatted only if the message is emitted
+
+    ex: `logger.debug(Lazy(json.dumps, doc))`
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: callable, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+def tail(path: str, max_bytes: int) -> str:
+    """Returns the end of a file, without reading the rest of it
+
+    Args:
+        path (str): The file
+        max_bytes (int): Max bytes read from the end
+
+    Returns:
+        str: The last full lines that fit in `max_bytes`
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - max_bytes, 0))
+        data = f.read()
+    if size > max_bytes:
+        # drop the partial first line
+        data = data.partition(b"\n")[2]
+    return data.decode("utf-8", errors="replace")
+
+
+class LogPipeline:
+    """Writes log records and console lines from a single thread
+
+    Producers only put records on a queue, so logging never blocks on the disk. The
+    listener drains the queue in batches, writing each batch to the log file and the
+    console with one write. The log file is rotated to gzip archives once it grows
+    past `max_bytes`.
+    """
+
+    # path -> pipeline, every Logger writing a file shares its pipeline
+    _pipelines: dict[str, "LogPipeline"] = {}
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str = "log.log",
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 5,
+        batch_size: int = 512,
+        console=None,
+    ):
+        """Initializes the pipeline and starts its listener
+
+        Args:
+            path (str, optional): The log file. Defaults to "log.log".
+            max_bytes (int, optional): Size the log file is rotated at, 0 to never
+                rotate. Defaults to 10 MB.
+            backups (int, optional): Compressed archives kept. Defaults to 5.
+            batch_size (int, optional): Max records per write. Defaults to 512.
+            console (TextIO, optional): The console stream. Defaults to the stdout
+                the process started with.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.console = console if console is not None else norm
+        self.formatter = logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s: %(message)s", "%d-%b %H:%M:%S"
+        )
+
+        # LogRecords for the file, str for the console, Events for flush()
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.file = open(path, "a", encoding="utf-8")
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def get(cls, path: str = "log.log") -> "LogPipeline":
+        """Returns the pipeline of a log file, starting it on the first call"""
+        with cls._lock:
+            if path not in cls._pipelines:
+                cls._pipelines[path] = cls(path)
+            return cls._pipelines[path]
+
+    def handler(self) -> QueueHandler:
+        """Returns a logging handler that queues records for the pipeline"""
+        return QueueHandler(self.queue)
+
+    def write_console(self, text: str) -> None:
+        """Queues text for the console, written as is"""
+        self.queue.put(text)
+
+    def flush(self, timeout: float = 5) -> bool:
+        """Waits until everything queued so far is written
+
+        Returns:
+            bool: False if the listener didn't catch up in time
+        """
+        if not self.thread.is_alive():
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Writes everything still queued and stops the listener"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: list) -> bool:
+        lines, console, events, stop = [], [], [], False
+        for item in batch:
+            if item is None:
+                stop = True
+            elif isinstance(item, threading.Event):
+                events.append(item)
+            elif isinstance(item, str):
+                console.append(item)
+            else:
+                message = item.getMessage()
+                if filter_msg(message) is None:
+                    self.dropped += 1
+                    continue
+                lines.append(self.formatter.format(item) + "\n")
+
+        try:
+            if lines:
+                self.file.write("".join(lines))
+                self.file.flush()
+                self.written += len(lines)
+                if self.max_bytes and self.file.tell() >= self.max_bytes:
+                    self._rotate()
+            if console:
+                self.console.write("".join(console))
+                self.console.flush()
+        except (OSError, ValueError) as err:
+            # the logger can't log its own failures
+            sys.__stderr__.write(f"Failed to write logs: {err}\n")
+        finally:
+            for event in events:
+                event.set()
+        return stop
+
+    def _rotate(self) -> None:
+        """Moves the log file to `<path>.1.gz`, shifting the older archives"""
+        self.file.close()
+        try:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}.gz"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}.gz")
+            if self.backups > 0:
+                with open(self.path, "rb") as src, gzip.open(
+                    f"{self.path}.1.gz", "wb"
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+            self.rotations += 1
+        finally:
+            self.file = open(self.path, "w", encoding="utf-8")
+
+    def stats(self) -> dict:
+        """Returns the counters of the pipeline"""
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+        }
+
+
+class WebhookSink:
+    """Sends messages to a discord webhook from one background thread
+
+    Messages are buffered for `interval` seconds. Repeats are sent once with their
+    count, and the rest are packed into as few webhook messages as fit in discord's
+    length limit. The rate limit headers of every response are honoured, so an
+    error storm becomes a few messages instead of hundreds of requests.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        logger: "Logger",
+        interval: float = 2,
+        max_length: int = 2000,
+        max_pending: int = 1000,
+    ):
+        """Initializes the sink, the thread starts with the first message
+
+        Args:
+            url (str): The webhook url
+            logger (Logger): The logger, its `http` client is used once set
+            interval (float, optional): Seconds messages are buffered for.
+                Defaults to 2.
+            max_length (int, optional): Max characters of a webhook message.
+                Defaults to 2000.
+            max_pending (int, optional): Max distinct messages buffered, newer ones
+                are dropped. Defaults to 1000.
+        """
+        self.url = url
+        self.logger = logger
+        self.interval = interval
+        self.max_length = max_length
+        self.max_pending = max_pending
+
+        # message -> times it was put since the last flush
+        self.pending: OrderedDict[str, int] = OrderedDict()
+        self.cond = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+        # used when the logger has no http client, only by the sink's loop
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        # monotonic time the rate limit resets at
+        self.blocked_until = 0.0
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def put(self, message: str) -> None:
+        """Queues a message for the next flush"""
+        message = filter_msg(message)
+        if message is None:
+            return
+
+        with self.cond:
+            if message in self.pending:
+                self.pending[message] += 1
+                self.coalesced += 1
+                return
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending[message] = 1
+
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(
+                    target=self._run, name="webhook-sink", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.close)
+
+    def chunks(self, pending: dict[str, int]) -> list[str]:
+        """Packs buffered messages into webhook messages
+
+        Args:
+            pending (dict[str, int]): message -> count
+
+        Returns:
+            list[str]: The contents, each at most `max_length` characters
+        """
+        out, current = [], ""
+        for message, count in pending.items():
+            line = message if count == 1 else f"{message} (x{count})"
+            if len(line) > self.max_length:
+                line = line[: self.max_length - 3] + "..."
+
+            if current and len(current) + 1 + len(line) > self.max_length:
+                out.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            out.append(current)
+        return out
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            with self.cond:
+                self.cond.wait(self.interval)
+                pending, self.pending = self.pending, OrderedDict()
+                closed = self.closed
+
+            for content in self.chunks(pending):
+                try:
+                    loop.run_until_complete(self._send(content))
+                except Exception as err:
+                    self.failed += 1
+                    # not self.logger.error, a failing webhook would feed itself
+                    self.logger.war(f"Failed to send message to webhook: {err!r}")
+
+            if closed:
+                if self.session is not None:
+                    loop.run_until_complete(self.session.close())
+                loop.close()
+                return
+
+    async def _send(self, content: str, attempts: int = 3) -> None:
+        for _ in range(attempts):
+            wait = self.blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            async with self._post(content) as resp:
+                status = resp.status
+                headers = resp.headers
+                retry_after = None
+                if status == 429:
+                    try:
+                        retry_after = float((await resp.json())["retry_after"])
+                    except Exception:
+                        retry_after = headers.get("Retry-After")
+
+            if headers.get("X-RateLimit-Remaining") == "0":
+                self.blocked_until = time.monotonic() + float(
+                    headers.get("X-RateLimit-Reset-After", 1)
+                )
+            if status == 429:
+                self.blocked_until = time.monotonic() + float(retry_after or 1)
+                continue
+            if status >= 300:
+                raise RuntimeError(f"webhook returned {status}")
+
+            self.sent += 1
             return
-        super().emit(record)
+        raise RuntimeError("webhook rate limited")
+
+    def _post(self, content: str):
+        if self.logger.http is not None:
+            return self.logger.http.post(self.url, json={"content": content})
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session.post(self.url, json={"content": content})
+
+    def close(self, timeout: float = 10) -> None:
+        """Sends what is buffered and stops the thread"""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Returns the counters of the sink"""
+        return {
+            "pending": len(self.pending),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
 
 
 class Logger:
@@ -87,15 +470,18 @@ class Logger:
         """
         self.DEBUG = debug
         self.logging = logging
+        self.root = logging.getLogger()
         self.webhook = discord_webhook
+        # the shared HTTPClient, set by Utils once it exists
+        self.http = None
+        # critical and exception messages are sent to the webhook in batches
+        self.sink = WebhookSink(discord_webhook, self) if discord_webhook else None
 
+        # records are written to log.log by the pipeline's thread
+        self.pipeline = LogPipeline.get("log.log")
         logging.basicConfig(
             level=level if not self.DEBUG else logging.DEBUG,
-            format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-            datefmt="%d-%b %H:%M:%S",
-            handlers=[
-                EmailFileHandler("log.log", mode="a", encoding="utf-8", delay=False),
-            ],
+            handlers=[self.pipeline.handler()],
         )
 
         self.stdout = logging.getLogger("STDOUT")
@@ -120,109 +506,142 @@ class Logger:
         else:
             self.sentry_sdk = None
 
+    # filename -> module name, of the callers seen so far
+    _modules: dict[str, str] = {}
+
     @staticmethod
-    def stack_trace(stack):
-        """Returns a stack trace"""
-        return (
-            stack[1].filename.replace("\\", "/").split("/")[-1].split(".")[0]
-            + "."
-            + f"{stack[1].function}"
-        )
+    def caller(depth: int = 2) -> str:
+        """Returns `module.function` of a caller, without building the stack
+
+        Args:
+            depth (int, optional): Frames above this call, 2 is the caller of the
+                method calling this. Defaults to 2.
+        """
+        code = sys._getframe(depth).f_code
+        module = Logger._modules.get(code.co_filename)
+        if module is None:
+            module = code.co_filename.replace("\\", "/").split("/")[-1].split(".")[0]
+            Logger._modules[code.co_filename] = module
+        return f"{module}.{code.co_name}"
+
+    def enabled(self, level: int) -> bool:
+        """Whether a level is logged, checked before a message is formatted"""
+        return self.root.isEnabledFor(level)
+
+    @staticmethod
+    def join(args) -> str:
+        return " ".join([str(arg) for arg in args])
 
     def info(self, message):
         """Same level as print but no console output"""
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
-        self.logging.info(message)
+        if not self.enabled(logging.INFO):
+            return
+        self.logging.info(f"[{self.caller()}] {message}")
 
     def log(self, *args, **kwargs):
         """Overload for log"""
         self.logging.log(*args, **kwargs)
 
     def error(self, *message, **_):
-        message = " ".join([str(arg) for arg in message])
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
+        message = f"[{self.caller()}] {self.join(message)}"
         self.logging.error(message)
         self.print(message, log=False)
 
     def critical(self, *message):
-        message = " ".join([str(arg) for arg in message])
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
+        message = f"[{self.caller()}] {self.join(message)}"
         self.logging.critical(message)
         self.hook(message)
         self.print(message, log=False)
 
     def debug(self, *args, **kwargs):
-        msg = " ".join([str(arg) for arg in args])
-        msg = f"[{self.stack_trace(inspect.stack())}] {msg}"
-        self.logging.debug(msg)
+        if not self.DEBUG and not self.enabled(logging.DEBUG):
+            # the common case, nothing is formatted
+            return
+        msg = self.join(args)
+        self.logging.debug(f"[{self.caller()}] {msg}")
         if self.DEBUG:
-            self.print(*args, **kwargs, log=False)
+            self.print(msg, **kwargs, log=False)
 
     def warning(self, message):
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
+        message = f"[{self.caller()}] {message}"
         self.print(message, log=False)
         self.logging.warning(message)
 
     def war(self, message):
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
-        self.logging.warning(message)
+        if not self.enabled(logging.WARNING):
+            return
+        self.logging.warning(f"[{self.caller()}] {message}")
 
     def exception(self, message):
-        message = f"[{self.stack_trace(inspect.stack())}] {message}"
+        message = f"[{self.caller()}] {message}"
         self.logging.exception(message)
         self.hook(message)
         self.print(message, log=False)
 
-    def read(self):
+    def read(self, max_bytes: int = 1024 * 1024):
+        """Returns the end of log.log and out.log
+
+        Args:
+            max_bytes (int, optional): Max bytes read from each file. Defaults to 1 MB.
+        """
+        self.pipeline.flush(timeout=1)
         text1, text2 = "", ""
-        with open("log.log", "r") as f:
-            text1 = f.read()
+        try:
+            text1 = tail("log.log", max_bytes)
+        except FileNotFoundError:
+            pass
 
         try:
-            with open("out.log", "r") as f:
-                text2 = f.read()[3:]
-                text2 = "".join(
-                    ch
-                    for ch in text2
-                    if unicodedata.category(ch)[0] != "C" or ch in "\t" or ch in "\n"
-                )
-                text2 = text2.replace("\n\n", "\n")
+            # the control chars, and the BOM, are dropped
+            text2 = "".join(
+                ch
+                for ch in tail("out.log", max_bytes)
+                if unicodedata.category(ch)[0] != "C" or ch in "\t" or ch in "\n"
+            )
+            text2 = text2.replace("\n\n", "\n")
         except FileNotFoundError:
             self.error("out.log does not exist")
 
         return text1 + "\n" + text2
 
     def print(self, *args, log=True, **kwargs):
-        msg = " ".join([str(arg) for arg in args])
-        stack_tr = self.stack_trace(inspect.stack())
+        msg = self.join(args)
+        stack_tr = self.caller()
         if not stack_tr.lower().startswith("logger."):
             msg = f"[{stack_tr}] {msg}"
-        sys.stdout = norm  # output to console
-        print(msg, **kwargs)
-        sys.stdout = self.out  # output to log.log
+        if "file" in kwargs:
+            print(msg, **kwargs)
+        else:
+            # the pipeline writes to the console, so threads don't swap sys.stdout
+            buf = io.StringIO()
+            print(msg, file=buf, **{k: v for k, v in kwargs.items() if k != "flush"})
+            self.pipeline.write_console(buf.getvalue())
         if log:
             self.logging.info(msg)
 
     def hook(self, message: str):
-        try:
-            asyncio.ensure_future(self.async_hook(message))
-        except RuntimeError:
-            # create a new loop and run the coroutine
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(self.async_hook(message))
+        """Queues a message for the webhook, sent within `sink.interval` seconds"""
+        if self.sink is not None:
+            self.sink.put(message)
 
     async def async_hook(self, message: str):
         message = filter_msg(message)
         if self.webhook is not None and self.webhook != "" and message is not None:
-            async with aiohttp.ClientSession() as session, session.post(
-                self.webhook,
-                json={
-                    "content": message,
-                },
-            ) as resp:
-                if resp.status != 204:
-                    self.error(f"Failed to send message to webhook: {message}")
+            if self.http is not None:
+                async with self.http.post(
+                    self.webhook, json={"content": message}
+                ) as resp:
+                    status = resp.status
+            else:
+                async with aiohttp.ClientSession() as session, session.post(
+                    self.webhook,
+                    json={
+                        "content": message,
+                    },
+                ) as resp:
+                    status = resp.status
+            if status != 204:
+                self.error(f"Failed to send message to webhook: {message}")
             self.print(f"Sent message to webhook: {message}")
 
     def __repr__(self):
@@ -237,6 +656,8 @@ class Logger:
             f.write("")
 
     def timer(self, func: callable, *args, **kwargs):
+        if not self.DEBUG and not self.enabled(logging.DEBUG):
+            return func(*args, **kwargs)
         start = time.perf_counter()
         res = func(*args, **kwargs)
         end = time.perf_counter()
@@ -244,6 +665,8 @@ class Logger:
         return res
 
     async def async_timer(self, func: callable, *args, **kwargs):
+        if not self.DEBUG and not self.enabled(logging.DEBUG):
+            return await func(*args, **kwargs)
         start = time.perf_counter()
         res = await func(*args, **kwargs)
         end = time.perf_counter()
@@ -7,7 +7,6 @@ import time
 import traceback
 from typing import List, Optional, Tuple
 
-import aiohttp
 import interactions
 from bson import json_util
 from interactions import ActionRow, ComponentContext, ContextMenuContext, File
@@ -17,8 +16,10 @@ from sentry_sdk import trace
 
 from Extensions.Colors import *
 from .database import Database
+from .httpclient import HTTPClient
 from .logger import Logger
 from .server import Server
+from .session import SessionStore
 from .text import Text
 from .twitch import Twitch
 
@@ -31,12 +32,18 @@ class Message:
         text: "Text",
         server: "Server",
         twitch: "Twitch",
+        sessions: "SessionStore" = None,
+        http: "HTTPClient" = None,
     ):
         self.logger = logger
         self.db = db
         self.text = text
         self.server = server
         self.twitch = twitch
+        self.http = http if http is not None else HTTPClient(logger)
+        self.sessions = (
+            sessions if sessions is not None else SessionStore(logger, cache_path=None)
+        )
 
     @staticmethod
     def buttons(*args: bool | str) -> List[ActionRow]:
@@ -130,6 +137,8 @@ class Message:
         pipeline: list | dict,
         index: int,
         fast=True,
+        msg_id: int = None,
+        max_age: Optional[float] = None,
     ) -> Optional[dict]:
         """Return an embed
 
@@ -137,6 +146,10 @@ class Message:
             pipeline (list): The pipeline to use, or the server data
             index (int): The index of the embed
             fast (bool): Whether to return just the database values
+            msg_id (int, optional): The message the embed is for, its session is
+                updated. Defaults to None.
+            max_age (float, optional): Max seconds since a cached probe of the
+                server, 0 to always probe. Defaults to the server's `probe_ttl`.
 
         Returns:
             {
@@ -168,7 +181,9 @@ class Message:
                     }
             else:
                 # server is in db
-                total_servers = self.logger.timer(self.db.count, pipeline)
+                total_servers = await self.logger.async_timer(
+                    self.db.async_count, pipeline
+                )
 
                 if total_servers == 0:
                     self.logger.print("No servers found")
@@ -184,8 +199,9 @@ class Message:
                 if index >= total_servers:
                     index = 0
 
-                doc = self.logger.timer(
-                    self.db.get_doc_at_index, pipeline, index)
+                doc = await self.logger.async_timer(
+                    self.db.async_get_doc_at_index, pipeline, index
+                )
 
                 data = self.text.update_dict(
                     data,
@@ -219,8 +235,11 @@ class Message:
             # if we have server ip and we want a quick response
             elif not fast:
                 try:
-                    status = self.logger.timer(
-                        self.server.update, host=data["ip"], port=data["port"]
+                    status = await self.logger.async_timer(
+                        self.server.async_update,
+                        host=data["ip"],
+                        port=data["port"],
+                        max_age=max_age,
                     )
 
                     if status is None:
@@ -396,6 +415,11 @@ class Message:
                         inline=True,
                     )
 
+            if msg_id is not None:
+                # button clicks read the session instead of the attachment
+                self.sessions.set(msg_id, pipeline, index)
+                self.sessions.set_doc(msg_id, data)
+
             return {
                 "embed": embed,
                 "components": self.buttons(  # These are whether the buttons are disabled
@@ -478,10 +502,11 @@ class Message:
         index: int,
         pipeline: dict | list,
         msg: interactions.Message,
+        max_age: Optional[float] = None,
     ) -> None:
         # first call the asyncEmbed function with fast
         stuff = await self.logger.async_timer(
-            self.async_embed, pipeline=pipeline, index=index, fast=True
+            self.async_embed, pipeline=pipeline, index=index, fast=True, msg_id=msg.id
         )
 
         if stuff is None:
@@ -502,7 +527,12 @@ class Message:
 
         # then call the asyncEmbed function again with slow
         stuff = await self.logger.async_timer(
-            self.async_embed, pipeline=pipeline, index=index, fast=False
+            self.async_embed,
+            pipeline=pipeline,
+            index=index,
+            fast=False,
+            msg_id=msg.id,
+            max_age=max_age,
         )
 
         if stuff is None:
@@ -519,8 +549,13 @@ class Message:
         # then send the embed
         await msg.edit(**stuff)
 
-    @staticmethod
-    async def get_pipe(msg: interactions.Message) -> Optional[Tuple[int, dict]]:
+    async def get_pipe(self, msg: interactions.Message) -> Optional[Tuple[int, dict]]:
+        # the session of the message, set when it was last rendered
+        session = self.sessions.get(msg.id)
+        if session is not None:
+            return session["index"], session["pipeline"]
+
+        # fall back to the attachment, ex: the session expired
         # make sure it has an embed with at least one attachment and a footer
         if (
             len(msg.embeds) == 0
@@ -536,9 +571,7 @@ class Message:
         # grab the attachment
         for file in msg.attachments:
             if file.filename == "pipeline.ason":
-                async with aiohttp.ClientSession() as session, session.get(
-                    file.url
-                ) as resp:
+                async with self.http.get(file.url) as resp:
                     pipeline = await resp.text()
 
                 return index, (
@@ -548,7 +581,19 @@ class Message:
         return None
 
     @trace
-    async def update(self, ctx: ComponentContext | ContextMenuContext):
+    async def update(
+        self,
+        ctx: ComponentContext | ContextMenuContext,
+        max_age: Optional[float] = None,
+    ):
+        """Reloads the server of a message
+
+        Args:
+            ctx (ComponentContext | ContextMenuContext): The update button or the
+                refresh context menu
+            max_age (float, optional): Max seconds since a cached probe of the
+                server, 0 to always probe. Defaults to the server's `probe_ttl`.
+        """
         try:
             org = ctx.message if type(ctx) is ComponentContext else ctx.target
 
@@ -566,7 +611,7 @@ class Message:
             )
 
             # get the pipeline and index from the message
-            total = self.db.count(pipeline)
+            total = await self.db.async_count(pipeline)
 
             msg = await msg.edit(
                 embed=self.standard_embed(
@@ -582,6 +627,7 @@ class Message:
                 index=index,
                 pipeline=pipeline,
                 msg=msg,
+                max_age=max_age,
             )
         except Exception as err:
             if "403|Forbidden" in str(err):
@@ -3,27 +3,28 @@ import http.server
 import json
 import os
 import secrets
+import time
 import traceback
 import urllib.parse
-import zlib
 from base64 import urlsafe_b64encode
 from hashlib import sha1, sha256
 from http.server import BaseHTTPRequestHandler
 from threading import Thread
-from typing import Tuple, Literal, cast
+from typing import Literal, Optional, Tuple, cast
 
-import aiohttp
 import mcstatus
-import requests
 import sentry_sdk
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.serialization import load_der_public_key
-from mcstatus.protocol.connection import Connection, TCPSocketConnection
+from mcstatus.protocol.connection import Connection
 
+from .cache import TTLCache
+from .httpclient import HTTPClient
 from .logger import Logger
 from .player import Player
+from .protocol import frame, pack_packet, read_packet
 from .server import Server
 from .text import Text
 
@@ -76,12 +77,28 @@ class Minecraft:
                 activationCode = self.path.split("=")[1][:-6]
                 self.server.shutdown()
 
-    def __init__(self, logger: Logger, server: Server, player: Player, text: "Text"):
+    def __init__(
+        self,
+        logger: Logger,
+        server: Server,
+        player: Player,
+        text: "Text",
+        http: "HTTPClient" = None,
+    ):
         self.key = os.urandom(16)
         self.logger = logger
         self.server = server
         self.player = player
         self.text = text
+        self.http = http if http is not None else HTTPClient(logger)
+
+        # minecraft token -> profile uuid, and -> whether the account owns the game
+        self.uuids = TTLCache(maxsize=64, ttl=60 * 60)
+        self.entitlements = TTLCache(maxsize=64, ttl=10 * 60)
+
+        # session server rate limits are shared by every join
+        self.session_backoff_until = 0.0
+        self.session_backoff_count = 0
 
     async def join(
         self,
@@ -96,14 +113,14 @@ class Minecraft:
             # Pre-join checks
             # ----
 
-            # get info on the server
-            server = mcstatus.JavaServer.lookup(ip + ":" + str(port))
-            version = server.status().version.protocol if version == -1 else version
+            # get info on the server, only if the version is not known
+            if version == -1:
+                server = await mcstatus.JavaServer.async_lookup(ip + ":" + str(port))
+                version = (await server.async_status()).version.protocol
 
-            # get the player's uuid
-            _uuid = await self.player.async_get_uuid(player_username)
-            # set the compression threshold off (<= 0)
-            comp_thresh = 0
+            # the uuid of the account the token belongs to, not of whoever was seen
+            # with that name in a server sample
+            _uuid = await self.profile_uuid(mine_token)
 
             # needed if a username is invalid
             if not _uuid:
@@ -115,442 +132,472 @@ class Minecraft:
                 f"{_uuid[:8]}-{_uuid[8:12]}-{_uuid[12:16]}-{_uuid[16:20]}-{_uuid[20:]}"
             )
             # check if the account owns the game
-            async with aiohttp.ClientSession() as httpSession:
-                url = "https://api.minecraftservices.com/entitlements/mcstore"
-                async with httpSession.get(
-                    url,
-                    headers={
-                        "Authorization": f"Bearer {mine_token}",
-                        "Content-Type": "application/json",
-                    },
-                ) as res:
-                    if res.status == 200:
-                        items = (await res.json()).get("items", [])
-
-                        # make sure the account owns the game
-                        if len(items) == 0:
-                            self.logger.print("Account does not own the game")
-                            return self.ServerType(ip, version, "NO_GAME")
-                    else:
-                        self.logger.print("Failed to check if account owns the game")
-                        self.logger.error(res.text)
-                        return self.ServerType(ip, version, "BAD_TOKEN")
+            owns_game = await self.owns_game(mine_token)
+            if owns_game is None:
+                return self.ServerType(ip, version, "BAD_TOKEN")
+            elif not owns_game:
+                self.logger.print("Account does not own the game")
+                return self.ServerType(ip, version, "NO_GAME")
 
-            # ----
-            # C->S: Handshake
-            # ----
+            if len(player_username) > 16:
+                self.logger.print("Username too long")
+                return self.ServerType(ip, version, "BAD_USERNAME")
 
-            # connect to the server via tcp socket
-            connection = TCPSocketConnection((ip, port))
+            # connect to the server, the whole exchange runs on the loop
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port), self.timeout
+            )
+            try:
+                return await self._login(
+                    reader,
+                    writer,
+                    ip=ip,
+                    port=port,
+                    player_username=player_username,
+                    mine_token=mine_token,
+                    version=version,
+                    _duuid=_duuid,
+                )
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (OSError, asyncio.CancelledError):
+                    pass
+        except (TimeoutError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return self.ServerType(ip, version, "OFFLINE:Timeout")
+        except ConnectionRefusedError:
+            return self.ServerType(ip, version, "OFFLINE:ConnectionRefused")
+        except TypeError:
+            self.logger.error(traceback.format_exc())
+            return self.ServerType(ip, version, "OFFLINE:TypeError")
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            self.logger.debug(traceback.format_exc())
+            return self.ServerType(ip, version, "OFFLINE")
 
-            # Send a handshake packet: ID, protocol version, server address, server port, intention to log in
-            # This does not change between versions
-            handshake = Connection()
+    async def _read(
+        self,
+        reader: asyncio.StreamReader,
+        threshold: int = 0,
+        decryptor: Optional[Cipher.decryptor] = None,
+    ) -> Connection:
+        return await asyncio.wait_for(
+            read_packet(reader, threshold=threshold, decryptor=decryptor),
+            self.timeout,
+        )
 
-            handshake.write_varint(0)  # Packet ID
-            handshake.write_varint(version)  # Protocol version
-            handshake.write_utf(ip)  # Server address
-            handshake.write_ushort(int(port))  # Server port
-            handshake.write_varint(2)  # Intention to login
+    async def _login(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        ip: str,
+        port: int,
+        player_username: str,
+        mine_token: str,
+        version: int,
+        _duuid: str,
+    ) -> ServerType:
+        """
+        Log in on an open connection, the socket part of `join`
+
+        :param reader: The stream from the server
+        :param writer: The stream to the server
+        :param ip: The ip of the server
+        :param port: The port of the server
+        :param player_username: The name of the account
+        :param mine_token: The minecraft token of the account
+        :param version: The protocol version
+        :param _duuid: The undashed uuid of the account
+
+        :return: The server type
+        """
+        # set the compression threshold off (<= 0)
+        comp_thresh = 0
+
+        # ----
+        # C->S: Handshake
+        # ----
+
+        # Send a handshake packet: ID, protocol version, server address, server port, intention to log in
+        # This does not change between versions
+        handshake = Connection()
+
+        handshake.write_varint(0)  # Packet ID
+        handshake.write_varint(version)  # Protocol version
+        handshake.write_utf(ip)  # Server address
+        handshake.write_ushort(int(port))  # Server port
+        handshake.write_varint(2)  # Intention to login
+
+        writer.write(frame(handshake))
+        self.logger.debug("Sent handshake packet")
+
+        # ----
+        # c->S: Login Start
+        # ----
+
+        # Send login start packet: ID, username, include sig data, has uuid, uuid
+        loginStart = Connection()
+
+        loginStart.write_varint(0)  # Packet ID
+        loginStart.write_utf(player_username)  # Username
+
+        if version > 758:
+            # older protocols don't want the uuid
+            # https://wiki.vg/index.php?title=Protocol&oldid=16918#Login_Start
+            self.logger.debug("Sending uuid")
+
+            if version <= 760:
+                # a few want signature data
+                # https://wiki.vg/index.php?title=Protocol&oldid=17753#Login_Start
+                loginStart.write_bool(False)  # has sig data
+
+            if version in [760, 761, 762, 763]:
+                # these want the uuid sometimes
+                # https://wiki.vg/index.php?title=Protocol&oldid=18375#Login_Start
+                loginStart.write_bool(True)  # has uuid
+
+            # write uuid by splitting it into two 64-bit integers
+            uuid1 = int(_duuid[:16], 16)
+            uuid2 = int(_duuid[16:], 16)
+            loginStart.write_ulong(uuid1)
+            loginStart.write_ulong(uuid2)
+
+        writer.write(frame(loginStart))
+        await writer.drain()
+        self.logger.debug("Sent login start packet")
+
+        # ----
+        # S->C: Encryption Request and/or Compression
+        # ----
+
+        # Read response
+        try:
+            response = await self._read(reader)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            self.logger.print("No response from server")
+            return self.ServerType(ip, version, "OFFLINE")
 
-            connection.write_buffer(handshake)
-            self.logger.debug("Sent handshake packet")
+        _id: int = response.read_varint()
+        self.logger.debug("Received packet ID:", _id)
 
-            # ----
-            # c->S: Login Start
-            # ----
+        if _id == 0x03:
+            self.logger.print("Setting compression")
+            comp_thresh = response.read_varint()
+            self.logger.print(f"Compression threshold: {comp_thresh}")
 
-            # Send login start packet: ID, username, include sig data, has uuid, uuid
-            loginStart = Connection()
+            response = await self._read(reader, comp_thresh)
+            _id: int = response.read_varint()
 
-            loginStart.write_varint(0)  # Packet ID
-            if len(player_username) > 16:
-                self.logger.print("Username too long")
-                return self.ServerType(ip, version, "BAD_USERNAME")
-            loginStart.write_utf(player_username)  # Username
+        if _id == 0x02:
+            self.logger.print("Logged in successfully")
+            return self.ServerType(ip, version, "CRACKED")
+        elif _id == 0x00:
+            self.logger.print(f"Failed to login, vers: {version}")
+            reason = json.loads(response.read_utf())
+            reason = self.read_chat(reason)
+            self.logger.print(reason)
 
-            if version > 758:
-                # older protocols don't want the uuid
-                # https://wiki.vg/index.php?title=Protocol&oldid=16918#Login_Start
-                self.logger.debug("Sending uuid")
+            if any(i in reason.lower() for i in ["fml", "forge", "modded", "mods"]):
+                return self.ServerType(ip, version, "MODDED")
+            elif any(i in reason.lower() for i in ["whitelist", "not whitelisted"]):
+                return self.ServerType(ip, version, "WHITELISTED")
+            elif reason.startswith("multiplayer.disconnect.incompatible:"):
+                vers = reason.split(":")[1].strip()
+                protocol = self.text.protocol_int(vers)
+
+                return await self.join(
+                    ip=ip,
+                    port=port,
+                    player_username=player_username,
+                    version=protocol,
+                    mine_token=mine_token,
+                )
 
-                if version <= 760:
-                    # a few want signature data
-                    # https://wiki.vg/index.php?title=Protocol&oldid=17753#Login_Start
-                    loginStart.write_bool(False)  # has sig data
+            return self.ServerType(ip, version, "UNKNOWN")
+        elif _id == 0x04:
+            # load plugin request
+            self.logger.debug("Loading plugins")
 
-                if version in [760, 761, 762, 763]:
-                    # these want the uuid sometimes
-                    # https://wiki.vg/index.php?title=Protocol&oldid=18375#Login_Start
-                    loginStart.write_bool(True)  # has uuid
+            message_id, channel, data = self.read_plugin(response)
 
-                # write uuid by splitting it into two 64-bit integers
-                uuid1 = int(_duuid[:16], 16)
-                uuid2 = int(_duuid[16:], 16)
-                loginStart.write_ulong(uuid1)
-                loginStart.write_ulong(uuid2)
+            self.logger.debug("Message ID:", message_id)
+            self.logger.debug("Channel:", channel)
+            self.logger.debug("Data:", data)
 
-            connection.write_buffer(loginStart)
-            self.logger.debug("Sent login start packet")
+            return self.ServerType(ip, version, "MODDED")
+        elif _id == 0x01:
+            self.logger.debug("Encryption requested")
+            if mine_token is None:
+                return self.ServerType(ip, version, "PREMIUM")
 
             # ----
-            # S->C: Encryption Request and/or Compression
+            # Setup our encryption
             # ----
 
-            # Read response
+            # Read encryption request
+            length = response.read_varint()
+            server_id = response.read(length)
+            length = response.read_varint()
+            public_key = response.read(length)
+            length = response.read_varint()
             try:
-                response = connection.read_buffer()
+                verify_token = response.read(length)
             except OSError:
-                self.logger.print("No response from server")
-                return self.ServerType(ip, version, "OFFLINE")
-
-            _id: int = response.read_varint()
-            self.logger.debug("Received packet ID:", _id)
-
-            if _id == 0x03:
-                self.logger.print("Setting compression")
-                comp_thresh = response.read_varint()
-                self.logger.print(f"Compression threshold: {comp_thresh}")
-
-                response = self.read_compressed(connection)
-                _id: int = response.read_varint()
-
-            if _id == 0x02:
-                self.logger.print("Logged in successfully")
-                return self.ServerType(ip, version, "CRACKED")
-            elif _id == 0x00:
-                self.logger.print(f"Failed to login, vers: {version}")
-                reason = json.loads(response.read_utf())
-                reason = self.read_chat(reason)
-                self.logger.print(reason)
-
-                if any(i in reason.lower() for i in ["fml", "forge", "modded", "mods"]):
-                    return self.ServerType(ip, version, "MODDED")
-                elif any(i in reason.lower() for i in ["whitelist", "not whitelisted"]):
-                    return self.ServerType(ip, version, "WHITELISTED")
-                elif reason.startswith("multiplayer.disconnect.incompatible:"):
-                    vers = reason.split(":")[1].strip()
-                    protocol = self.text.protocol_int(vers)
-
-                    return await self.join(
-                        ip=ip,
-                        port=port,
-                        player_username=player_username,
-                        version=protocol,
-                        mine_token=mine_token,
-                    )
-
-                return self.ServerType(ip, version, "UNKNOWN")
-            elif _id == 0x04:
-                # load plugin request
-                self.logger.debug("Loading plugins")
-
-                message_id, channel, data = self.read_plugin(connection)
-
-                self.logger.debug("Message ID:", message_id)
-                self.logger.debug("Channel:", channel)
-                self.logger.debug("Data:", data)
+                self.logger.print("Weird packet")
+                verify_token = response.read(response.remaining())
+                self.logger.debug(f"Length mismatch: {length} != {len(verify_token)}")
+                self.logger.debug(
+                    f"Server id: {server_id}\nPublic key: {public_key}\nVerify token: {verify_token}"
+                )
 
-                return self.ServerType(ip, version, "MODDED")
-            elif _id == 0x01:
-                self.logger.debug("Encryption requested")
-                if mine_token is None:
-                    return self.ServerType(ip, version, "PREMIUM")
-
-                # ----
-                # Setup our encryption
-                # ----
-
-                # Read encryption request
-                length = response.read_varint()
-                server_id = response.read(length)
-                length = response.read_varint()
-                public_key = response.read(length)
-                length = response.read_varint()
-                try:
-                    verify_token = response.read(length)
-                except OSError:
-                    self.logger.print("Weird packet")
-                    verify_token = response.read(response.remaining())
-                    self.logger.debug(
-                        f"Length mismatch: {length} != {len(verify_token)}"
-                    )
-                    self.logger.debug(
-                        f"Server id: {server_id}\nPublic key: {public_key}\nVerify token: {verify_token}"
-                    )
+            shared_secret = os.urandom(16)
+
+            # change verify_token to bytes form bytearray
+            verify_token = bytes(verify_token)
+            public_key = bytes(public_key)
+            server_id = bytes(server_id)
+
+            # create the server hash
+            # https://wiki.vg/Protocol_Encryption#Client
+            shaHash = sha1()  # skipcq: PTC-W1003
+            shaHash.update(server_id)
+            shaHash.update(shared_secret)
+            shaHash.update(public_key)
+            verify_hash = shaHash.hexdigest()
+
+            print(
+                f"Server id: {server_id}\n"
+                f"Public key: {public_key}\n"
+                f"Verify token: {verify_token}\n"
+                f"Shared secret: {shared_secret}\n"
+                f"Verify hash: {verify_hash}"
+            )
 
-                shared_secret = os.urandom(16)
-
-                # change verify_token to bytes form bytearray
-                verify_token = bytes(verify_token)
-                public_key = bytes(public_key)
-                server_id = bytes(server_id)
-
-                # create the server hash
-                # https://wiki.vg/Protocol_Encryption#Client
-                shaHash = sha1()  # skipcq: PTC-W1003
-                shaHash.update(server_id)
-                shaHash.update(shared_secret)
-                shaHash.update(public_key)
-                verify_hash = shaHash.hexdigest()
-
-                print(
-                    f"Server id: {server_id}\n"
-                    f"Public key: {public_key}\n"
-                    f"Verify token: {verify_token}\n"
-                    f"Shared secret: {shared_secret}\n"
-                    f"Verify hash: {verify_hash}"
-                )
+            # load the public key into an object, so we can use it to encrypt bytes
+            pubKey = load_der_public_key(public_key, default_backend())
 
-                # load the public key into an object, so we can use it to encrypt bytes
-                pubKey = load_der_public_key(public_key, default_backend())
+            # create a cipher object to decrypt the packets after encryption response
+            # use the shared secret as the key and iv, nothing is sent encrypted
+            cipher = Cipher(
+                # key
+                algorithms.AES(shared_secret),
+                # iv
+                modes.CFB8(shared_secret),
+            )
+            decryptor = cipher.decryptor()
 
-                # create a cipher object to encrypt the packet after encryption response
-                # use the shared secret as the key and iv
-                cipher = Cipher(
-                    # key
-                    algorithms.AES(shared_secret),
-                    # iv
-                    modes.CFB8(shared_secret),
-                )
-                encryptor = cipher.encryptor()
-                decryptor = cipher.decryptor()
+            # ----
+            # Client Auth
+            # ----
 
-                # ----
-                # Client Auth
-                # ----
+            # send a request to mojang servers to request that we are joining a server
+            self.logger.debug("Sending authentication request")
+            if await self.session_join(
+                mine_token=mine_token,
+                server_hash=verify_hash,
+                _uuid=_duuid,
+                name=player_username,
+            ):
+                self.logger.print("Failed to authenticate account")
+                return self.ServerType(ip, version, "BAD_AUTH")
 
-                # send a request to mojang servers to request that we are joining a server
-                self.logger.debug("Sending authentication request")
-                if await self.session_join(
-                    mine_token=mine_token,
-                    server_hash=verify_hash,
-                    _uuid=_duuid,
-                    name=player_username,
-                ):
-                    self.logger.print("Failed to authenticate account")
-                    return self.ServerType(ip, version, "BAD_AUTH")
+            # ----
+            # Encryption Response
+            # ----
 
-                # ----
-                # Encryption Response
-                # ----
+            # send encryption response
+            self.logger.debug("Sending encryption response")
+            encryptedSharedSecret = pubKey.encrypt(shared_secret, PKCS1v15())
+            encryptedVerifyToken = pubKey.encrypt(verify_token, PKCS1v15())
 
-                # send encryption response
-                self.logger.debug("Sending encryption response")
-                encryptedSharedSecret = pubKey.encrypt(shared_secret, PKCS1v15())
-                encryptedVerifyToken = pubKey.encrypt(verify_token, PKCS1v15())
+            encryptionResponse = Connection()
+            encryptionResponse.write_varint(1)  # Packet ID
+            encryptionResponse.write_varint(len(encryptedSharedSecret))
+            encryptionResponse.write(encryptedSharedSecret)
+            encryptionResponse.write_varint(len(encryptedVerifyToken))
+            encryptionResponse.write(encryptedVerifyToken)
 
-                encryptionResponse = Connection()
-                encryptionResponse.write_varint(1)  # Packet ID
-                encryptionResponse.write_varint(len(encryptedSharedSecret))
-                encryptionResponse.write(encryptedSharedSecret)
-                encryptionResponse.write_varint(len(encryptedVerifyToken))
-                encryptionResponse.write(encryptedVerifyToken)
+            writer.write(pack_packet(encryptionResponse.flush(), comp_thresh))
+            await writer.drain()
+            self.logger.debug("Sent encryption response")
 
-                self.compress_packet(encryptionResponse, connection, comp_thresh)
-                self.logger.debug("Sent encryption response")
+            # ----
+            # Login Success and/or Set Compression
+            # ----
 
-                # ----
-                # Login Success and/or Set Compression
-                # ----
+            # everything from here on is encrypted, packets are decrypted as they
+            # arrive instead of waiting for the socket to time out
+            unc = await self._read(reader, comp_thresh, decryptor)
+            _id = unc.read_varint()
+            self.logger.debug("Received packet ID:", _id)
 
-                unc = self.read_enc(connection, decryptor)
-                if comp_thresh > 0:
-                    unc = self.read_compressed(unc)
+            if _id == 0x03:
+                self.logger.print("Setting compression")
+                comp_thresh = unc.read_varint()
+                self.logger.print(f"Compression threshold: {comp_thresh}")
 
+                # read response
+                unc = await self._read(reader, comp_thresh, decryptor)
                 _id = unc.read_varint()
                 self.logger.debug("Received packet ID:", _id)
 
-                if _id == 0x03:
-                    self.logger.print("Keep alive Packet")
-
-                    keep_id = unc.read_varint()
-                    self.logger.debug("Keep alive ID:", keep_id)
-
-                    # send keep alive packet
-                    keep_alive = Connection()
-
-                    keep_alive.write_varint(0x03)
-                    keep_alive.write_varint(keep_id)
-
-                    self.compress_packet(keep_alive, connection, comp_thresh, encryptor)
-
-                    # read response
-                    unc = self.read_enc(connection, decryptor)
-                    if comp_thresh > 0:
-                        unc = self.read_compressed(unc)
-
-                    _id = unc.read_varint()
-                    self.logger.debug("Received packet ID:", _id)
+            if _id == 0x00:
+                reason = self.read_chat(unc.read_utf())
+                self.logger.print(reason)
 
-                if _id == 0x00:
-                    reason = self.read_chat(unc.read_utf())
-                    self.logger.print(reason)
-                ...
+                if "whitelist" in reason.lower():
+                    return self.ServerType(ip, version, "WHITELISTED")
 
-                return self.ServerType(ip, version, "PREMIUM")
+            return self.ServerType(ip, version, "PREMIUM")
 
-            # ----
-            # Something went wrong
-            # ----
+        # ----
+        # Something went wrong
+        # ----
 
-            self.logger.info("Unknown response: " + str(_id))
-            try:
-                reason = response.read_utf()
-            except UnicodeDecodeError:
-                reason = "Unknown"
+        self.logger.info("Unknown response: " + str(_id))
+        try:
+            reason = response.read_utf()
+        except UnicodeDecodeError:
+            reason = "Unknown"
 
-            self.logger.info("Reason: " + reason)
-            return self.ServerType(ip, version, "UNKNOWN: " + reason)
-        except TimeoutError:
-            return self.ServerType(ip, version, "OFFLINE:Timeout")
-        except ConnectionRefusedError:
-            return self.ServerType(ip, version, "OFFLINE:ConnectionRefused")
-        except TypeError:
-            self.logger.error(traceback.format_exc())
-            return self.ServerType(ip, version, "OFFLINE:TypeError")
-        except Exception as e:
-            sentry_sdk.capture_exception(e)
-            self.logger.debug(traceback.format_exc())
-            return self.ServerType(ip, version, "OFFLINE")
+        self.logger.info("Reason: " + reason)
+        return self.ServerType(ip, version, "UNKNOWN: " + reason)
 
     async def get_minecraft_token_async(
         self, clientID, redirect_uri, act_code, verify_code=None
     ) -> dict:
-        async with aiohttp.ClientSession() as httpSession:
+        # get the access token
+        endpoint = "https://login.microsoftonline.com/consumers/oauth2/v2.0/token"
+        params = {
+            "client_id": clientID,
+            "scope": "XboxLive.signin",
+            "code": act_code,
+            "redirect_uri": redirect_uri,
+            "grant_type": "authorization_code",
+        }
+        if verify_code:
+            params["code_verifier"] = verify_code
+
+        async with self.http.post(
+            endpoint,
+            data=params,
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+            },
+        ) as res:
             # get the access token
-            endpoint = "https://login.microsoftonline.com/consumers/oauth2/v2.0/token"
-            params = {
-                "client_id": clientID,
-                "scope": "XboxLive.signin",
-                "code": act_code,
-                "redirect_uri": redirect_uri,
-                "grant_type": "authorization_code",
-            }
-            if verify_code:
-                params["code_verifier"] = verify_code
+            if res.status == 200:
+                rjson = await res.json()
+                accessToken = rjson["access_token"]
+            else:
+                self.logger.print("Failed to get access token")
+                try:
+                    error_j = await res.json()
+                    self.logger.error(error_j["error"], error_j["error_description"])
+                except KeyError:
+                    self.logger.error(res.reason)
+                return {"type": "error", "error": "Failed to get access token"}
 
-            async with httpSession.post(
-                endpoint,
-                data=params,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                },
-            ) as res:
-                # get the access token
-                if res.status == 200:
-                    rjson = await res.json()
-                    accessToken = rjson["access_token"]
-                else:
-                    self.logger.print("Failed to get access token")
-                    try:
-                        error_j = await res.json()
-                        self.logger.error(
-                            error_j["error"], error_j["error_description"]
-                        )
-                    except KeyError:
-                        self.logger.error(res.reason)
-                    return {"type": "error", "error": "Failed to get access token"}
-
-            # obtain xbl token
-            url = "https://user.auth.xboxlive.com/user/authenticate"
-            async with httpSession.post(
-                url,
-                json={
-                    "Properties": {
-                        "AuthMethod": "RPS",
-                        "SiteName": "user.auth.xboxlive.com",
-                        "RpsTicket": f"d={accessToken}",
-                    },
-                    "RelyingParty": "http://auth.xboxlive.com",  # changed from http -> https
-                    "TokenType": "JWT",
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                },
-            ) as res2:
-                if res2.status == 200:
-                    xblToken = (await res2.json())["Token"]
-                else:
-                    self.logger.print("Failed to verify account: ", res2.status)
-                    self.logger.error(res2.reason)
-                    self.logger.error(res2.text)
-                    return {"type": "error", "error": "Failed to verify account"}
-
-            # obtain xsts token
-            url = "https://xsts.auth.xboxlive.com/xsts/authorize"
-            async with httpSession.post(
-                url,
-                json={
-                    "Properties": {
-                        "SandboxId": "RETAIL",
-                        "UserTokens": [xblToken],
-                    },
-                    "RelyingParty": "rp://api.minecraftservices.com/",
-                    "TokenType": "JWT",
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                },
-            ) as res3:
-                if res3.status == 200:
-                    xstsToken = (await res3.json())["Token"]
-                else:
-                    self.logger.print("Failed to obtain xsts token")
-                    self.logger.error(res3.reason)
-                    return {"type": "error", "error": "Failed to obtain xsts token"}
-
-            # obtain minecraft token
-            xuid = (await res3.json())["DisplayClaims"]["xui"][0]["uhs"]
-            url = "https://api.minecraftservices.com/authentication/login_with_xbox"
-            async with httpSession.post(
-                url,
-                json={
-                    "identityToken": f"XBL3.0 x={xuid};{xstsToken}",
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
+        # obtain xbl token
+        url = "https://user.auth.xboxlive.com/user/authenticate"
+        async with self.http.post(
+            url,
+            json={
+                "Properties": {
+                    "AuthMethod": "RPS",
+                    "SiteName": "user.auth.xboxlive.com",
+                    "RpsTicket": f"d={accessToken}",
                 },
-            ) as res4:
-                if res4.status == 200:
-                    minecraftToken = (await res4.json())["access_token"]
-                    self.logger.print("Got Minecraft token")
-                else:
-                    self.logger.print("Failed to obtain minecraft token")
-                    self.logger.error(res4.reason)
-                    return {
-                        "type": "error",
-                        "error": "Failed to obtain minecraft token",
-                    }
+                "RelyingParty": "http://auth.xboxlive.com",  # changed from http -> https
+                "TokenType": "JWT",
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        ) as res2:
+            if res2.status == 200:
+                xblToken = (await res2.json())["Token"]
+            else:
+                self.logger.print("Failed to verify account: ", res2.status)
+                self.logger.error(res2.reason)
+                self.logger.error(res2.text)
+                return {"type": "error", "error": "Failed to verify account"}
 
-            # get the profile
-            url = "https://api.minecraftservices.com/minecraft/profile"
-            async with httpSession.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {minecraftToken}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
+        # obtain xsts token
+        url = "https://xsts.auth.xboxlive.com/xsts/authorize"
+        async with self.http.post(
+            url,
+            json={
+                "Properties": {
+                    "SandboxId": "RETAIL",
+                    "UserTokens": [xblToken],
                 },
-            ) as res5:
-                if res5.status == 200 and "error" not in str(await res5.json()):
-                    uuid = (await res5.json())["id"]
-                    name = (await res5.json())["name"]
-                    self.logger.print("Name: " + name + " UUID: " + uuid)
-                else:
-                    self.logger.print("Failed to obtain profile")
-                    self.logger.error(res5.reason)
-                    return {"type": "error", "error": "Failed to obtain profile"}
+                "RelyingParty": "rp://api.minecraftservices.com/",
+                "TokenType": "JWT",
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        ) as res3:
+            if res3.status == 200:
+                xstsToken = (await res3.json())["Token"]
+            else:
+                self.logger.print("Failed to obtain xsts token")
+                self.logger.error(res3.reason)
+                return {"type": "error", "error": "Failed to obtain xsts token"}
 
-            return {
-                "type": "success",
-                "uuid": uuid,
-                "name": name,
-                "minecraft_token": minecraftToken,
-            }
+        # obtain minecraft token
+        xuid = (await res3.json())["DisplayClaims"]["xui"][0]["uhs"]
+        url = "https://api.minecraftservices.com/authentication/login_with_xbox"
+        async with self.http.post(
+            url,
+            json={
+                "identityToken": f"XBL3.0 x={xuid};{xstsToken}",
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        ) as res4:
+            if res4.status == 200:
+                minecraftToken = (await res4.json())["access_token"]
+                self.logger.print("Got Minecraft token")
+            else:
+                self.logger.print("Failed to obtain minecraft token")
+                self.logger.error(res4.reason)
+                return {
+                    "type": "error",
+                    "error": "Failed to obtain minecraft token",
+                }
+
+        # get the profile
+        url = "https://api.minecraftservices.com/minecraft/profile"
+        async with self.http.get(
+            url,
+            headers={
+                "Authorization": f"Bearer {minecraftToken}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        ) as res5:
+            if res5.status == 200 and "error" not in str(await res5.json()):
+                uuid = (await res5.json())["id"]
+                name = (await res5.json())["name"]
+                self.logger.print("Name: " + name + " UUID: " + uuid)
+            else:
+                self.logger.print("Failed to obtain profile")
+                self.logger.error(res5.reason)
+                return {"type": "error", "error": "Failed to obtain profile"}
+
+        return {
+            "type": "success",
+            "uuid": uuid,
+            "name": name,
+            "minecraft_token": minecraftToken,
+        }
 
     def get_minecraft_token(
         self, clientID, redirect_uri, act_code, verify_code=None
@@ -566,7 +613,7 @@ class Minecraft:
         }
         if verify_code:
             params["code_verifier"] = verify_code
-        res = requests.post(
+        res = self.http.sync.post(
             endpoint,
             data=params,
             headers={
@@ -588,7 +635,7 @@ class Minecraft:
 
         # obtain xbl token
         url = "https://user.auth.xboxlive.com/user/authenticate"
-        res2 = requests.post(
+        res2 = self.http.sync.post(
             url,
             json={
                 "Properties": {
@@ -615,7 +662,7 @@ class Minecraft:
 
         # obtain xsts token
         url = "https://xsts.auth.xboxlive.com/xsts/authorize"
-        res3 = requests.post(
+        res3 = self.http.sync.post(
             url,
             json={
                 "Properties": {
@@ -641,7 +688,7 @@ class Minecraft:
         # obtain minecraft token
         xuid = res3.json()["DisplayClaims"]["xui"][0]["uhs"]
         url = "https://api.minecraftservices.com/authentication/login_with_xbox"
-        res4 = requests.post(
+        res4 = self.http.sync.post(
             url,
             json={
                 "identityToken": f"XBL3.0 x={xuid};{xstsToken}",
@@ -664,7 +711,7 @@ class Minecraft:
 
         # get the profile
         url = "https://api.minecraftservices.com/minecraft/profile"
-        res5 = requests.get(
+        res5 = self.http.sync.get(
             url,
             headers={
                 "Authorization": f"Bearer {minecraftToken}",
@@ -759,159 +806,140 @@ class Minecraft:
             cast(Literal["plain", "S256"], code_challenge_method),
         )
 
-    async def session_join(self, mine_token, server_hash, _uuid, name, tries=0):
-        try:
-            if tries > 5:
-                self.logger.print("Failed to authenticate account after 5 tries")
-                return 1
-            async with aiohttp.ClientSession() as httpSession:
-                url = "https://sessionserver.mojang.com/session/minecraft/join"
-                async with httpSession.post(
-                    url,
-                    json={
-                        "accessToken": mine_token,
-                        "selectedProfile": {
-                            "id": _uuid.replace("-", ""),
-                            "name": name,
-                        },
-                        "serverId": server_hash,
-                    },
-                    headers={
-                        "Content-Type": "application/json",
-                    },
-                ) as res:
-                    if res.status == 204:  # success
-                        self.logger.debug(
-                            "Authenticated account successfully " + (await res.text())
-                        )
-                        return 0
-                    elif res.status == 403:  # bad something
-                        jres = await res.json()
-                        self.logger.print("Failed to authenticate account")
-                        self.logger.print(jres["errorMessage"])
-                    elif res.status == 503:  # service unavailable
-                        # wait 1 second and try again
-                        self.logger.print("Service unavailable")
-                        await asyncio.sleep(1)
-                        return await self.session_join(
-                            mine_token, server_hash, _uuid, name, tries + 1
-                        )
-                    elif res.status == 429:
-                        tries += 1
-                        await asyncio.sleep(5)
-                        self.logger.debug(
-                            "Rate limited, trying again: " + (await res.text())
-                        )
-                        return await self.session_join(
-                            mine_token, server_hash, _uuid, name, tries
-                        )
-                    else:
-                        self.logger.print("Failed to authenticate account")
-                        self.logger.error(res.status, await res.text())
+    async def profile_uuid(self, mine_token: str) -> Optional[str]:
+        """Gets the uuid of the profile of a token, the result is cached per token
 
-            return 1
-        except Exception:
-            self.logger.error(traceback.format_exc())
+        :param mine_token: The minecraft token of the account
 
-    def compress_packet(
-        self,
-        packet: Connection,
-        connection: Connection,
-        threshold=0,
-        encryptor: Cipher.encryptor = None,
-    ) -> None:
+        :return: The undashed uuid, None if the profile couldn't be read
         """
-        Compresses a packet if it is over the threshold in the format of:
-
-            Length of (Data Length) + Compressed length of (Packet ID + Data)
-            Length of uncompressed data
-            Packet ID
-            Data
-
-        :param packet: The packet to compress
-        :param connection: The connection to write to
-        :param threshold: The threshold to compress at
-        :param encryptor: The encryptor to encrypt the packet with
-
-        :return: None
-        """
-
-        if threshold <= 0:
-            if encryptor:
-                packet = self.encrypt_data(packet.flush(), encryptor)
-                assert packet is not None
+        uuid = self.uuids.get(mine_token)
+        if uuid is not None:
+            return uuid
 
-            connection.write_buffer(packet)
-            return
-
-        data = packet.flush()
-
-        # get the total length of the packet
-        uncomp_len = len(data)
-
-        if uncomp_len < threshold:
-            # we can send uncompressed but in a different format
-            # data length is now 0
-            new_data = Connection()
-            new_data.write_varint(0)  # uncompressed data length
-            new_data.write(data)
+        url = "https://api.minecraftservices.com/minecraft/profile"
+        async with self.http.get(
+            url,
+            headers={
+                "Authorization": f"Bearer {mine_token}",
+                "Accept": "application/json",
+            },
+        ) as res:
+            if res.status != 200:
+                self.logger.print("Failed to get the profile of the account")
+                return None
+            uuid = (await res.json()).get("id")
 
-            if encryptor:
-                new_data = self.encrypt_data(new_data.flush(), encryptor)
-                assert new_data is not None
+        if uuid:
+            self.uuids.set(mine_token, uuid)
+        return uuid
 
-            connection.write_buffer(new_data)
-            return
+    async def owns_game(self, mine_token: str) -> Optional[bool]:
+        """Checks if an account owns the game, the result is cached per token
 
-        # compress the packet with zlib
-        cdata = zlib.compress(data)
+        :param mine_token: The minecraft token of the account
 
-        packet = Connection()
-        packet.write_varint(uncomp_len)  # packet length (uncompressed)
-        packet.write(cdata)  # compressed data
+        :return: True if the account owns the game, None if the token is bad
+        """
+        owns = self.entitlements.get(mine_token)
+        if owns is not None:
+            return owns
 
-        if encryptor:
-            packet = self.encrypt_data(packet.flush(), encryptor)
-            assert packet is not None
+        url = "https://api.minecraftservices.com/entitlements/mcstore"
+        async with self.http.get(
+            url,
+            headers={
+                "Authorization": f"Bearer {mine_token}",
+                "Content-Type": "application/json",
+            },
+        ) as res:
+            if res.status == 200:
+                items = (await res.json()).get("items", [])
+                owns = len(items) > 0
+            else:
+                self.logger.print("Failed to check if account owns the game")
+                self.logger.error(res.status, await res.text())
+                return None
 
-        connection.write_buffer(packet)
+        self.entitlements.set(mine_token, owns)
+        return owns
 
-    def read_compressed(self, con: Connection | TCPSocketConnection):
-        """
-        Reads a compressed packet from the connection.
+    async def session_backoff(self) -> None:
+        """Waits out a rate limit from the session server"""
+        delay = self.session_backoff_until - time.monotonic()
+        if delay > 0:
+            self.logger.debug(f"Waiting {delay:.1f} seconds for the session server")
+            await asyncio.sleep(delay)
 
-        :param con: The connection to read from
+    def session_rate_limited(self, retry_after: Optional[str] = None) -> None:
+        """Backs off every session join after a 429
 
-        :return: The uncompressed packet
+        :param retry_after: The Retry-After header of the response, if any
         """
+        self.session_backoff_count += 1
         try:
-            if isinstance(con, TCPSocketConnection):
-                data = con.read_buffer()
-            else:
-                data = con
-
-            uncomp_len = data.read_varint()
-            cdata = data.read(data.remaining())
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(5 * 2 ** (self.session_backoff_count - 1), 120)
 
-            if uncomp_len == 0:
-                # the data is not compressed
-                data = cdata
-                uncomp_len = len(data)
-            else:
-                data = zlib.decompress(cdata)
-
-            if len(data) != uncomp_len:
-                self.logger.print(
-                    f"Length mismatch when decompressing: {len(data)} != {uncomp_len}"
-                )
+        self.session_backoff_until = max(
+            self.session_backoff_until, time.monotonic() + delay
+        )
 
-            out = Connection()
-            out.receive(data)
+    async def session_join(self, mine_token, server_hash, _uuid, name, tries=0):
+        try:
+            if tries > 5:
+                self.logger.print("Failed to authenticate account after 5 tries")
+                return 1
+            await self.session_backoff()
+            url = "https://sessionserver.mojang.com/session/minecraft/join"
+            async with self.http.post(
+                url,
+                json={
+                    "accessToken": mine_token,
+                    "selectedProfile": {
+                        "id": _uuid.replace("-", ""),
+                        "name": name,
+                    },
+                    "serverId": server_hash,
+                },
+                headers={
+                    "Content-Type": "application/json",
+                },
+            ) as res:
+                if res.status == 204:  # success
+                    self.logger.debug(
+                        "Authenticated account successfully " + (await res.text())
+                    )
+                    self.session_backoff_count = 0
+                    return 0
+                elif res.status == 403:  # bad something
+                    jres = await res.json()
+                    self.logger.print("Failed to authenticate account")
+                    self.logger.print(jres["errorMessage"])
+                elif res.status == 503:  # service unavailable
+                    # wait 1 second and try again
+                    self.logger.print("Service unavailable")
+                    await asyncio.sleep(1)
+                    return await self.session_join(
+                        mine_token, server_hash, _uuid, name, tries + 1
+                    )
+                elif res.status == 429:
+                    tries += 1
+                    self.session_rate_limited(res.headers.get("Retry-After"))
+                    self.logger.debug(
+                        "Rate limited, trying again: " + (await res.text())
+                    )
+                    return await self.session_join(
+                        mine_token, server_hash, _uuid, name, tries
+                    )
+                else:
+                    self.logger.print("Failed to authenticate account")
+                    self.logger.error(res.status, await res.text())
 
-            return out
-        except Exception as err:
+            return 1
+        except Exception:
             self.logger.error(traceback.format_exc())
-            raise err
 
     def read_chat(self, chat: dict | str):
         try:
@@ -949,75 +977,3 @@ class Minecraft:
         except Exception:
             self.logger.error(traceback.format_exc())
             return None, None, None
-
-    def decrypt_packet(
-        self, connection: TCPSocketConnection, decryptor: Cipher.decryptor
-    ) -> Connection:
-        try:
-            # everything is encrypted so first receive all the data
-            data = connection.read(connection.remaining())
-
-            # decrypt the data
-            unc_data = self.decrypt_data(data, decryptor)
-
-            return unc_data
-        except Exception:
-            self.logger.error(traceback.format_exc())
-            return Connection()
-
-    def decrypt_data(self, data: bytes, decryptor: Cipher.decryptor):
-        try:
-            assert len(data) > 0
-
-            unc_data = decryptor.update(data)
-
-            assert len(unc_data) > 0
-
-            out = Connection()
-            out.receive(unc_data)
-            out.write(unc_data)
-
-            return out
-        except Exception:
-            self.logger.error(traceback.format_exc(), data)
-            return None
-
-    def encrypt_data(self, data: bytes, encryptor: Cipher.encryptor):
-        try:
-            enc_data = encryptor.update(data)
-            out = Connection()
-            out.receive(enc_data)
-            out.write(enc_data)
-
-            return out
-        except Exception:
-            self.logger.error(traceback.format_exc())
-            return
-
-    def read_enc(self, conn: TCPSocketConnection, decryptor: Cipher.decryptor):
-        """
-        Reads an encrypted packet from the connection.
-
-        :param conn: The connection to read from
-        :param decryptor: the decryptor to decrypt with
-
-        :return: The decrypted packet
-        """
-        data = []
-        while True:
-            try:
-                data.append(conn.read(1))
-            except OSError:
-                self.logger.print(f"Finished reading packet after {len(data)} bytes")
-                break
-        data = b"".join(data)
-
-        unc = self.decrypt_data(data, decryptor)
-
-        assert unc is not None
-
-        self.logger.debug(
-            f"Received {len(data)} bytes, decrypted to {unc.read_varint()} bytes"
-        )
-
-        return unc
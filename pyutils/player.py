@@ -1,10 +1,9 @@
-import asyncio
 from typing import Optional
 
-import aiohttp
 import interactions
 
 from .database import Database
+from .httpclient import HTTPClient
 from .logger import Logger
 from .server import Server
 
@@ -12,17 +11,25 @@ from .server import Server
 class Player:
     """Class to hold all the player-related functions"""
 
-    def __init__(self, logger: "Logger", server: "Server", db: "Database"):
+    def __init__(
+        self,
+        logger: "Logger",
+        server: "Server",
+        db: "Database",
+        http: "HTTPClient" = None,
+    ):
         """Initializes the Players class
 
         Args:
             logger (Logger): The logger class
             server (Server): The server class
             db (Database): The database class
+            http (HTTPClient, optional): The shared HTTP client. Defaults to a new one.
         """
         self.logger = logger
         self.server = server
         self.db = db
+        self.http = http if http is not None else HTTPClient(logger)
 
     async def async_crack_check_api(self, host: str, port: str = "25565") -> bool:
         """Checks if a server is cracked using the mcstatus.io API
@@ -37,7 +44,7 @@ class Player:
         """
         url = "https://api.mcstatus.io/v2/status/java/" + host + ":" + str(port)
 
-        async with aiohttp.ClientSession() as session, session.get(url) as resp:
+        async with self.http.get(url) as resp:
             if resp.status == 200:
                 self.logger.debug("Server is cracked")
                 return (await resp.json())["eula_blocked"]
@@ -54,7 +61,7 @@ class Player:
             interactions.file | None: file object of the player head
         """
         url = "https://minotar.net/avatar/" + name
-        async with aiohttp.ClientSession() as session, session.get(url) as r:
+        async with self.http.get(url) as r:
             if r.status != 200:
                 self.logger.print("Player head not found")
                 return None
@@ -67,11 +74,11 @@ class Player:
             )
 
     def get_uuid(self, name: str) -> str:
-        return asyncio.run(self.async_get_uuid(name))
+        return self.http.run(self.async_get_uuid(name))
 
-    @staticmethod
-    async def async_get_uuid(name: str) -> str:
-        """Get the UUID of a player
+    async def async_get_uuid(self, name: str) -> str:
+        """Get the UUID of a player, names seen in a sample are resolved without
+        mojang
 
         Args:
             name (str): player name
@@ -79,8 +86,12 @@ class Player:
         Returns:
             str: player UUID
         """
+        uuid = await self.db.players.async_uuid_of(name)
+        if uuid is not None:
+            return uuid
+
         url = "https://api.mojang.com/users/profiles/minecraft/" + name
-        async with aiohttp.ClientSession() as session, session.get(url) as resp:
+        async with self.http.get(url) as resp:
             if resp.status == 200:
                 uuid = (await resp.json())["id"]
                 return (
@@ -89,8 +100,7 @@ class Player:
             else:
                 return ""
 
-    @staticmethod
-    async def async_get_profile(uuid: str) -> dict:
+    async def async_get_profile(self, uuid: str) -> dict:
         """Get the profile of a player
 
         Args:
@@ -100,7 +110,7 @@ class Player:
             dict: player profile
         """
         url = "https://sessionserver.mojang.com/session/minecraft/profile/" + uuid
-        async with aiohttp.ClientSession() as session, session.get(url) as resp:
+        async with self.http.get(url) as resp:
             if resp.status == 200:
                 return await resp.json()
             else:
@@ -118,7 +128,7 @@ class Player:
         Returns:
             str: list of players
         """
-        data = self.server.update(host=ip, port=port, fast=True)
+        data = await self.server.async_update(host=ip, port=port, fast=True)
 
         if data is None:
             self.logger.print(f"Server {ip}:{port} not found in database")
@@ -0,0 +1,350 @@
+import asyncio
+import re
+import time
+from concurrent.futures import Executor
+from typing import Optional
+
+import pymongo
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+from .indexes import ASC, DESC, IndexAdvisor
+from .logger import Logger
+from .stats import FAKE_ID
+from .writer import BulkWriter
+
+# a sighting of a player on a server is kept with this key
+INDEXES = [
+    IndexModel(
+        [("uuid", ASC), ("ip", ASC), ("port", ASC)], name="uuid_server", unique=True
+    ),
+    # /player, the servers of a uuid by the last time the player was seen on them
+    IndexModel([("uuid", ASC), ("lastSeen", DESC)], name="uuid_lastSeen"),
+    # names resolved without mojang
+    IndexModel([("nameLower", ASC), ("lastSeen", DESC)], name="name_lastSeen"),
+]
+
+UUID_RE = re.compile(
+    r"^[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}$"
+)
+
+
+class Players:
+    """The players collection, one row per player seen on a server
+
+    Rows are `{uuid, name, nameLower, ip, port, firstSeen, lastSeen}`, upserted from
+    the samples of every server write, so finding the servers of a player, or the
+    uuid of a name, is one indexed read instead of a scan of `players.sample`.
+    """
+
+    def __init__(
+        self,
+        col: pymongo.collection.Collection,
+        logger: "Logger",
+        executor: Executor = None,
+    ):
+        """Initializes the players collection
+
+        Args:
+            col (pymongo.collection.Collection): The collection of the servers, the
+                players are kept next to it in `players`
+            logger (Logger): The logger class
+            executor (Executor, optional): Runs the async api. Defaults to the loop's
+                default executor.
+        """
+        self.servers = col
+        self.col = col.database["players"] if col is not None else None
+        self.logger = logger
+        self.executor = executor
+
+        # rows are coalesced per (uuid, ip, port) like the server upserts
+        self.writer = BulkWriter(self.col, logger)
+        self.indexes = IndexAdvisor(self.col, logger, indexes=INDEXES, sample_rate=0)
+
+    @staticmethod
+    def dashed(uuid: str) -> str:
+        """Returns a uuid in the dashed, lowercase form of the samples"""
+        uuid = uuid.replace("-", "").lower()
+        return f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
+
+    @staticmethod
+    def is_online_uuid(uuid: str) -> bool:
+        """Whether a uuid is a mojang (version 4) uuid, offline mode servers send
+        uuids derived from the name that can't be trusted to identify a player"""
+        return bool(UUID_RE.match(uuid.lower())) and Players.dashed(uuid)[14] == "4"
+
+    @staticmethod
+    def merge_sample(
+        old: list[dict], new: list[dict], cap: int = 100
+    ) -> tuple[list[dict], list[dict]]:
+        """Merges a fresh sample into a stored one, keyed by uuid
+
+        A player in both keeps the entry with the latest `lastSeen`, the fresh entry
+        on a tie, so renames win. The result is ordered most recent first and capped.
+
+        Args:
+            old (list[dict]): The stored sample
+            new (list[dict]): The fresh sample
+            cap (int, optional): Max players kept. Defaults to 100.
+
+        Returns:
+            tuple[list[dict], list[dict]]: The kept players, and the ones over the cap
+        """
+        merged: dict[str, dict] = {}
+        for player in (*old, *new):
+            uuid = player.get("id")
+            known = merged.get(uuid)
+            if known is None or (player.get("lastSeen") or 0) >= (
+                known.get("lastSeen") or 0
+            ):
+                merged[uuid] = player
+
+        players = sorted(
+            merged.values(), key=lambda i: i.get("lastSeen") or 0, reverse=True
+        )
+        return players[:cap], players[cap:]
+
+    def _put(self, uuid: str, name: str, ip: str, port: int, last: int) -> None:
+        key = {"uuid": uuid, "ip": ip, "port": port}
+        self.writer.put(
+            key,
+            {
+                "$set": {"name": name, "nameLower": name.lower()},
+                "$max": {"lastSeen": last},
+                "$min": {"firstSeen": last},
+            },
+            key=(uuid, ip, port),
+        )
+
+    def spill(self, ip: str, port: int, players: list[dict]) -> int:
+        """Keeps the players dropped from a capped sample in the collection
+
+        Args:
+            ip (str): The ip of the server
+            port (int): The port of the server
+            players (list[dict]): The dropped sample entries
+
+        Returns:
+            int: The number of players queued
+        """
+        queued = 0
+        for player in players:
+            uuid, name = player.get("id"), player.get("name")
+            if not uuid or uuid == FAKE_ID or not isinstance(name, str):
+                continue
+            self._put(uuid, name, ip, port, player.get("lastSeen") or 0)
+            queued += 1
+        return queued
+
+    def record(self, doc: dict) -> int:
+        """Queues the players seen in a server write
+
+        The sample of a doc keeps the players of earlier scans, only the ones whose
+        `lastSeen` is the doc's scan are written.
+
+        Args:
+            doc (dict): The server doc being written
+
+        Returns:
+            int: The number of players queued
+        """
+        sample = (doc.get("players") or {}).get("sample") or []
+        seen = doc.get("lastSeen") or 0
+        queued = 0
+        for player in sample:
+            uuid, name = player.get("id"), player.get("name")
+            last = player.get("lastSeen") or 0
+            if not uuid or uuid == FAKE_ID or not isinstance(name, str):
+                continue
+            if last < seen - 5 * 60:
+                continue
+
+            self._put(uuid, name, doc["ip"], doc["port"], last)
+            queued += 1
+        return queued
+
+    def servers_of(self, uuid: str, limit: int = 1000) -> list[dict]:
+        """Returns the servers a player was seen on, most recent first
+
+        Args:
+            uuid (str): The uuid of the player
+            limit (int, optional): Max servers. Defaults to 1000.
+
+        Returns:
+            list[dict]: `{"ip", "port", "firstSeen", "lastSeen", "serverLastSeen"}`
+        """
+        pipeline = [
+            {"$match": {"uuid": self.dashed(uuid)}},
+            {"$sort": {"lastSeen": -1}},
+            {"$limit": limit},
+            {
+                "$lookup": {
+                    "from": self.servers.name,
+                    "let": {"ip": "$ip", "port": "$port"},
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "$expr": {
+                                    "$and": [
+                                        {"$eq": ["$ip", "$$ip"]},
+                                        {"$eq": ["$port", "$$port"]},
+                                    ]
+                                }
+                            }
+                        },
+                        {"$project": {"_id": 0, "lastSeen": 1}},
+                    ],
+                    "as": "server",
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "ip": 1,
+                    "port": 1,
+                    "firstSeen": 1,
+                    "lastSeen": 1,
+                    "serverLastSeen": {"$first": "$server.lastSeen"},
+                }
+            },
+        ]
+        return list(self.col.aggregate(pipeline))
+
+    @staticmethod
+    def servers_match(servers: list[dict]) -> dict:
+        """Returns a servers filter matching a list of (ip, port) rows
+
+        The ips are grouped by port, one `$in` per port, so the filter stays small and
+        uses the `ip_port` index however many servers there are.
+
+        Args:
+            servers (list[dict]): `{"ip", "port"}` rows
+
+        Returns:
+            dict: The filter, matching nothing if there are no rows
+        """
+        by_port: dict[int, list[str]] = {}
+        for server in servers:
+            by_port.setdefault(server["port"], []).append(server["ip"])
+
+        if not by_port:
+            return {"_id": None}
+        return {
+            "$or": [{"ip": {"$in": ips}, "port": port} for port, ips in by_port.items()]
+        }
+
+    def server_match(self, uuid: str) -> dict:
+        """Returns a servers filter matching every server a player was seen on
+
+        Args:
+            uuid (str): The uuid of the player
+
+        Returns:
+            dict: The filter, see `servers_match`
+        """
+        # covered by the uuid_server index
+        rows = self.col.find(
+            {"uuid": self.dashed(uuid)}, {"_id": 0, "ip": 1, "port": 1}
+        )
+        return self.servers_match(list(rows))
+
+    def uuid_of(self, name: str) -> Optional[str]:
+        """Returns the uuid last seen with a name, if it is a mojang uuid
+
+        Args:
+            name (str): The player name
+
+        Returns:
+            Optional[str]: The dashed uuid, or None if the name wasn't seen
+        """
+        row = self.col.find_one(
+            {"nameLower": name.lower()},
+            {"_id": 0, "uuid": 1},
+            sort=[("lastSeen", -1)],
+        )
+        if row is None or not self.is_online_uuid(row["uuid"]):
+            return None
+        return self.dashed(row["uuid"])
+
+    async def _run(self, func: callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    async def async_servers_of(self, uuid: str, limit: int = 1000) -> list[dict]:
+        return await self._run(self.servers_of, uuid, limit)
+
+    async def async_server_match(self, uuid: str) -> dict:
+        return await self._run(self.server_match, uuid)
+
+    async def async_uuid_of(self, name: str) -> Optional[str]:
+        return await self._run(self.uuid_of, name)
+
+    def backfill(self) -> int:
+        """Builds the collection from the samples of the servers, if it is empty
+
+        Returns:
+            int: The number of rows
+        """
+        try:
+            if self.col.estimated_document_count() > 0:
+                return 0
+        except PyMongoError as err:
+            self.logger.error(f"Failed to count players: {err}")
+            return 0
+
+        start = time.perf_counter()
+        self.servers.aggregate(
+            [
+                {"$match": {"players.sample.0": {"$exists": True}}},
+                {"$unwind": "$players.sample"},
+                {
+                    "$match": {
+                        "players.sample.id": {"$ne": FAKE_ID},
+                        "players.sample.name": {"$type": "string"},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {
+                            "uuid": "$players.sample.id",
+                            "ip": "$ip",
+                            "port": "$port",
+                        },
+                        "name": {"$last": "$players.sample.name"},
+                        "firstSeen": {"$min": "$players.sample.lastSeen"},
+                        "lastSeen": {"$max": "$players.sample.lastSeen"},
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": 0,
+                        "uuid": "$_id.uuid",
+                        "ip": "$_id.ip",
+                        "port": "$_id.port",
+                        "name": 1,
+                        "nameLower": {"$toLower": "$name"},
+                        "firstSeen": 1,
+                        "lastSeen": 1,
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": self.col.name,
+                        "on": ["uuid", "ip", "port"],
+                        "whenMatched": "keepExisting",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        total = self.col.estimated_document_count()
+        self.logger.print(
+            f"Backfilled {total} players in {time.perf_counter() - start:.1f} seconds"
+        )
+        return total
+
+    def stats(self) -> dict:
+        """Returns the counters of the players writer"""
+        return self.writer.stats()
@@ -0,0 +1,235 @@
+"""Asyncio prober for the status and login of many servers at once."""
+
+import asyncio
+import json
+import traceback
+import zlib
+from typing import Iterable, Optional
+
+from mcstatus.protocol.connection import Connection
+
+from .logger import Logger
+from .protocol import frame, read_packet
+
+
+class Prober:
+    """Checks servers with the status and login start exchanges over asyncio streams"""
+
+    def __init__(
+        self,
+        logger: "Logger",
+        concurrency: int = 512,
+        connect_timeout: float = 5,
+        read_timeout: float = 5,
+        username: str = "Pilot1783",
+    ):
+        """Initializes the prober
+
+        Args:
+            logger (Logger): The logger class
+            concurrency (int, optional): The max number of open connections.
+                Defaults to 512.
+            connect_timeout (float, optional): Seconds to wait for a connection.
+                Defaults to 5.
+            read_timeout (float, optional): Seconds to wait for each response.
+                Defaults to 5.
+            username (str, optional): The username to log in with.
+                Defaults to "Pilot1783".
+        """
+        self.logger = logger
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.username = username
+
+        # semaphores are bound to the loop they are first used in
+        self._semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            for old in [i for i in self._semaphores if i.is_closed()]:
+                del self._semaphores[old]
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    async def _open(
+        self, ip: str, port: int
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.wait_for(
+            asyncio.open_connection(ip, port), self.connect_timeout
+        )
+
+    @staticmethod
+    def _handshake(ip: str, port: int, version: int, intention: int) -> bytes:
+        handshake = Connection()
+
+        handshake.write_varint(0)  # Packet ID
+        handshake.write_varint(version)  # Protocol version
+        handshake.write_utf(ip)  # Server address
+        handshake.write_ushort(int(port))  # Server port
+        handshake.write_varint(intention)  # 1 for status, 2 for login
+
+        return frame(handshake)
+
+    @staticmethod
+    async def _close(writer: asyncio.StreamWriter) -> None:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, asyncio.CancelledError):
+            pass
+
+    async def status(
+        self, ip: str, port: int = 25565, version: int = 47
+    ) -> Optional[dict]:
+        """Returns a status response dict
+
+        Args:
+            ip (str): The host to connect to
+            port (int, optional): The port to connect to. Defaults to 25565.
+            version (int, optional): The protocol version to use. Defaults to 47.
+
+        Returns:
+            Optional[dict]: The status response dict
+        """
+        async with self.semaphore:
+            try:
+                reader, writer = await self._open(ip, port)
+            except (asyncio.TimeoutError, OSError) as err:
+                self.logger.debug(f"Connection error for {ip}:{port} ({err!r})")
+                return None
+
+            try:
+                request = Connection()
+                request.write_varint(0)  # Packet ID
+
+                writer.write(self._handshake(ip, port, version, 1) + frame(request))
+                await writer.drain()
+
+                response = await asyncio.wait_for(
+                    read_packet(reader), self.read_timeout
+                )
+                res_id = response.read_varint()
+                if res_id != 0:
+                    self.logger.debug(f"Invalid packet ID received: {res_id}")
+                    return None
+
+                length = response.read_varint()
+                return json.loads(response.read(length).decode("utf8"))
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError) as err:
+                self.logger.debug(f"Connection error for {ip}:{port} ({err!r})")
+                return None
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+                return None
+            finally:
+                await self._close(writer)
+
+    async def join(
+        self,
+        ip: str,
+        port: int = 25565,
+        version: int = 47,
+        username: str = None,
+    ) -> str:
+        """Tries to log in and returns the type of the server
+
+        Args:
+            ip (str): The host to connect to
+            port (int, optional): The port to connect to. Defaults to 25565.
+            version (int, optional): The protocol version to use. Defaults to 47.
+            username (str, optional): The username to log in with.
+                Defaults to the prober's username.
+
+        Returns:
+            str: One of "CRACKED", "VANILLA", "MODDED", "OFFLINE" or "UNKNOWN",
+                the same types as `Server.join`
+        """
+        async with self.semaphore:
+            try:
+                reader, writer = await self._open(ip, port)
+            except (asyncio.TimeoutError, OSError) as err:
+                self.logger.debug(f"Connection error for {ip}:{port} ({err!r})")
+                return "OFFLINE"
+
+            try:
+                login_start = Connection()
+                login_start.write_varint(0)  # Packet ID
+                login_start.write_utf(username or self.username)  # Username
+
+                writer.write(self._handshake(ip, port, version, 2) + frame(login_start))
+                await writer.drain()
+
+                response = await asyncio.wait_for(
+                    read_packet(reader), self.read_timeout
+                )
+                _id = response.read_varint()
+                if _id == 3:
+                    # set compression, every packet after this has a data length
+                    response.read_varint()  # threshold
+                    response = await asyncio.wait_for(
+                        read_packet(reader), self.read_timeout
+                    )
+                    if response.read_varint() != 0:
+                        data = zlib.decompress(response.read(response.remaining()))
+                        response = Connection()
+                        response.receive(data)
+                    _id = response.read_varint()
+
+                if _id == 2:
+                    return "CRACKED"
+                elif _id == 0:
+                    reason = response.read_utf()
+                    return "MODDED" if "Forge" in reason else "VANILLA"
+                elif _id == 1:
+                    # encryption request, the server is in online mode
+                    return "VANILLA"
+                else:
+                    self.logger.debug(f"Unknown response from {ip}:{port}: {_id}")
+                    return "UNKNOWN"
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError) as err:
+                self.logger.debug(f"Connection error for {ip}:{port} ({err!r})")
+                return "OFFLINE"
+            except OSError as err:
+                self.logger.debug(f"Server {ip}:{port} did not respond ({err!r})")
+                return "UNKNOWN"
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+                return "OFFLINE"
+            finally:
+                await self._close(writer)
+
+    async def probe(self, ip: str, port: int = 25565) -> dict:
+        """Gets the status and type of a server
+
+        Args:
+            ip (str): The host to connect to
+            port (int, optional): The port to connect to. Defaults to 25565.
+
+        Returns:
+            dict: `{"ip", "port", "status", "type"}`, the status is None if the server
+                did not respond
+        """
+        port = int(port)
+        status = await self.status(ip, port)
+        if status is None:
+            return {"ip": ip, "port": port, "status": None, "type": "OFFLINE"}
+
+        version = status.get("version", {}).get("protocol", 47)
+        server_type = await self.join(ip, port, version)
+        return {"ip": ip, "port": port, "status": status, "type": server_type}
+
+    async def probe_many(self, targets: Iterable[tuple[str, int]]) -> list[dict]:
+        """Probes many servers at once, at most `concurrency` connections are open
+
+        Args:
+            targets (Iterable[tuple[str, int]]): The (ip, port) pairs to probe
+
+        Returns:
+            list[dict]: The results of `probe`, in the order of the targets
+        """
+        return await asyncio.gather(*(self.probe(ip, port) for ip, port in targets))
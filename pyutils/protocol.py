@@ -0,0 +1,161 @@
+"""Helpers for framing Minecraft packets over asyncio streams."""
+
+import asyncio
+import zlib
+from typing import Optional
+
+from cryptography.hazmat.primitives.ciphers import CipherContext
+from mcstatus.protocol.connection import Connection
+
+# packets larger than this are not valid minecraft packets (3 byte varint)
+MAX_PACKET_LENGTH = 2**21 - 1
+
+
+def pack_varint(value: int) -> bytes:
+    """Encodes an int as a varint
+
+    Args:
+        value (int): The value to encode, negative values are encoded as 32 bit
+
+    Returns:
+        bytes: The encoded varint
+    """
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def frame(packet: Connection) -> bytes:
+    """Returns the length prefixed bytes of a packet, ready to be sent
+
+    Args:
+        packet (Connection): The packet, the buffer is flushed
+
+    Returns:
+        bytes: The framed packet
+    """
+    data = packet.flush()
+    return pack_varint(len(data)) + bytes(data)
+
+
+async def read_varint(
+    reader: asyncio.StreamReader, decryptor: Optional[CipherContext] = None
+) -> int:
+    """Reads a varint from a stream
+
+    Args:
+        reader (asyncio.StreamReader): The stream to read from
+        decryptor (CipherContext, optional): Decrypts the stream. Defaults to None.
+
+    Raises:
+        ValueError: If the varint is longer than 5 bytes
+        asyncio.IncompleteReadError: If the stream ends early
+
+    Returns:
+        int: The decoded value
+    """
+    result = 0
+    for i in range(5):
+        data = await reader.readexactly(1)
+        if decryptor is not None:
+            data = decryptor.update(data)
+        byte = data[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            if result & (1 << 31):
+                result -= 1 << 32
+            return result
+
+    raise ValueError("Varint is too big")
+
+
+async def read_packet(
+    reader: asyncio.StreamReader,
+    max_length: int = MAX_PACKET_LENGTH,
+    threshold: int = 0,
+    decryptor: Optional[CipherContext] = None,
+) -> Connection:
+    """Reads one length prefixed packet from a stream
+
+    Args:
+        reader (asyncio.StreamReader): The stream to read from
+        max_length (int, optional): The largest accepted packet.
+            Defaults to MAX_PACKET_LENGTH.
+        threshold (int, optional): The compression threshold, compression is off
+            when <= 0. Defaults to 0.
+        decryptor (CipherContext, optional): Decrypts the stream, after the
+            encryption response. Defaults to None.
+
+    Raises:
+        ValueError: If the packet length is invalid
+
+    Returns:
+        Connection: The packet, ready for `read_varint`, `read_utf` and so on
+    """
+    length = await read_varint(reader, decryptor)
+    if not 0 < length <= max_length:
+        raise ValueError(f"Invalid packet length: {length}")
+
+    body = await reader.readexactly(length)
+    if decryptor is not None:
+        body = decryptor.update(body)
+    return unpack_packet(body, threshold)
+
+
+def pack_packet(data: bytes, threshold: int = 0) -> bytes:
+    """Frames a packet, compressing it once it reaches the threshold
+
+    Args:
+        data (bytes): The packet id and data
+        threshold (int, optional): The compression threshold, compression is off when
+            <= 0. Defaults to 0.
+
+    Returns:
+        bytes: The framed packet
+    """
+    data = bytes(data)
+    if threshold > 0:
+        if len(data) < threshold:
+            # sent uncompressed, with a data length of 0
+            data = pack_varint(0) + data
+        else:
+            data = pack_varint(len(data)) + zlib.compress(data)
+
+    return pack_varint(len(data)) + data
+
+
+def unpack_packet(body: bytes, threshold: int = 0) -> Connection:
+    """Decompresses the body of a frame
+
+    Args:
+        body (bytes): The frame without its length prefix
+        threshold (int, optional): The compression threshold, compression is off when
+            <= 0. Defaults to 0.
+
+    Returns:
+        Connection: The packet id and data
+    """
+    packet = Connection()
+    packet.receive(body)
+    if threshold <= 0:
+        return packet
+
+    uncomp_len = packet.read_varint()
+    data = packet.read(packet.remaining())
+    if uncomp_len != 0:
+        data = zlib.decompress(data)
+        if len(data) != uncomp_len:
+            raise ValueError(
+                f"Length mismatch when decompressing: {len(data)} != {uncomp_len}"
+            )
+
+    out = Connection()
+    out.receive(data)
+    return out
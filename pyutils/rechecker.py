@@ -0,0 +1,215 @@
+import asyncio
+import time
+import traceback
+from typing import Optional
+
+import sentry_sdk
+
+from .database import Database
+from .logger import Logger
+from .minecraft import Minecraft
+
+
+class Account:
+    """A minecraft account used to join servers"""
+
+    def __init__(self, name: str, token: str):
+        self.name = name
+        self.token = token
+
+        self.next_use = 0.0
+        self.joins = 0
+        self.disabled = False
+
+    def __repr__(self):
+        return f"Account({self.name}, joins={self.joins}, disabled={self.disabled})"
+
+
+class AccountPool:
+    """Hands out accounts so that each one joins at most once every `interval` seconds"""
+
+    def __init__(self, accounts: list[Account], interval: float = 2):
+        """Initializes the pool
+
+        Args:
+            accounts (list[Account]): The accounts to use
+            interval (float, optional): Min seconds between two joins of an account.
+                Defaults to 2.
+        """
+        self.accounts = accounts
+        self.interval = interval
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len([i for i in self.accounts if not i.disabled])
+
+    async def acquire(self) -> Optional[Account]:
+        """Waits for the next free join slot of any account
+
+        Returns:
+            Optional[Account]: The account, or None if every account is disabled
+        """
+        async with self.lock:
+            accounts = [i for i in self.accounts if not i.disabled]
+            if not accounts:
+                return None
+
+            # reserve the soonest slot, then wait for it outside the lock
+            account = min(accounts, key=lambda i: i.next_use)
+            now = time.monotonic()
+            delay = account.next_use - now
+            account.next_use = max(account.next_use, now) + self.interval
+            account.joins += 1
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return account
+
+    def disable(self, account: Account) -> None:
+        account.disabled = True
+
+
+class Rechecker:
+    """Re-checks the whitelist of many servers at once with a pool of accounts"""
+
+    def __init__(
+        self,
+        logger: "Logger",
+        db: "Database",
+        mc: "Minecraft",
+        accounts: AccountPool,
+        workers: int = None,
+    ):
+        """Initializes the rechecker
+
+        Args:
+            logger (Logger): The logger class
+            db (Database): The database class
+            mc (Minecraft): The minecraft class
+            accounts (AccountPool): The accounts to join with
+            workers (int, optional): The number of servers checked at once.
+                Defaults to 4 per account.
+        """
+        self.logger = logger
+        self.db = db
+        self.mc = mc
+        self.accounts = accounts
+        self.workers = workers or 4 * len(accounts.accounts)
+
+        self.counts: dict[str, int] = {}
+
+    @staticmethod
+    def whitelist_value(status: str) -> Optional[bool]:
+        """Maps the type of a join to the `whitelist` field
+
+        Args:
+            status (str): The status of `Minecraft.join`
+
+        Returns:
+            Optional[bool]: True if whitelisted, False if joinable, None if unknown
+        """
+        if status in ("WHITELISTED", "HONEY_POT"):
+            return True
+        elif status in ("PREMIUM", "MODDED"):
+            return False
+        return None
+
+    @staticmethod
+    def is_unreachable(status: str) -> bool:
+        """Whether a join failed before the server answered, nothing is learned"""
+        return status == "ERROR" or status.startswith("OFFLINE")
+
+    async def check(self, server: dict) -> Optional[str]:
+        """Joins a server and stores the result
+
+        Args:
+            server (dict): The server doc, with `_id`, `ip`, `port` and `version`
+
+        Returns:
+            Optional[str]: The status of the join, None if no account is left
+        """
+        while True:
+            account = await self.accounts.acquire()
+            if account is None:
+                return None
+
+            try:
+                s_type = await self.mc.join(
+                    ip=server["ip"],
+                    port=server["port"],
+                    player_username=account.name,
+                    mine_token=account.token,
+                    version=server.get("version", {}).get("protocol", -1),
+                )
+            except Exception as err:
+                self.logger.print(f"Error joining {server['ip']}")
+                self.logger.print(err)
+                sentry_sdk.capture_exception(err)
+                return "ERROR"
+
+            status = s_type.status
+            if status not in ("BAD_TOKEN", "NO_GAME"):
+                break
+
+            # the account can't join anything, try the server with another one
+            if not account.disabled:
+                self.logger.error(f"Disabling {account.name}: {status}")
+                self.accounts.disable(account)
+
+        if self.is_unreachable(status):
+            # leave the server unchecked, so the next run tries it again
+            return status
+
+        whitelist = self.whitelist_value(status)
+        if whitelist is True:
+            self.logger.print(f"Whitelisted: {server['ip']}")
+        elif whitelist is False:
+            self.logger.print(f"Premium: {server['ip']}")
+
+        await self.db.async_update_one(
+            {"_id": server["_id"]}, {"$set": {"whitelist": whitelist}}
+        )
+        return status
+
+    async def _worker(self, que: asyncio.Queue) -> None:
+        while True:
+            server = await que.get()
+            try:
+                if server is None or not len(self.accounts):
+                    return
+
+                status = await self.check(server)
+                self.counts[status] = self.counts.get(status, 0) + 1
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+            finally:
+                que.task_done()
+
+    async def run(self, pipeline: list) -> dict[str, int]:
+        """Re-checks every server of a pipeline
+
+        Args:
+            pipeline (list): The pipeline of the servers to check
+
+        Returns:
+            dict[str, int]: The number of servers per join status
+        """
+        pipeline = pipeline + [
+            {"$project": {"_id": 1, "ip": 1, "port": 1, "version.protocol": 1}}
+        ]
+        servers = await self.db.async_aggregate(pipeline)
+        self.logger.print(
+            f"Checking {len(servers)} servers with {len(self.accounts)} accounts"
+        )
+
+        que = asyncio.Queue()
+        for server in servers:
+            que.put_nowait(server)
+        for _ in range(self.workers):
+            que.put_nowait(None)
+
+        await asyncio.gather(*(self._worker(que) for _ in range(self.workers)))
+
+        self.logger.print(f"Finished checking servers: {self.counts}")
+        return self.counts
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import queue
 import random
@@ -11,12 +12,20 @@ from netaddr import IPNetwork
 
 
 class Scanner:
-    def __init__(self, logger_func, serverLib, max_thread_count=10, max_ping_rate=1000):
+    def __init__(
+        self,
+        logger_func,
+        serverLib,
+        max_thread_count=10,
+        max_ping_rate=1000,
+        max_probe_count=512,
+    ):
         self.STOP = False
         self.logger = logger_func
         self.que = queue.Queue()
         self.max_threads = max_thread_count
         self.max_pps = max_ping_rate
+        self.max_probes = max_probe_count
         self.serverLib = serverLib
         self.counts = [0]
 
@@ -42,7 +51,7 @@ class Scanner:
         random.shuffle(ranges)
 
         threading.Thread(target=self.stats).start()
-        threading.Thread(target=self.test_starter, args=(self.logger,)).start()
+        threading.Thread(target=self.test_starter).start()
         self.scan_starter(ranges)
 
     @staticmethod
@@ -102,13 +111,49 @@ class Scanner:
 
     def test_starter(self):
         self.logger.debug("Starting tests")
+        asyncio.run(self.async_test_starter())
+
+    def next_batch(self, size: int, timeout: float = 5) -> list[str]:
+        """Waits for an ip to be queued, then takes up to `size` ips from the que"""
+        try:
+            batch = [self.que.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < size:
+            try:
+                batch.append(self.que.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def async_test_server(self, ip: str):
+        self.logger.debug(f"Testing {ip}")
+        ip, port = ip.split(":")
+        await self.serverLib.async_update(host=ip, port=port, fast=False)
+
+    async def async_test_starter(self):
+        loop = asyncio.get_running_loop()
+        tasks = set()
         while not self.STOP:
-            if self.que.qsize() > 0:
-                ip = self.que.get()
-                self.test_server(ip)
-            else:
-                self.logger.debug("No ips in que, sleeping")
-                time.sleep(30)
+            if len(tasks) >= self.max_probes:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            # blocks in a thread until ips are queued, probes keep running meanwhile
+            batch = await loop.run_in_executor(
+                None, self.next_batch, self.max_probes - len(tasks)
+            )
+            if not batch and not tasks:
+                self.logger.debug("No ips in que, waiting")
+
+            for ip in batch:
+                task = asyncio.create_task(self.async_test_server(ip))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     def stats(self):
         while True:
@@ -1,19 +1,23 @@
 """Class for server connection and communication.
 """
+import asyncio
 import datetime
 import json
+import random
 import re
 import socket
 import threading
 import traceback
 from typing import Optional, Mapping, Any
 
-import ipinfo
 from bson import json_util
 from mcstatus.protocol.connection import Connection, TCPSocketConnection
 
+from .cache import TTLCache
 from .database import Database
+from .geo import GeoResolver
 from .logger import Logger
+from .prober import Prober
 from .text import Text
 
 
@@ -74,137 +78,213 @@ class Server:
         logger: "Logger",
         text: "Text",
         ipinfo_token: str,
+        prober: "Prober" = None,
+        geo: "GeoResolver" = None,
+        sample_cap: int = 100,
     ):
         self.db = db
         self.logger = logger
         self.text = text
-        self.ipinfoHandle = ipinfo.getHandler(ipinfo_token)
+        self.prober = prober if prober is not None else Prober(logger)
+        self.geo = geo if geo is not None else GeoResolver(logger, ipinfo_token)
+        self.geo.callbacks.append(self._save_geo)
+        # the rollup only counts upserts once they are written
+        self.db.writer.callbacks.append(self._record_stats)
+        # max players kept in `players.sample`, older ones only live in `players`
+        self.sample_cap = sample_cap
+
+        # (ip, port) -> (doc,) of recent probes, and the probes in flight
+        self.probe_ttl = 30
+        self.probes = TTLCache(maxsize=4096, ttl=self.probe_ttl)
+        self.flights: dict[tuple[str, int], dict] = {}
+        self.flight_lock = threading.Lock()
+        self.async_flights: dict[tuple[str, int], asyncio.Future] = {}
+        self.probe_stats = {"hits": 0, "misses": 0, "coalesced": 0}
 
     def update(
         self,
         host: str,
         port: int = 25565,
         fast: bool = False,
+        max_age: Optional[float] = None,
     ) -> Optional[Mapping[str, Any]]:
         """
         Update a server and return a doc, returns either, None or Mapping[str, Any]
+
+        Probes are cached for `probe_ttl` seconds, and callers probing a server that is
+        already being probed wait for that probe instead of starting another one.
+
+        Args:
+            host (str): The host to check
+            port (int, optional): The port to check. Defaults to 25565.
+            fast (bool, optional): Only return the stored doc. Defaults to False.
+            max_age (float, optional): Max seconds since a cached probe, 0 to always
+                probe. Defaults to `probe_ttl`.
         """
+        if fast:
+            return self._update(host, port, fast=True)
+
+        key = (host, int(port))
+        cached = self._cached_probe(key, max_age)
+        if cached is not None:
+            return self._copy_doc(cached[0])
+
+        with self.flight_lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = {"event": threading.Event()}
+
+        if not leader:
+            self.probe_stats["coalesced"] += 1
+            flight["event"].wait()
+            return self._copy_doc(flight.get("result"))
+
+        try:
+            result = self._update(host, port)
+            flight["result"] = result
+            self.probes.set(key, (result,))
+        finally:
+            with self.flight_lock:
+                del self.flights[key]
+            flight["event"].set()
+
+        return self._copy_doc(result)
+
+    def _update(
+        self,
+        host: str,
+        port: int = 25565,
+        fast: bool = False,
+    ) -> Optional[Mapping[str, Any]]:
         status = None
         try:
             port = int(port)
-            status = {
-                "ip": host,
-                "port": port,
-                "version": {"protocol": -1, "name": "UNKNOWN"},
-                "description": "",
-                "players": {"online": 0, "max": 0},
-                "hasForgeData": False,
-                "cracked": False,
-                "lastSeen": 0,
-            }
-            geo = {}
-            # fetch info from ipinfo
-            try:
-                if re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", host):
-                    geo_data = self.ipinfoHandle.getDetails(
-                        status["ip"]
-                    ).all  # technically, \
-                    # this uses requests and not aiohttp and is not asynchronous
-                    geo["lat"] = float(geo_data["latitude"])
-                    geo["lon"] = float(geo_data["longitude"])
-                    geo["country"] = str(geo_data["country"])
-                    geo["city"] = str(geo_data["city"])
-                    if "org" in geo_data:
-                        geo["org"] = str(geo_data["org"])
-            except Exception as err:
-                self.logger.warning(f"Failed to get geo for {host}")
-                self.logger.print(err)
-                self.logger.print(f"{traceback.format_exc()}")
-
-            # if the server is in the db, then get the db doc
-            if self.db.col.find_one({"ip": host, "port": port}) is not None:
-                # set the status to the database values
-                db_val = self.db.col.find_one({"ip": host, "port": port})
-                status = db_val.copy()
-                status["description"] = (
-                    self.text.motd_parse(status["description"])
-                    if "description" in status
-                    else ""
-                )
-                status["cracked"] = db_val["cracked"] if "cracked" in db_val else False
-                if "sample" in status["players"]:
-                    players = []
-                    for player in status["players"]["sample"]:
-                        players.append(self.Player(**player))
-                    status["players"]["sample"] = players
-            else:
-                self.logger.info(f"Server {host}:{port} not found in database")
-
-            if geo != {}:
-                status["geo"] = geo
-                if "org" in geo:
-                    status["org"] = geo["org"]
-                    # remove the org from the geo dict
-                    del status["geo"]["org"]
+            status = self._base_status(host, port)
 
             if fast:
                 self.logger.info(f"Got fast status for {host}: {status}")
                 return json_util.loads(json_util.dumps(status))
 
             # get the status response
-            status2 = self.status(host)
+            status2 = self.status(host, port)
 
             if status2 is None:
                 self.logger.warning(f"Failed to get status for {host}")
                 return status
+            status = self._merge_status(host, status, status2)
+
+            server_type = self.join(
+                ip=host, port=port, version=status["version"]["protocol"]
+            )
+
+            return self._finish_status(host, port, status, server_type)
+        except Exception as err:
+            self.logger.warning(err)
+            self.logger.print(f"{traceback.format_exc()}")
+
+            if status is not None:
+                self.update_db(status)
+                return status
             else:
-                if "sample" in status2["players"]:
-                    players = []
-                    for player in status2["players"]["sample"]:
-                        player["lastSeen"] = int(datetime.datetime.utcnow().timestamp())
-                        players.append(self.Player(**player))
-                    status2["players"]["sample"] = players
-                status = self.text.update_dict(status, status2)
-                self.logger.info(f"Got status for {host}: {status}")
-
-            server_type = (
-                self.join(ip=host, port=port, version=status["version"]["protocol"])
-                if not fast
-                else self.ServerType(host, status["version"]["protocol"], "UNKNOWN")
+                return None
+
+    async def async_update(
+        self,
+        host: str,
+        port: int = 25565,
+        fast: bool = False,
+        max_age: Optional[float] = None,
+    ) -> Optional[Mapping[str, Any]]:
+        """Same as `update`, but the server is checked with the asyncio prober
+
+        Args:
+            host (str): The host to check
+            port (int, optional): The port to check. Defaults to 25565.
+            fast (bool, optional): Only return the stored doc. Defaults to False.
+            max_age (float, optional): Max seconds since a cached probe, 0 to always
+                probe. Defaults to `probe_ttl`.
+
+        Returns:
+            Optional[Mapping[str, Any]]: The updated doc
+        """
+        if fast:
+            return await self._async_update(host, port, fast=True)
+
+        key = (host, int(port))
+        cached = self._cached_probe(key, max_age)
+        if cached is not None:
+            return self._copy_doc(cached[0])
+
+        future = self.async_flights.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(self._async_update(host, port))
+            self.async_flights[key] = future
+
+            def done(fut: asyncio.Future):
+                if self.async_flights.get(key) is fut:
+                    del self.async_flights[key]
+                if not fut.cancelled() and fut.exception() is None:
+                    self.probes.set(key, (fut.result(),))
+
+            future.add_done_callback(done)
+        else:
+            self.probe_stats["coalesced"] += 1
+
+        # shielded, so a cancelled caller does not cancel the probe of the others
+        return self._copy_doc(await asyncio.shield(future))
+
+    def _cached_probe(self, key: tuple[str, int], max_age: Optional[float]):
+        """Returns `(doc,)` if a probe of a server is cached, otherwise None"""
+        if max_age is not None and max_age <= 0:
+            cached = None
+        else:
+            cached = self.probes.get(key, max_age=max_age)
+
+        if cached is None:
+            self.probe_stats["misses"] += 1
+        else:
+            self.probe_stats["hits"] += 1
+        return cached
+
+    @staticmethod
+    def _copy_doc(doc: Optional[Mapping[str, Any]]) -> Optional[Mapping[str, Any]]:
+        # every caller gets its own copy of a shared probe result
+        if doc is None:
+            return None
+        return json_util.loads(json_util.dumps(doc))
+
+    async def _async_update(
+        self,
+        host: str,
+        port: int = 25565,
+        fast: bool = False,
+    ) -> Optional[Mapping[str, Any]]:
+        status = None
+        try:
+            port = int(port)
+            loop = asyncio.get_running_loop()
+            status = await loop.run_in_executor(
+                self.db.executor, self._base_status, host, port
             )
 
-            status["cracked"] = server_type.get_type() == "CRACKED"
+            if fast:
+                self.logger.info(f"Got fast status for {host}: {status}")
+                return json_util.loads(json_util.dumps(status))
 
-            status["ip"] = host
-            status["port"] = port
-            status["lastSeen"] = int(datetime.datetime.utcnow().timestamp())
-            status["hasFavicon"] = "favicon" in status
-            status["hasForgeData"] = server_type.get_type() == "MODDED"
-            status["description"] = (
-                self.text.motd_parse(status["description"])
-                if "description" in status
-                else ""
+            status2 = await self.prober.status(host, port)
+
+            if status2 is None:
+                self.logger.warning(f"Failed to get status for {host}")
+                return status
+            status = self._merge_status(host, status, status2)
+
+            version = status["version"]["protocol"]
+            server_type = self.ServerType(
+                host, version, await self.prober.join(host, port, version)
             )
 
-            if "forgeData" in status:
-                mod_channels = status["forgeData"]["channels"]
-                mod_ids = [i["modId"] for i in status["forgeData"]["mods"]]
-                del status["forgeData"]
-                mods = []
-                for mod in mod_channels:
-                    name = " (".join(mod["res"].split(":")) + ")"
-                    version = mod["version"]
-                    req = mod["required"]
-                    _id = mod_ids[mod_channels.index(mod)]
-
-                    mods.append(
-                        {"name": name, "version": version, "required": req, "id": _id}
-                    )
-                status["mods"] = mods
-
-            self.update_db(status)
-
-            return json_util.loads(json_util.dumps(status))
+            return self._finish_status(host, port, status, server_type)
         except Exception as err:
             self.logger.warning(err)
             self.logger.print(f"{traceback.format_exc()}")
@@ -215,6 +295,173 @@ class Server:
             else:
                 return None
 
+    def _base_status(self, host: str, port: int) -> dict:
+        """Returns the stored doc of a server with fresh geo data, or a blank doc
+
+        Args:
+            host (str): The host of the server
+            port (int): The port of the server
+
+        Returns:
+            dict: The status doc
+        """
+        status = {
+            "ip": host,
+            "port": port,
+            "version": {"protocol": -1, "name": "UNKNOWN"},
+            "description": "",
+            "players": {"online": 0, "max": 0},
+            "hasForgeData": False,
+            "cracked": False,
+            "lastSeen": 0,
+        }
+        # cached geo, unknown IPs are resolved in the background and saved later
+        geo = None
+        if re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", host):
+            geo = self.geo.lookup(host)
+
+        # if the server is in the db, then get the db doc
+        db_val = self.db.col.find_one({"ip": host, "port": port})
+        self.db.stats.seen((host, port), db_val)
+        if db_val is not None:
+            # set the status to the database values
+            status = db_val.copy()
+            status["description"] = (
+                self.text.motd_parse(status["description"])
+                if "description" in status
+                else ""
+            )
+            status["cracked"] = db_val["cracked"] if "cracked" in db_val else False
+            if "sample" in status["players"]:
+                players = []
+                for player in status["players"]["sample"]:
+                    players.append(self.Player(**player))
+                status["players"]["sample"] = players
+        else:
+            self.logger.info(f"Server {host}:{port} not found in database")
+
+        if geo:
+            status.update(self.geo_fields(geo))
+
+        return status
+
+    @staticmethod
+    def geo_fields(geo: dict) -> dict:
+        """Returns the `geo` and `org` fields of a doc for a resolved geo
+
+        Args:
+            geo (dict): The result of `GeoResolver.lookup`
+
+        Returns:
+            dict: The fields to set
+        """
+        fields = {"geo": {k: v for k, v in geo.items() if k != "org"}}
+        if "org" in geo:
+            fields["org"] = geo["org"]
+        return fields
+
+    def _save_geo(self, results: dict[str, dict]):
+        """Writes the geo of IPs resolved in the background to their servers
+
+        Args:
+            results (dict[str, dict]): ip -> geo
+        """
+        # one round trip for the batch, geo isn't part of any cached count
+        self.db.bulk_update(
+            [
+                ({"ip": ip}, {"$set": self.geo_fields(geo)})
+                for ip, geo in results.items()
+                if geo
+            ]
+        )
+
+    def _record_stats(self, written: list[tuple[dict, dict]]):
+        """Adds the server upserts written by the bulk writer to the stats rollup
+
+        Args:
+            written (list[tuple[dict, dict]]): The (query, update) pairs written
+        """
+        for query, update in written:
+            self.db.stats.record((query["ip"], query["port"]), update["$set"])
+
+    def _merge_status(self, host: str, status: dict, status2: dict) -> dict:
+        """Merges a status response into the stored doc
+
+        Args:
+            host (str): The host of the server
+            status (dict): The stored doc
+            status2 (dict): The status response
+
+        Returns:
+            dict: The merged doc
+        """
+        sample = None
+        if "sample" in status2["players"]:
+            now = int(datetime.datetime.utcnow().timestamp())
+            sample = []
+            for player in status2["players"].pop("sample"):
+                player["lastSeen"] = now
+                sample.append(self.Player(**player))
+        status = self.text.update_dict(status, status2)
+
+        if sample is not None:
+            # merged by uuid, not by update_dict, so the sample stays bounded
+            status["players"]["sample"], dropped = self.db.players.merge_sample(
+                status["players"].get("sample") or [], sample, self.sample_cap
+            )
+            if dropped:
+                self.db.players.spill(host, status["port"], dropped)
+        self.logger.info(f"Got status for {host}: {status}")
+
+        return status
+
+    def _finish_status(
+        self, host: str, port: int, status: dict, server_type: ServerType
+    ) -> Mapping[str, Any]:
+        """Fills in the derived fields of a doc and queues it to be written
+
+        Args:
+            host (str): The host of the server
+            port (int): The port of the server
+            status (dict): The merged doc
+            server_type (ServerType): The result of joining the server
+
+        Returns:
+            Mapping[str, Any]: The finished doc
+        """
+        status["cracked"] = server_type.get_type() == "CRACKED"
+
+        status["ip"] = host
+        status["port"] = port
+        status["lastSeen"] = int(datetime.datetime.utcnow().timestamp())
+        status["hasFavicon"] = "favicon" in status
+        status["hasForgeData"] = server_type.get_type() == "MODDED"
+        status["description"] = (
+            self.text.motd_parse(status["description"])
+            if "description" in status
+            else ""
+        )
+
+        if "forgeData" in status:
+            mod_channels = status["forgeData"]["channels"]
+            mod_ids = [i["modId"] for i in status["forgeData"]["mods"]]
+            del status["forgeData"]
+            mods = []
+            for mod in mod_channels:
+                name = " (".join(mod["res"].split(":")) + ")"
+                version = mod["version"]
+                req = mod["required"]
+                _id = mod_ids[mod_channels.index(mod)]
+
+                mods.append(
+                    {"name": name, "version": version, "required": req, "id": _id}
+                )
+            status["mods"] = mods
+
+        self.update_db(status)
+
+        return json_util.loads(json_util.dumps(status))
+
     def status(
         self,
         ip: str,
@@ -416,11 +663,41 @@ class Server:
         data2 = data.copy()
         if "favicon" in data2:
             del data2["favicon"]
+        try:
+            # indexed, so subnets can be searched with range queries
+            data2["ipInt"] = self.text.ip_int(data2["ip"])
+        except ValueError:
+            pass
+        # indexed, so description and sign searches don't scan every doc
+        data2.update(self.text.search_grams(data2))
+        if "players" in data2:
+            # indexed, so /streamers can find the servers a streamer was seen on
+            data2["players"] = {
+                **data2["players"],
+                "sampleNames": self.text.sample_names(data2),
+            }
+        self._update_db(data2)
 
-        threading.Thread(target=self._update_db, args=(data2,)).start()
+    @staticmethod
+    def upsert_update(data: dict) -> dict:
+        """Returns the update of a server upsert
+
+        The doc read by `_base_status` carries `_id` and `rand`, neither is set again:
+        `_id` is immutable, and `rand` is only set on insert, a path in both `$set`
+        and `$setOnInsert` fails the write.
+
+        Args:
+            data (dict): The server doc
+
+        Returns:
+            dict: The update operators
+        """
+        fields = {k: v for k, v in data.items() if k not in ("_id", "rand")}
+        # rand orders random sorts, see Database.random_stages
+        return {"$set": fields, "$setOnInsert": {"rand": random.random()}}
 
     def _update_db(self, data: dict):
-        """Updates the database with the given data
+        """Queues the given data to be written by the bulk writer
 
         Args:
             data (dict): The data to update the database with
@@ -432,11 +709,14 @@ class Server:
                 for player in data["players"]["sample"]:
                     # convert back to json
                     players.append(dict(player))
-                data["players"]["sample"] = players
-            self.db.update_one(
+                # copy so the caller's status keeps its Player objects
+                data["players"] = {**data["players"], "sample": players}
+                # the players collection, read by /player and /find
+                self.db.players.record(data)
+            self.db.queue_upsert(
                 {"ip": data["ip"], "port": data["port"]},
-                {"$set": data},
-                upsert=True,
+                self.upsert_update(data),
+                key=(data["ip"], data["port"]),
             )
         except Exception as err:
             self.logger.print(f"{traceback.format_exc()}")
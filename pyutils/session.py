@@ -0,0 +1,202 @@
+import atexit
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from bson import json_util
+
+from .cache import TTLCache
+from .logger import Logger
+
+
+class SessionStore:
+    """Keeps the state of the server messages, keyed by message id
+
+    A session holds the pipeline and index a message shows and the last doc rendered,
+    so a button click doesn't need to download the `pipeline.ason` attachment. Sessions
+    are kept in an LRU cache with a TTL and, optionally, in sqlite so they survive a
+    restart. A render sets its session more than once, the row is only written when
+    the pipeline or index changed, or to keep it from expiring. Rows are written in
+    batches by a background thread, so interaction handlers never wait on sqlite.
+    """
+
+    def __init__(
+        self,
+        logger: "Logger",
+        maxsize: int = 4096,
+        ttl: float = 24 * 60 * 60,
+        cache_path: Optional[str] = "sessions.sqlite",
+        interval: float = 1,
+    ):
+        """Initializes the store
+
+        Args:
+            logger (Logger): The logger class
+            maxsize (int, optional): Max sessions in memory. Defaults to 4096.
+            ttl (float, optional): Seconds a session is kept after its last update.
+                Defaults to 1 day.
+            cache_path (str, optional): The sqlite file of the persistent store, None
+                to only keep sessions in memory. Defaults to "sessions.sqlite".
+            interval (float, optional): Max seconds a row waits to be written.
+                Defaults to 1.
+        """
+        self.logger = logger
+        self.ttl = ttl
+        # seconds before an unchanged session is written again to renew it
+        self.touch_interval = min(ttl / 2, 60 * 60)
+
+        # message id -> session, the pipeline and doc are kept serialized so callers
+        # can change what they get without changing the session
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        self.db_lock = threading.Lock()
+        self.db: Optional[sqlite3.Connection] = None
+        if cache_path is not None:
+            try:
+                self.db = sqlite3.connect(cache_path, check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY, "
+                    "pipeline TEXT NOT NULL, idx INTEGER NOT NULL, updated REAL NOT NULL)"
+                )
+                self.db.execute(
+                    "DELETE FROM sessions WHERE updated < ?", (time.time() - ttl,)
+                )
+                self.db.commit()
+            except sqlite3.Error as err:
+                self.logger.warning(f"Failed to open the session store: {err}")
+                self.db = None
+
+        # message id -> row waiting for the writer thread
+        self.rows: dict[int, tuple] = {}
+        self.interval = interval
+        self.rows_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def set(self, message_id: int, pipeline: list | dict, index: int):
+        """Stores the pipeline and index a message shows
+
+        Args:
+            message_id (int): The id of the message
+            pipeline (list | dict): The pipeline of the message
+            index (int): The index of the shown server
+        """
+        message_id = int(message_id)
+        old = self.cache.get(message_id) or {}
+        dumped = json_util.dumps(pipeline)
+        now = time.time()
+        unchanged = old.get("pipeline") == dumped and old.get("index") == index
+        session = {
+            "pipeline": dumped,
+            "index": index,
+            # the doc is only kept while the message shows the same index
+            "doc": old.get("doc") if old.get("index") == index else None,
+            "written": old.get("written", 0) if unchanged else 0,
+        }
+        self.cache.set(message_id, session)
+
+        if self.db is None or now - session["written"] < self.touch_interval:
+            return
+        session["written"] = now
+        with self.rows_lock:
+            self.rows[message_id] = (message_id, dumped, index, now)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="session-writer", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self) -> int:
+        """Writes the queued rows
+
+        Returns:
+            int: The number of rows written
+        """
+        with self.rows_lock:
+            rows, self.rows = list(self.rows.values()), {}
+        if not rows or self.db is None:
+            return 0
+
+        try:
+            with self.db_lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO sessions (id, pipeline, idx, updated) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self.db.commit()
+        except sqlite3.Error as err:
+            self.logger.warning(f"Failed to save {len(rows)} sessions: {err}")
+            return 0
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as err:
+                self.logger.warning(f"Failed to save sessions: {err}")
+
+    def set_doc(self, message_id: int, doc: dict) -> None:
+        """Stores the last doc rendered in a message
+
+        Args:
+            message_id (int): The id of the message
+            doc (dict): The doc
+        """
+        session = self.cache.get(int(message_id))
+        if session is not None:
+            session["doc"] = json_util.dumps(doc)
+
+    def get(self, message_id: int) -> Optional[dict]:
+        """Returns the session of a message
+
+        Args:
+            message_id (int): The id of the message
+
+        Returns:
+            Optional[dict]: `{"pipeline", "index", "doc"}`, the doc is None
+                if it is not known, or None if the message has no session
+        """
+        message_id = int(message_id)
+        session = self.cache.get(message_id)
+        if session is None:
+            session = self._disk_get(message_id)
+            if session is None:
+                self.misses += 1
+                return None
+            self.cache.set(message_id, session)
+        self.hits += 1
+
+        return {
+            "pipeline": json_util.loads(session["pipeline"]),
+            "index": session["index"],
+            "doc": json_util.loads(session["doc"]) if session["doc"] else None,
+        }
+
+    def _disk_get(self, message_id: int) -> Optional[dict]:
+        if self.db is None:
+            return None
+        with self.rows_lock:
+            # evicted from the cache before the writer got to it
+            row = self.rows.get(message_id)
+        if row is not None:
+            row = row[1:]
+        else:
+            with self.db_lock:
+                row = self.db.execute(
+                    "SELECT pipeline, idx, updated FROM sessions WHERE id = ?",
+                    (message_id,),
+                ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return {"pipeline": row[0], "index": row[1], "doc": None, "written": row[2]}
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of the store"""
+        return {"hits": self.hits, "misses": self.misses, "sessions": len(self.cache)}
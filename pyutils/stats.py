@@ -0,0 +1,364 @@
+import asyncio
+import atexit
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Hashable, Optional
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+from .cache import TTLCache
+from .logger import Logger
+
+# the sample id of players hidden by the server
+FAKE_ID = "00000000-0000-0000-0000-000000000000"
+
+# servers counted in the player and version stats
+VALID_MATCH = {
+    "players.online": {"$lt": 150000, "$gt": 0},
+    "version.name": {"$nin": ["Unknown", "UNKNOWN", None]},
+}
+
+# the per value tables of the rollup
+TABLES = ("orgs", "versions", "protocols")
+
+
+class Stats:
+    """Keeps a rollup document of the stats shown by /stats
+
+    Every server write adds the difference between the new and the stored doc to
+    in-memory counters, a background thread adds them to the rollup with one `$inc`.
+    A full recount replaces the rollup every `reconcile_interval`, fixing the drift of
+    writes that didn't go through `record` (ex: whitelist rechecks).
+    """
+
+    def __init__(
+        self,
+        col: pymongo.collection.Collection,
+        logger: "Logger",
+        executor: Executor = None,
+        interval: float = 10,
+        reconcile_interval: float = 6 * 60 * 60,
+    ):
+        """Initializes the stats
+
+        Args:
+            col (pymongo.collection.Collection): The collection of the servers
+            logger (Logger): The logger class
+            executor (Executor, optional): Runs the async api. Defaults to the loop's
+                default executor.
+            interval (float, optional): Max seconds before deltas are written.
+                Defaults to 10.
+            reconcile_interval (float, optional): Seconds between full recounts.
+                Defaults to 6 hours.
+        """
+        self.col = col
+        self.logger = logger
+        self.executor = executor
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+
+        # the rollup is stored in the `stats` collection, under the collection's name
+        self.rollup = col.database["stats"] if col is not None else None
+        self.rollup_id = col.name if col is not None else None
+
+        # (ip, port) -> the contribution of the stored doc, from the last read or write
+        self.known = TTLCache(maxsize=65536, ttl=10 * 60)
+        self.deltas: Counter = Counter()
+        self.lock = threading.Lock()
+        self.reconcile_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+        self.recorded = 0
+        self.untracked = 0
+
+    @staticmethod
+    def encode(value) -> str:
+        """Returns a table value as a field name, without `.` and a leading `$`"""
+        value = str(value).replace(".", "．")
+        if value.startswith("$"):
+            value = "＄" + value[1:]
+        return value or "-"
+
+    @staticmethod
+    def decode(name: str) -> str:
+        """Reverses `encode`"""
+        name = name.replace("．", ".")
+        if name.startswith("＄"):
+            name = "$" + name[1:]
+        return name
+
+    @staticmethod
+    def contribution(doc: Optional[dict]) -> Counter:
+        """Returns the counters a server doc adds to the rollup
+
+        Args:
+            doc (Optional[dict]): The server doc, None if it doesn't exist
+
+        Returns:
+            Counter: field -> amount, table fields are `table.value`
+        """
+        out = Counter()
+        if doc is None:
+            return out
+
+        out["servers"] = 1
+        players = doc.get("players") or {}
+        version = doc.get("version") or {}
+
+        online = players.get("online")
+        valid = (
+            isinstance(online, (int, float))
+            and 0 < online < 150000
+            and version.get("name") not in ("Unknown", "UNKNOWN", None)
+        )
+        if valid:
+            out["players"] = online
+            out["versions." + Stats.encode(version["name"])] = 1
+            out["protocols." + Stats.encode(version.get("protocol"))] = 1
+
+        for player in players.get("sample") or []:
+            out["samplePlayers"] += 1
+            out["fakePlayers" if player["id"] == FAKE_ID else "realPlayers"] += 1
+
+        if doc.get("org") is not None:
+            out["orgs." + Stats.encode(doc["org"])] = 1
+        for flag in ("cracked", "hasFavicon", "hasForgeData"):
+            if doc.get(flag) is True:
+                out[flag] = 1
+        if "whitelist" in doc:
+            out["whitelistKnown"] = 1
+            if doc["whitelist"] is True:
+                out["whitelisted"] = 1
+
+        return out
+
+    def seen(self, key: Hashable, doc: Optional[dict]) -> None:
+        """Remembers the stored doc of a server before it is updated
+
+        Args:
+            key (Hashable): The server, ex: `(ip, port)`
+            doc (Optional[dict]): The stored doc, None if the server is new
+        """
+        self.known.set(key, self.contribution(doc))
+
+    def record(self, key: Hashable, doc: dict) -> None:
+        """Adds the change of a server doc to the rollup
+
+        Args:
+            key (Hashable): The server, ex: `(ip, port)`
+            doc (dict): The fields written to the doc
+        """
+        new = self.contribution(doc)
+        old = self.known.get(key)
+        self.known.set(key, new)
+        if old is None:
+            # the stored doc is unknown, the next reconcile counts it
+            self.untracked += 1
+            return
+
+        with self.lock:
+            self.deltas.update(new)
+            self.deltas.subtract(old)
+            self.recorded += 1
+        self._start()
+
+    def flush(self) -> None:
+        """Adds the pending deltas to the rollup"""
+        with self.lock:
+            deltas = {k: v for k, v in self.deltas.items() if v}
+            self.deltas.clear()
+        if not deltas:
+            return
+
+        try:
+            self.rollup.update_one(
+                {"_id": self.rollup_id}, {"$inc": deltas}, upsert=True
+            )
+        except PyMongoError as err:
+            # keep them for the next flush
+            with self.lock:
+                self.deltas.update(deltas)
+            self.logger.error(f"Failed to write stats: {err}")
+
+    @staticmethod
+    def _count_if(condition: dict) -> dict:
+        return {"$sum": {"$cond": [condition, 1, 0]}}
+
+    def recount(self) -> dict:
+        """Counts every stat with one pass over the collection
+
+        Returns:
+            dict: The rollup fields
+        """
+        pipeline = [
+            {
+                "$facet": {
+                    "servers": [{"$count": "n"}],
+                    "players": [
+                        {"$match": VALID_MATCH},
+                        {"$group": {"_id": None, "n": {"$sum": "$players.online"}}},
+                    ],
+                    "samples": [
+                        {"$unwind": "$players.sample"},
+                        {
+                            "$group": {
+                                "_id": {"$eq": ["$players.sample.id", FAKE_ID]},
+                                "n": {"$sum": 1},
+                            }
+                        },
+                    ],
+                    "orgs": [
+                        {"$match": {"org": {"$ne": None}}},
+                        {"$group": {"_id": "$org", "n": {"$sum": 1}}},
+                    ],
+                    "versions": [
+                        {"$match": VALID_MATCH},
+                        {"$group": {"_id": "$version.name", "n": {"$sum": 1}}},
+                    ],
+                    "protocols": [
+                        {"$match": VALID_MATCH},
+                        {"$group": {"_id": "$version.protocol", "n": {"$sum": 1}}},
+                    ],
+                    "flags": [
+                        {
+                            "$group": {
+                                "_id": None,
+                                **{
+                                    flag: Stats._count_if({"$eq": [f"${flag}", True]})
+                                    for flag in (
+                                        "cracked",
+                                        "hasFavicon",
+                                        "hasForgeData",
+                                    )
+                                },
+                                "whitelistKnown": Stats._count_if(
+                                    {"$ne": [{"$type": "$whitelist"}, "missing"]}
+                                ),
+                                "whitelisted": Stats._count_if(
+                                    {"$eq": ["$whitelist", True]}
+                                ),
+                            }
+                        }
+                    ],
+                }
+            }
+        ]
+
+        facets = next(self.col.aggregate(pipeline, allowDiskUse=True))
+
+        def total(name: str) -> int:
+            return facets[name][0]["n"] if facets[name] else 0
+
+        samples = {i["_id"]: i["n"] for i in facets["samples"]}
+        rollup = {
+            "servers": total("servers"),
+            "players": total("players"),
+            "samplePlayers": sum(samples.values()),
+            "realPlayers": samples.get(False, 0),
+            "fakePlayers": samples.get(True, 0),
+        }
+        flag_counts = facets["flags"][0] if facets["flags"] else {}
+        for flag in (
+            "cracked",
+            "hasFavicon",
+            "hasForgeData",
+            "whitelistKnown",
+            "whitelisted",
+        ):
+            rollup[flag] = flag_counts.get(flag, 0)
+        for table in TABLES:
+            rollup[table] = {self.encode(i["_id"]): i["n"] for i in facets[table]}
+
+        return rollup
+
+    def reconcile(self) -> dict:
+        """Replaces the rollup with a full recount
+
+        Returns:
+            dict: The new rollup
+        """
+        with self.reconcile_lock:
+            start = time.perf_counter()
+            self.flush()
+            rollup = self.recount()
+            rollup["reconciled"] = time.time()
+            self.rollup.replace_one({"_id": self.rollup_id}, rollup, upsert=True)
+            self.logger.print(
+                f"Reconciled stats in {time.perf_counter() - start:.1f} seconds"
+            )
+            return rollup
+
+    def read(self) -> dict:
+        """Returns the rollup, with decoded tables
+
+        The first read of a new database recounts every stat, later reads are a
+        single document fetch.
+
+        Returns:
+            dict: The rollup
+        """
+        self._start()
+        rollup = self.rollup.find_one({"_id": self.rollup_id})
+        if rollup is None or "reconciled" not in rollup:
+            # only deltas were written so far, count everything once
+            rollup = self.reconcile()
+
+        rollup = dict(rollup)
+        for table in TABLES:
+            rollup[table] = {
+                self.decode(k): v for k, v in (rollup.get(table) or {}).items() if v > 0
+            }
+        # protocols are ints in the server docs
+        rollup["protocols"] = {
+            int(k) if k.lstrip("-").isdigit() else k: v
+            for k, v in rollup["protocols"].items()
+        }
+        return rollup
+
+    async def async_read(self) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.read
+        )
+
+    @staticmethod
+    def top(table: dict, n: int) -> list[tuple[str, int]]:
+        """Returns the n largest values of a rollup table, largest first"""
+        return sorted(table.items(), key=lambda i: i[1], reverse=True)[:n]
+
+    def _start(self) -> None:
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self._run, name="stats-rollup", daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+
+                rollup = self.rollup.find_one(
+                    {"_id": self.rollup_id}, {"reconciled": 1}
+                )
+                reconciled = (rollup or {}).get("reconciled", 0)
+                if time.time() - reconciled > self.reconcile_interval:
+                    self.reconcile()
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+
+    def stats(self) -> dict:
+        """Returns the counters of the rollup writer"""
+        return {
+            "pending": len([v for v in self.deltas.values() if v]),
+            "recorded": self.recorded,
+            "untracked": self.untracked,
+        }
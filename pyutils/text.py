@@ -1,4 +1,5 @@
 import datetime
+import ipaddress
 import re
 
 import minecraft_data
@@ -397,3 +398,196 @@ class Text:
                 raise ValueError("Invalid range")
 
         return out
+
+    @staticmethod
+    def ip_int(ip: str | int) -> int:
+        """
+        Converts an IPv4 address to an int, ints are returned as they are
+
+        ex `1.2.3.4` -> 16909060
+           `16909060` -> 16909060
+
+        Raises:
+            ValueError: if the ip is not an IPv4 address
+        """
+        if isinstance(ip, int):
+            return ip
+        ip = ip.strip()
+        if ip.isdigit():
+            return int(ip)
+        return int(ipaddress.IPv4Address(ip))
+
+    @staticmethod
+    def parse_cidrs(cidrs: str) -> list[tuple[int, int]]:
+        """
+        Parses comma separated CIDRs into merged, sorted ranges of ints
+
+        ex `10.0.0.0/24` -> [(167772160, 167772415)]
+           `10.0.0.0/24, 10.0.1.0/24` -> [(167772160, 167772671)]
+           `1.2.3.4` -> [(16909060, 16909060)]
+
+        Raises:
+            ValueError: if any of the CIDRs is invalid
+
+        Returns:
+            list[tuple[int, int]]: the inclusive (first, last) ranges
+        """
+        ranges = []
+        for cidr in cidrs.split(","):
+            if not cidr.strip():
+                continue
+            net = ipaddress.IPv4Network(cidr.strip(), strict=False)
+            ranges.append((int(net.network_address), int(net.broadcast_address)))
+
+        if not ranges:
+            raise ValueError("No CIDRs given")
+
+        merged = []
+        for lo, hi in sorted(ranges):
+            if merged and lo <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        return merged
+
+    @staticmethod
+    def trigrams(*texts: str, limit: int = 4096) -> list[str]:
+        """
+        Returns the sorted, lowercase 3 character substrings of texts, for the
+        `motdGrams` and `signGrams` search fields
+
+        The grams of both the raw text and the text without color codes are included,
+        so a search matches either form.
+
+        ex `Hi§ethere` -> ['ere', 'eth', 'her', 'hit', 'hi§', 'ith', 'i§e', 'the', '§et']
+        """
+        grams = set()
+        for text in texts:
+            if not isinstance(text, str):
+                continue
+            text = text.lower()
+            for form in {text, re.sub(r"§.?", "", text)}:
+                grams.update(form[i : i + 3] for i in range(len(form) - 2))
+
+        return sorted(grams)[:limit]
+
+    @staticmethod
+    def regex_grams(pattern: str, limit: int = 16) -> list[str]:
+        """
+        Returns lowercase trigrams that any match of a regex has to contain
+
+        Only literal runs of the pattern are used, runs with color codes are skipped.
+        Patterns with alternation (`|`) have no required grams, and groups are skipped
+        whole, as they can be optional, repeated or `(?...)` syntax.
+
+        ex `.*hello.*` -> ['ell', 'hel', 'llo']
+           `a.b` -> []
+        """
+        if "|" in pattern:
+            return []
+
+        runs = []
+        run = ""
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if char == "\\" and i + 1 < len(pattern):
+                escaped = pattern[i + 1]
+                i += 2
+                if escaped.isalnum():
+                    # a class like \d or \w
+                    runs.append(run)
+                    run = ""
+                else:
+                    run += escaped
+                continue
+
+            if char in "*?{":
+                # the previous char is optional
+                run = run[:-1]
+            if char == "(":
+                i = Text._group_end(pattern, i)
+            if char == "[":
+                # skip the character class
+                end = pattern.find("]", i + 2)
+                i = len(pattern) if end == -1 else end
+            if char in ".^$*+?()[]{}":
+                runs.append(run)
+                run = ""
+                if char == "{":
+                    end = pattern.find("}", i)
+                    i = len(pattern) if end == -1 else end
+            else:
+                run += char
+            i += 1
+        runs.append(run)
+
+        grams = set()
+        for run in runs:
+            if "§" not in run:
+                grams.update(Text.trigrams(run))
+        return sorted(grams)[:limit]
+
+    @staticmethod
+    def _group_end(pattern: str, start: int) -> int:
+        """Returns the index of the `)` closing the group opened at `start`"""
+        depth = 0
+        i = start
+        while i < len(pattern):
+            char = pattern[i]
+            if char == "\\":
+                i += 2
+                continue
+            if char == "[":
+                # a `)` in a class doesn't close the group, `[]...]` and `[^]...]`
+                # start with a literal `]`
+                j = i + 1
+                if j < len(pattern) and pattern[j] == "^":
+                    j += 1
+                j += 1
+                while j < len(pattern) and pattern[j] != "]":
+                    j += 2 if pattern[j] == "\\" else 1
+                i = j + 1
+                continue
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    return i
+            i += 1
+        return len(pattern)
+
+    @staticmethod
+    def sample_names(doc: dict) -> list[str]:
+        """
+        Returns the `players.sampleNames` field of a server doc, the lowercase names of
+        `players.sample`, so streamers can be joined to the servers they were seen on
+        """
+        sample = (doc.get("players") or {}).get("sample") or []
+        names = (i.get("name") for i in sample if isinstance(i, dict))
+        return sorted({name.lower() for name in names if isinstance(name, str)})
+
+    @staticmethod
+    def search_grams(doc: dict) -> dict:
+        """
+        Returns the `motdGrams` and `signGrams` fields of a server doc, built from
+        `description.text`, `description.extra.text` and `world.signs.text`
+        """
+
+        def texts(value) -> list[str]:
+            if isinstance(value, str):
+                return [value]
+            if isinstance(value, list):
+                return [t for i in value for t in texts(i)]
+            if isinstance(value, dict):
+                return texts(value.get("text")) + texts(value.get("extra"))
+            return []
+
+        signs = (doc.get("world") or {}).get("signs") or []
+        return {
+            "motdGrams": Text.trigrams(*texts(doc.get("description"))),
+            "signGrams": Text.trigrams(
+                *[i.get("text") for i in signs if isinstance(i, dict)]
+            ),
+        }
@@ -1,16 +1,207 @@
+import threading
 import time
-from itertools import zip_longest
-
-import aiohttp
+import traceback
+from typing import Optional
 
+from .cache import TTLCache
+from .httpclient import HTTPClient
 from .logger import Logger
 
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+STREAMS_URL = "https://api.twitch.tv/helix/streams"
+USERS_URL = "https://api.twitch.tv/helix/users"
+
+# the twitch game id of Minecraft
+MINECRAFT_ID = "27471"
+
 
 class Twitch:
-    def __init__(self, logger: "Logger", client_id: str, client_secret: str):
+    """Talks to the twitch api
+
+    App tokens are cached until they expire. The live Minecraft streams are paged
+    through by a background thread every `interval` seconds and kept in memory,
+    keyed by login, so embeds and the streams button don't call twitch. Whether a
+    name is a twitch user is cached for `user_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        logger: "Logger",
+        client_id: str,
+        client_secret: str,
+        http: "HTTPClient" = None,
+        interval: float = 2 * 60,
+        max_pages: int = 50,
+        user_ttl: float = 24 * 60 * 60,
+    ):
+        """
+        :param logger: The logger class
+        :param client_id: The Twitch client ID
+        :param client_secret: The Twitch client secret
+        :param http: The shared HTTP client
+        :param interval: Seconds between refreshes of the live streams
+        :param max_pages: Max pages of 100 streams fetched per refresh
+        :param user_ttl: Seconds a twitch user lookup is cached for
+        """
         self.logger = logger
         self.client_id = client_id
         self.client_secret = client_secret
+        self.http = http if http is not None else HTTPClient(logger)
+        self.interval = interval
+        self.max_pages = max_pages
+
+        # client id -> (token, monotonic expiry)
+        self.tokens: dict[str, tuple[str, float]] = {}
+
+        # lowercase login -> stream, of every live Minecraft stream
+        self.live: dict[str, dict] = {}
+        self.live_updated = 0.0
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+        # lowercase name -> whether it is a twitch user
+        self.users = TTLCache(maxsize=65536, ttl=user_ttl)
+
+        self.token_requests = 0
+        self.refreshes = 0
+
+    def _credentials(
+        self, client_id: str = None, client_secret: str = None
+    ) -> tuple[Optional[str], Optional[str]]:
+        if self.client_id is not None:
+            client_id = self.client_id
+        if self.client_secret is not None:
+            client_secret = self.client_secret
+        return client_id or None, client_secret or None
+
+    async def token(self, client_id: str, client_secret: str) -> str:
+        """
+        Get an app token, requesting one only if the cached one expired
+
+        :param client_id: The Twitch client ID
+        :param client_secret: The Twitch client secret
+
+        :return: The access token
+        """
+        cached = self.tokens.get(client_id)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
+        params = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "grant_type": "client_credentials",
+        }
+        async with self.http.post(TOKEN_URL, params=params) as response:
+            token_data = await response.json()
+        self.token_requests += 1
+
+        access_token = token_data["access_token"]
+        # renew a minute early, so a request never goes out with an expired token
+        expires = time.monotonic() + max(token_data.get("expires_in", 0) - 60, 0)
+        self.tokens[client_id] = (access_token, expires)
+        return access_token
+
+    async def _helix(
+        self, url: str, params, client_id: str, client_secret: str
+    ) -> dict:
+        """
+        Send a GET to the helix api, renewing the token once if it was revoked
+
+        :param url: The helix url
+        :param params: The query params
+        :param client_id: The Twitch client ID
+        :param client_secret: The Twitch client secret
+
+        :return: The json response
+        """
+        for _ in range(2):
+            headers = {
+                "Client-ID": client_id,
+                "Authorization": f"Bearer {await self.token(client_id, client_secret)}",
+            }
+            async with self.http.get(url, headers=headers, params=params) as response:
+                if response.status == 401:
+                    self.tokens.pop(client_id, None)
+                    continue
+                return await response.json()
+        return {}
+
+    async def fetch_streams(
+        self, client_id: str = None, client_secret: str = None, lang: str = None
+    ) -> list:
+        """
+        Page through the live Minecraft streams
+
+        :param client_id: The Twitch client ID
+        :param client_secret: The Twitch client secret
+        :param lang: The language to filter by
+
+        :return: A list of Minecraft streams
+        """
+        client_id, client_secret = self._credentials(client_id, client_secret)
+        if client_id is None or client_secret is None:
+            self.logger.error("[twitch.fetchStreams] Client ID or secret not provided")
+            return []
+
+        params = {"game_id": MINECRAFT_ID, "first": 100, "type": "live"}
+        if lang:
+            params["language"] = lang
+
+        streams = []
+        for _ in range(self.max_pages):
+            data = await self._helix(STREAMS_URL, params, client_id, client_secret)
+            streams.extend(data.get("data", []))
+
+            cursor = data.get("pagination", {}).get("cursor")
+            if not cursor or not data.get("data"):
+                break
+            params["after"] = cursor
+
+        self.logger.info(
+            f"[twitch.fetchStreams] Fetched {len(streams)} Minecraft streams"
+        )
+        return streams
+
+    async def refresh(self) -> None:
+        """Replace the index of live streams"""
+        streams = await self.fetch_streams()
+        live = {stream["user_login"].lower(): stream for stream in streams}
+        with self.lock:
+            self.live = live
+            self.live_updated = time.time()
+            self.refreshes += 1
+
+        # every live streamer is a twitch user
+        for login in live:
+            self.users.set(login, True)
+
+    def _start(self) -> bool:
+        """Start the refresh thread, returns whether the index can be used"""
+        client_id, client_secret = self._credentials()
+        if client_id is None or client_secret is None:
+            return False
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="twitch-streams", daemon=True
+                )
+                self.thread.start()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.http.run(self.refresh())
+            except Exception as err:
+                self.logger.warning("Failed to refresh the twitch streams")
+                self.logger.print(err)
+                self.logger.print(f"{traceback.format_exc()}")
+            time.sleep(self.interval)
+
+    def _fresh(self) -> bool:
+        return time.time() - self.live_updated < self.interval * 3
 
     async def async_get_streamers(
         self, client_id: str = None, client_secret: str = None, lang: str = None
@@ -24,55 +215,63 @@ class Twitch:
 
         :return: A list of Minecraft streamers
         """
+        # the own credentials win over the given ones, so the index covers the call
+        if self._start() and self._fresh():
+            streams = list(self.live.values())
+            if lang:
+                streams = [i for i in streams if i.get("language") == lang]
+            return streams
 
-        token_url = "https://id.twitch.tv/oauth2/token"
-        streams_url = "https://api.twitch.tv/helix/streams"
+        return await self.fetch_streams(client_id, client_secret, lang)
 
-        if self.client_id is not None:
-            client_id = self.client_id
-        if self.client_secret is not None:
-            client_secret = self.client_secret
+    def live_streams(self, *users: str) -> list[dict]:
+        """
+        Get the live streams of users from the index, without calling twitch
 
-        if client_id is None or client_secret is None:
-            self.logger.error(
-                "[twitch.asyncGetStreamers] Client ID or secret not provided"
-            )
-            return []
+        :param users: The user names
 
-        # Get access token
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "grant_type": "client_credentials",
-            }
-            async with session.post(token_url, params=params) as response:
-                token_data = await response.json()
-                access_token = token_data["access_token"]
+        :return: The streams of the users that are live
+        """
+        self._start()
+        live = self.live
+        out = []
+        for user in dict.fromkeys(user.lower() for user in users if user):
+            if user in live:
+                out.append(live[user])
+        return out
 
-        # Fetch Minecraft streams
-        headers = {"Client-ID": client_id, "Authorization": f"Bearer {access_token}"}
-        params = {
-            "game_id": "27471",
-            "first": 100,
-            "type": "live",
-        }
-        if lang:
-            params["language"] = lang
+    async def async_live_streams(self, *users: str) -> list[dict]:
+        """
+        Get the live streams of users, asking twitch only if the index is stale
 
-        async with aiohttp.ClientSession() as session, session.get(
-            streams_url, headers=headers, params=params
-        ) as response:
-            data = await response.json()
-            self.logger.info(
-                f"[twitch.asyncGetStreamers] Fetched {len(data['data'])} Minecraft streams"
-            )
+        :param users: The user names
 
-        # Process stream data
-        if "data" in data:
-            return data["data"]
+        :return: The streams of the users that are live
+        """
+        streams = self.live_streams(*users)
+        if self._fresh():
+            return streams
 
-        return []
+        client_id, client_secret = self._credentials()
+        if client_id is None or client_secret is None:
+            return streams
+
+        names = list(dict.fromkeys(user.lower() for user in users if user))
+        streams = []
+        for i in range(0, len(names), 100):
+            data = await self._helix(
+                STREAMS_URL,
+                [("user_login", name) for name in names[i : i + 100]]
+                + [("type", "live")],
+                client_id,
+                client_secret,
+            )
+            streams.extend(
+                stream
+                for stream in data.get("data", [])
+                if stream.get("game_id") == MINECRAFT_ID
+            )
+        return streams
 
     async def get_stream(self, user: str) -> dict:
         """
@@ -84,52 +283,33 @@ class Twitch:
         """
         start = time.perf_counter()
 
-        # Get access token
-        token_url = "https://id.twitch.tv/oauth2/token"
-        streams_url = "https://api.twitch.tv/helix/streams"
-
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "grant_type": "client_credentials",
-            }
-            async with session.post(token_url, params=params) as response:
-                token_data = await response.json()
-                access_token = token_data["access_token"]
-
-        # Fetch stream
-        headers = {
-            "Client-ID": self.client_id,
-            "Authorization": f"Bearer {access_token}",
-        }
-        params = {
-            "user_login": user,
-            "type": "live",
-        }
-
-        async with aiohttp.ClientSession() as session, session.get(
-            streams_url, headers=headers, params=params
-        ) as response:
-            data = await response.json()
-
-        # Process stream data
-        stream = {}
-        if "data" in data:
-            stream = data["data"][0] if len(data["data"]) > 0 else {}
+        streams = self.live_streams(user)
+        if streams:
+            stream = streams[0]
+        elif self._fresh():
+            # the index is complete, the user isn't streaming Minecraft
+            return {}
+        else:
+            data = await self._helix(
+                STREAMS_URL,
+                {"user_login": user, "type": "live"},
+                self.client_id,
+                self.client_secret,
+            )
+            stream = data["data"][0] if data.get("data") else {}
             if stream == {}:
                 return stream
 
-            self.logger.info(f"Found stream: {stream['user_name']} - {stream['title']}")
-            stream = {
-                "name": stream["user_login"],
-                "viewer_count": stream["viewer_count"],
-                "title": stream["title"],
-                "url": f"https://twitch.tv/{stream['user_login']}",
-                "thumbnail_url": stream["thumbnail_url"]
-                .replace("{width}", "320")
-                .replace("{height}", "180"),
-            }
+        self.logger.info(f"Found stream: {stream['user_name']} - {stream['title']}")
+        stream = {
+            "name": stream["user_login"],
+            "viewer_count": stream["viewer_count"],
+            "title": stream["title"],
+            "url": f"https://twitch.tv/{stream['user_login']}",
+            "thumbnail_url": stream["thumbnail_url"]
+            .replace("{width}", "320")
+            .replace("{height}", "180"),
+        }
 
         end = time.perf_counter()
         self.logger.debug(f"Took {end - start:0.4f} seconds")
@@ -140,45 +320,45 @@ class Twitch:
         streamers = await self.async_get_streamers(self.client_id, self.client_secret)
         return [streamer["user_name"] for streamer in streamers]
 
-    async def is_twitch_user(self, *users: str) -> bool:
+    async def is_twitch_user(self, *users: str) -> list[bool]:
         """
-        Check if a user is a Twitch user
+        Check if users are Twitch users, only the uncached names are looked up
 
         :param users: The users to check
 
-        :return: Whether the user is a Twitch user
+        :return: Whether each user is a Twitch user
         """
-        out = []
-
-        # Get access token
-        token_url = "https://id.twitch.tv/oauth2/token"
-        users_url = "https://api.twitch.tv/helix/users"
-
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "grant_type": "client_credentials",
-            }
-            async with session.post(token_url, params=params) as response:
-                token_data = await response.json()
-                access_token = token_data["access_token"]
-
-        for group in zip_longest(*[iter(users)] * 100):
-            # Fetch user
-            headers = {
-                "Client-ID": self.client_id,
-                "Authorization": f"Bearer {access_token}",
-            }
-            params = "?" + "&".join([f"login={user}" if user else "" for user in group])
-
-            async with aiohttp.ClientSession() as session, session.get(
-                users_url + params, headers=headers
-            ) as response:
-                data = await response.json()
-
-            if "data" in data:
-                for user in data["data"]:
-                    out.append(bool(user))
-
-        return out
+        names = [user.lower() if user else "" for user in users]
+        missing = list(
+            dict.fromkeys(name for name in names if name and name not in self.users)
+        )
+
+        client_id, client_secret = self._credentials()
+        if missing and client_id is not None and client_secret is not None:
+            for i in range(0, len(missing), 100):
+                group = missing[i : i + 100]
+                data = await self._helix(
+                    USERS_URL,
+                    [("login", name) for name in group],
+                    client_id,
+                    client_secret,
+                )
+                if "data" not in data:
+                    # don't cache a failed lookup
+                    continue
+
+                found = {user["login"].lower() for user in data["data"]}
+                for name in group:
+                    self.users.set(name, name in found)
+
+        return [bool(self.users.get(name, False)) for name in names]
+
+    def stats(self) -> dict:
+        """Returns the counters of the token cache, the index and the user cache"""
+        return {
+            "live": len(self.live),
+            "age": time.time() - self.live_updated if self.live_updated else None,
+            "refreshes": self.refreshes,
+            "token_requests": self.token_requests,
+            "users": self.users.stats(),
+        }
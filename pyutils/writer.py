@@ -0,0 +1,269 @@
+import atexit
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .logger import Logger
+
+
+class BulkWriter:
+    """A write-behind queue that coalesces upserts and flushes them with bulk_write
+
+    Upserts with the same key (ex: a server's `(ip, port)`) are merged while they wait,
+    so a server updated many times between flushes is only written once. The
+    `callbacks` are called with the `(query, update)` pairs of every batch, once they
+    are written.
+    """
+
+    def __init__(
+        self,
+        col: pymongo.collection.Collection,
+        logger: "Logger",
+        max_batch: int = 500,
+        interval: float = 5,
+        max_pending: int = 10000,
+        put_timeout: float = 10,
+    ):
+        """Initializes the writer
+
+        Args:
+            col (pymongo.collection.Collection): The collection to write to
+            logger (Logger): The logger class
+            max_batch (int, optional): Flush as soon as this many upserts are queued, and
+                write at most this many per bulk_write. Defaults to 500.
+            interval (float, optional): Max seconds an upsert waits before being flushed.
+                Defaults to 5.
+            max_pending (int, optional): Max upserts held in memory, producers wait when
+                the queue is full. Defaults to 10000.
+            put_timeout (float, optional): Seconds a producer waits for space before
+                flushing the queue itself. Defaults to 10.
+        """
+        self.col = col
+        self.logger = logger
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+
+        # key -> (query, update)
+        self.pending: OrderedDict[Hashable, tuple[dict, dict]] = OrderedDict()
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+        # called with the upserts that were written, ex: to count them in a rollup
+        self.callbacks: list[Callable[[list[tuple[dict, dict]]], None]] = []
+
+        # counters
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def put(self, query: dict, update: dict, key: Hashable = None) -> None:
+        """Queues an upsert
+
+        Args:
+            query (dict): The filter of the upsert
+            update (dict): The update operators, ex: `{"$set": {...}}`
+            key (Hashable, optional): The coalescing key, defaults to the query's items
+        """
+        if key is None:
+            key = tuple(query.items())
+
+        with self.cond:
+            closed = self.closed
+            full = False if closed else self._enqueue(query, update, key)
+
+        if closed:
+            # nothing is left to flush after shutdown, so write it now, outside of the
+            # condition so other producers don't wait on the network
+            self._write([(query, update)])
+        elif full:
+            self.logger.warning("Write queue is full, flushing in the caller")
+            self.flush()
+
+    def _enqueue(self, query: dict, update: dict, key: Hashable) -> bool:
+        # called with the condition held, returns whether the queue is full
+        self._start()
+
+        if key not in self.pending and len(self.pending) >= self.max_pending:
+            # backpressure, wait for the flusher to make space
+            self.cond.notify_all()
+            self.cond.wait_for(
+                lambda: len(self.pending) < self.max_pending, self.put_timeout
+            )
+
+        if key in self.pending:
+            self.coalesced += 1
+            old_query, old_update = self.pending.pop(key)
+            update = self.merge(old_update, update)
+
+        self.pending[key] = (query, update)
+        self.queued += 1
+
+        if len(self.pending) >= self.max_batch:
+            self.cond.notify_all()
+        return len(self.pending) >= self.max_pending
+
+    @staticmethod
+    def merge(old: dict, new: dict) -> dict:
+        """Merges two update documents, the newer values win
+
+        Args:
+            old (dict): The queued update
+            new (dict): The newer update
+
+        Returns:
+            dict: The merged update
+        """
+        merged = {op: fields.copy() for op, fields in old.items()}
+        for op, fields in new.items():
+            if op == "$inc":
+                inc = merged.setdefault(op, {})
+                for field, amount in fields.items():
+                    inc[field] = inc.get(field, 0) + amount
+            elif op in ("$max", "$min"):
+                pick = max if op == "$max" else min
+                bound = merged.setdefault(op, {})
+                for field, value in fields.items():
+                    bound[field] = (
+                        pick(bound[field], value) if field in bound else value
+                    )
+            elif op == "$setOnInsert":
+                # the first insert values win, they would be the ones inserted
+                merged.setdefault(op, {})
+                for field, value in fields.items():
+                    merged[op].setdefault(field, value)
+            else:
+                merged.setdefault(op, {}).update(fields)
+
+        return merged
+
+    def flush(self) -> int:
+        """Writes every queued upsert
+
+        Returns:
+            int: The number of upserts written
+        """
+        total = 0
+        with self.flush_lock:
+            while True:
+                with self.cond:
+                    batch = []
+                    while self.pending and len(batch) < self.max_batch:
+                        batch.append(self.pending.popitem(last=False)[1])
+                    self.cond.notify_all()
+
+                if not batch:
+                    break
+
+                self._write(batch)
+                total += len(batch)
+
+        return total
+
+    def _write(self, batch: list[tuple[dict, dict]]) -> None:
+        start = time.perf_counter()
+        written = []
+        try:
+            self.col.bulk_write(
+                [UpdateOne(query, update, upsert=True) for query, update in batch],
+                ordered=False,
+            )
+            written = batch
+        except BulkWriteError as err:
+            failed = err.details.get("writeErrors", [])
+            self.errors += len(failed)
+            self.logger.error(f"Bulk write errors: {failed}")
+            # unordered, every upsert without an error was applied
+            failed_at = {error["index"] for error in failed}
+            written = [op for i, op in enumerate(batch) if i not in failed_at]
+        except PyMongoError as err:
+            self.errors += len(batch)
+            self.logger.print(f"{traceback.format_exc()}")
+            self.logger.error(err)
+        finally:
+            self.last_flush_seconds = time.perf_counter() - start
+            self.total_flush_seconds += self.last_flush_seconds
+            self.flushes += 1
+            self.written += len(written)
+
+        self.logger.debug(
+            f"Flushed {len(batch)} writes in {self.last_flush_seconds:.3f} seconds, "
+            f"{len(self.pending)} queued"
+        )
+
+        if not written:
+            return
+        for callback in self.callbacks:
+            try:
+                callback(written)
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+
+    def _start(self) -> None:
+        # called with the condition held
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run, name="bulk-writer", daemon=True
+            )
+            self.thread.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: self.closed or len(self.pending) >= self.max_batch,
+                    self.interval,
+                )
+                closed = self.closed
+
+            try:
+                self.flush()
+            except Exception as err:
+                self.logger.print(f"{traceback.format_exc()}")
+                self.logger.error(err)
+
+            if closed:
+                return
+
+    def close(self) -> None:
+        """Stops the flusher and writes everything still queued"""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+            thread = self.thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=30)
+        self.flush()
+
+    def stats(self) -> dict:
+        """Returns the counters of the writer"""
+        return {
+            "depth": len(self.pending),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_seconds": self.last_flush_seconds,
+            "avg_flush_seconds": (
+                self.total_flush_seconds / self.flushes if self.flushes else 0
+            ),
+        }
@@ -21,6 +21,8 @@ except ImportError:
     # try importing again
     import pyutils
 
+from pyutils.rechecker import Account, AccountPool, Rechecker
+
 (
     DISCORD_WEBHOOK,
     DISCORD_TOKEN,
@@ -112,61 +114,28 @@ async def main():
 
     # whitelist can be False, True, or None (not online to test)
 
-    # we need a minecraft token, to join the server
-    # first a link
-    link, vCode = mcLib.get_activation_code_url(azure_client_id, azure_redirect_uri)
-    logger.print(f"Please visit {link} and enter the code below")
-
-    access_code = input("Code: ").strip()
-
-    # then we need to get the token
-    result = await mcLib.get_minecraft_token_async(
-        azure_client_id, azure_redirect_uri, access_code, vCode
-    )
-    assert result["type"] == "success", "Error getting minecraft token"
-    token = result["minecraft_token"]
-    uname = result["name"]
-
-    # now we can join the server
-    servers = databaseLib.aggregate(pipeline)
-    count = databaseLib.count(pipeline)
-    logger.print(f"Found {count} servers to scan")
-
-    for server in servers:
-        try:
-            sType = await mcLib.join(
-                ip=server["ip"],
-                port=server["port"],
-                player_username=uname,
-                mine_token=token,
-                version=server["version"]["protocol"],
-            )
-        except Exception as e:
-            logger.print(f"Error joining {server['ip']}")
-            logger.print(e)
-            sentry_sdk.capture_exception(e)
-            continue
-
-        if sType.status == "WHITELISTED":
-            logger.print(f"Whitelisted: {server['ip']}")
-            databaseLib.update_one(
-                {"_id": server["_id"]}, {"$set": {"whitelist": True}}
-            )
-        elif sType.status == "PREMIUM" or sType.status == "MODDED":
-            logger.print(f"Premium: {server['ip']}")
-            databaseLib.update_one(
-                {"_id": server["_id"]}, {"$set": {"whitelist": False}}
-            )
-        elif sType.status == "HONEY_POT":
-            logger.print(f"Honey Pot: {server['ip']}")
-            databaseLib.update_one(
-                {"_id": server["_id"]}, {"$set": {"whitelist": True}}
-            )
-        else:
-            # logger.print(f"Unknown: {server['ip']} ({sType.status})", end="\r")
-            databaseLib.update_one(
-                {"_id": server["_id"]}, {"$set": {"whitelist": None}}
-            )
+    # we need minecraft tokens to join the servers, each account adds throughput
+    count = input("How many accounts? [1]: ").strip()
+    accounts = []
+    for _ in range(int(count) if count else 1):
+        # first a link
+        link, vCode = mcLib.get_activation_code_url(
+            azure_client_id, azure_redirect_uri
+        )
+        logger.print(f"Please visit {link} and enter the code below")
+
+        access_code = input("Code: ").strip()
+
+        # then we need to get the token
+        result = await mcLib.get_minecraft_token_async(
+            azure_client_id, azure_redirect_uri, access_code, vCode
+        )
+        assert result["type"] == "success", "Error getting minecraft token"
+        accounts.append(Account(result["name"], result["minecraft_token"]))
+
+    # now we can join the servers
+    rechecker = Rechecker(logger, databaseLib, mcLib, AccountPool(accounts))
+    await rechecker.run(pipeline)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+try:
+    from pyutils.cache import TTLCache
+except ImportError:
+    sys.path.append(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.cache import TTLCache
+
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b", default=2) == 2
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_expiry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert "a" not in cache
+
+
+def test_max_age():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a", max_age=0.01) is None
+    assert cache.get("a", max_age=10) == 1
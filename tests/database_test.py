@@ -0,0 +1,244 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+
+try:
+    from pyutils.database import Database, Snapshot
+except ImportError:
+    sys.path.append(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.database import Database, Snapshot
+
+
+# Keyset pagination tests
+def test_strip_paging():
+    pipeline = [
+        {"$match": {"cracked": True}},
+        {"$sort": {"lastSeen": -1}},
+        {"$limit": 1000},
+        {"$skip": 10},
+    ]
+
+    stripped = Database.strip_paging(pipeline)
+
+    assert stripped == pipeline[:2]
+    assert len(pipeline) == 4
+
+
+def test_keyset_sort_appends_id():
+    pipeline = [{"$match": {}}, {"$sort": {"players.online": -1}}]
+
+    sort_i, sort = Database.keyset_sort(pipeline)
+
+    assert sort_i == 1
+    assert list(sort.items()) == [("players.online", -1), ("_id", 1)]
+
+
+def test_keyset_sort_without_sort():
+    sort_i, sort = Database.keyset_sort([{"$match": {}}])
+
+    assert sort_i is None
+    assert sort == {"_id": 1}
+
+
+def test_keyset_sort_unstable_order():
+    pipeline = [{"$sort": {"lastSeen": -1}}, {"$unwind": "$players.sample"}]
+
+    assert Database.keyset_sort(pipeline) == (None, None)
+
+
+def test_keyset_match():
+    match = Database.keyset_match({"players.online": -1, "_id": 1}, [5, "abc"])
+
+    assert match == {
+        "$match": {
+            "$or": [
+                {
+                    "$or": [
+                        {"players.online": {"$lt": 5}},
+                        {"players.online": None},
+                    ]
+                },
+                {"players.online": 5, "_id": {"$gt": "abc"}},
+            ]
+        }
+    }
+
+
+def test_keyset_match_reverse():
+    match = Database.keyset_match({"_id": 1}, ["abc"], reverse=True)
+
+    assert match == {"$match": {"$or": [{"_id": {"$lt": "abc"}}, {"_id": None}]}}
+
+
+def test_keyset_match_missing_field():
+    # the cursor doc has no lastSeen, it sorts below every value
+    match = Database.keyset_match({"lastSeen": -1, "_id": 1}, [None, "abc"])
+    assert match == {"$match": {"lastSeen": None, "_id": {"$gt": "abc"}}}
+
+    match = Database.keyset_match({"lastSeen": 1, "_id": 1}, [None, "abc"])
+    assert match == {
+        "$match": {
+            "$or": [
+                {"lastSeen": {"$ne": None}},
+                {"lastSeen": None, "_id": {"$gt": "abc"}},
+            ]
+        }
+    }
+
+
+def test_keyset_pages_past_docs_missing_the_sort_field():
+    docs = [{"_id": 1, "lastSeen": 5}, {"_id": 2}, {"_id": 3}]
+    pipelines = []
+
+    class Cursor:
+        def __init__(self, doc):
+            self.doc = doc
+
+        def try_next(self):
+            return self.doc
+
+    class Log:
+        def timer(self, func, *args):
+            return func(*args)
+
+    db = Database.__new__(Database)
+    db.logger = Log()
+    db.cursors = OrderedDict()
+    db.cursor_lock = threading.Lock()
+    db.max_cursors = 256
+    db.max_anchors = 64
+    db.pipeline_hash = lambda pipeline: "key"
+    db._aggregate = lambda pipeline: pipelines.append(pipeline) or Cursor(
+        docs[len(pipelines) - 1]
+    )
+
+    pipeline = [{"$sort": {"lastSeen": -1}}]
+    for index in range(3):
+        db._get_doc_keyset(pipeline, index)
+
+    # the anchor of the doc without lastSeen is kept, the last page is a range
+    assert db.cursors["key"][1] == [None, 2]
+    assert pipelines[2][0] == {"$match": {"lastSeen": None, "_id": {"$gt": 2}}}
+    assert not any("$skip" in stage for stage in pipelines[2])
+
+
+def test_get_path():
+    doc = {"players": {"online": 3}}
+
+    assert Database.get_path(doc, "players.online") == 3
+    assert Database.get_path(doc, "players.max") is None
+
+
+# Pipeline fingerprint tests
+def test_pipeline_hash_is_stable():
+    pipeline = [{"$match": {"cracked": True}}, {"$sort": {"lastSeen": -1}}]
+
+    assert Database.pipeline_hash(pipeline) == Database.pipeline_hash(
+        [{"$match": {"cracked": True}}, {"$sort": {"lastSeen": -1}}]
+    )
+
+
+def test_pipeline_hash_keeps_key_order():
+    first = [{"$sort": {"players.online": -1, "lastSeen": -1}}]
+    second = [{"$sort": {"lastSeen": -1, "players.online": -1}}]
+
+    assert Database.pipeline_hash(first) != Database.pipeline_hash(second)
+
+
+def test_hashable_pipeline_round_trip():
+    db = Database(col=None, logger=None)
+    pipeline = [
+        {"$match": {"$and": [{"players.max": {"$gt": 0}}, {"ip": "10.0.0.1"}]}},
+        {"$sample": {"size": 10}},
+    ]
+
+    hashed = db.hashable_pipeline(pipeline)
+
+    assert hash(hashed) == hash(db.hashable_pipeline(pipeline))
+    assert db.unhash_pipeline(hashed) == pipeline
+
+
+def test_count_pipeline_uses_sample_size():
+    counting = Database.count_pipeline(
+        [{"$match": {"cracked": True}}, {"$sample": {"size": 10}}]
+    )
+
+    assert counting[0] == {"$match": {"cracked": True}}
+    assert counting[1] == {"$limit": 10}
+
+
+# Snapshot tests
+def test_snapshot_packs_object_ids():
+    ids = [ObjectId() for _ in range(5)]
+    snapshot = Snapshot(ids)
+
+    assert len(snapshot) == 5
+    assert [snapshot[i] for i in range(5)] == ids
+
+
+def test_snapshot_other_ids():
+    snapshot = Snapshot(["a", "b"])
+
+    assert snapshot[1] == "b"
+
+
+def test_is_bounded():
+    assert Database.is_bounded([{"$match": {}}, {"$sample": {"size": 10}}])
+    assert Database.is_bounded([{"$match": {}}, {"$limit": 10}])
+    assert not Database.is_bounded([{"$match": {}}, {"$sort": {"_id": 1}}])
+
+
+def test_fetch_pipeline_keeps_shaping_stages():
+    pipeline = [
+        {"$match": {"online": True}},
+        {"$addFields": {"score": {"$size": "$players.sample"}}},
+        {"$sort": {"score": -1}},
+        {"$limit": 10},
+        {"$project": {"_id": 1, "score": 1}},
+    ]
+
+    assert Database.fetch_pipeline(pipeline, 5) == [
+        {"$match": {"_id": 5}},
+        {"$addFields": {"score": {"$size": "$players.sample"}}},
+        {"$project": {"_id": 1, "score": 1}},
+    ]
+
+
+# Random order tests
+def test_random_stages():
+    pipeline = [{"$match": {"cracked": True}}, *Database.random_stages(0.25)]
+
+    assert pipeline[1:] == [
+        {"$match": {"rand": {"$gte": 0.25}}},
+        {"$sort": {"rand": 1}},
+    ]
+    assert Database.random_seed(pipeline) == 0.25
+    assert Database.random_seed([{"$match": {"cracked": True}}]) is None
+    assert Database.strip_random(pipeline) == [{"$match": {"cracked": True}}]
+
+
+def test_random_wrap():
+    pipeline = [
+        {"$match": {"cracked": True}},
+        *Database.random_stages(0.5),
+        {"$limit": 100},
+    ]
+
+    assert Database.random_wrap(pipeline, 0.5) == [
+        {"$match": {"cracked": True}},
+        {"$match": {"rand": {"$lt": 0.5}}},
+        {"$sort": {"rand": 1}},
+    ]
+    assert Database.pipeline_limit(pipeline) == 100
+
+
+def test_count_pipeline_ignores_seed():
+    counting = Database.count_pipeline(
+        [{"$match": {"cracked": True}}, *Database.random_stages(0.5)]
+    )
+
+    assert counting[0] == {"$match": {"cracked": True}}
@@ -0,0 +1,54 @@
+import os
+import sys
+
+try:
+    from pyutils.geo import GeoResolver
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.geo import GeoResolver
+
+
+class Logger:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def test_parse():
+    geo = GeoResolver.parse(
+        {"loc": "1.5,-2.5", "country": "US", "city": "Austin", "org": "AS1 Test"}
+    )
+
+    assert geo == {
+        "lat": 1.5,
+        "lon": -2.5,
+        "country": "US",
+        "city": "Austin",
+        "org": "AS1 Test",
+    }
+    assert GeoResolver.parse({"ip": "10.0.0.1", "bogon": True}) == {}
+
+
+def test_ranges(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(
+        "start,end,lat,lon,country,city,org\n"
+        "1.0.1.0,1.0.1.255,2,2,AU,Sydney,\n"
+        "1.0.0.0,1.0.0.255,1,1,US,Austin,AS1 Test\n"
+    )
+    resolver = GeoResolver(Logger(), cache_path=None, ranges_path=str(path))
+
+    assert resolver._range_get("1.0.0.7")["city"] == "Austin"
+    assert resolver._range_get("1.0.1.255")["city"] == "Sydney"
+    assert resolver._range_get("1.0.2.0") is None
+    assert resolver._range_get("0.255.255.255") is None
+
+
+def test_disk_cache(tmp_path):
+    path = str(tmp_path / "geo.sqlite")
+    resolver = GeoResolver(Logger(), cache_path=path)
+    resolver.store({"1.2.3.4": {"lat": 1.0, "lon": 2.0, "country": "US", "city": "x"}})
+
+    # a new resolver only has the disk cache
+    resolver = GeoResolver(Logger(), cache_path=path)
+    assert resolver.lookup("1.2.3.4")["country"] == "US"
+    assert resolver.hits["disk"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+
+try:
+    from pyutils.httpclient import HTTPClient
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.httpclient import HTTPClient
+
+
+class Log:
+    def debug(self, *_):
+        pass
+
+
+def test_delay_uses_retry_after():
+    http = HTTPClient(Log(), backoff=1)
+    assert http._delay(0, "3") == 3
+    assert http._delay(0, "600") == 60
+
+
+def test_delay_backoff_is_bounded():
+    http = HTTPClient(Log(), backoff=1)
+    for attempt in range(4):
+        assert 0 <= http._delay(attempt, "soon") <= 2**attempt
+
+
+def test_stats_per_host():
+    http = HTTPClient(Log())
+    http._record("api.twitch.tv", 0.2, 200)
+    http._record("api.twitch.tv", 0.4, 503)
+    http._record("api.twitch.tv", 0.6, None)
+
+    stats = http.stats()["api.twitch.tv"]
+    assert stats["requests"] == 3
+    assert stats["errors"] == 2
+    assert stats["statuses"] == {200: 1, 503: 1}
+    assert abs(stats["avg_seconds"] - 0.4) < 1e-9
+    assert stats["max_seconds"] == 0.6
+
+
+class Response:
+    status = 200
+    headers = {}
+
+    def release(self):
+        pass
+
+
+class Session:
+    async def request(self, method, url, **_):
+        return Response()
+
+
+def test_slot_is_released_before_the_body():
+    http = HTTPClient(Log(), per_host=1)
+    http.session = Session
+
+    async def main():
+        async with http.get("https://a.test/1"):
+            # a second request to the host from the body must not wait on the slot
+            async with http.get("https://a.test/2") as resp:
+                return resp.status
+
+    assert asyncio.run(asyncio.wait_for(main(), 1)) == 200
@@ -0,0 +1,44 @@
+import os
+import sys
+
+try:
+    from pyutils.indexes import IndexAdvisor
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.indexes import IndexAdvisor
+
+
+def test_shape_ignores_values():
+    a = [{"$match": {"geo.country": "US"}}, {"$limit": 1}]
+    b = [{"$match": {"geo.country": "DE"}}, {"$limit": 20}]
+    c = [{"$match": {"cracked": True}}, {"$limit": 1}]
+
+    assert IndexAdvisor.shape(a) == IndexAdvisor.shape(b)
+    assert IndexAdvisor.shape(a) != IndexAdvisor.shape(c)
+
+
+def test_winning_plan_and_collscan():
+    explain = {
+        "stages": [
+            {
+                "$cursor": {
+                    "queryPlanner": {
+                        "winningPlan": {
+                            "stage": "LIMIT",
+                            "inputStage": {"stage": "COLLSCAN"},
+                        }
+                    }
+                }
+            }
+        ]
+    }
+
+    plan = IndexAdvisor.winning_plan(explain)
+    assert plan["stage"] == "LIMIT"
+    assert len(IndexAdvisor.find_stages(plan, "COLLSCAN")) == 1
+    assert IndexAdvisor.find_stages(plan, "IXSCAN") == []
+
+
+def test_key_of():
+    assert IndexAdvisor.key_of([("a", 1.0), ("b", -1)]) == (("a", 1), ("b", -1))
+    assert IndexAdvisor.key_of([("a", "text")]) == (("a", "text"),)
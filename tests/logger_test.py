@@ -0,0 +1,127 @@
+import asyncio
+import gzip
+import io
+import logging
+import os
+import sys
+from contextlib import asynccontextmanager
+
+try:
+    from pyutils.logger import Lazy, LogPipeline, Logger, WebhookSink, filter_msg, tail
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.logger import Lazy, LogPipeline, Logger, WebhookSink, filter_msg, tail
+
+
+def test_caller():
+    def helper():
+        return Logger.caller()
+
+    assert helper() == "logger_test.test_caller"
+
+
+def test_filter_msg():
+    assert filter_msg("Gateway Heartbeat acknowledged") is None
+    assert filter_msg("POST::https://discord.com/api/v10/channels/1 200") is None
+    assert filter_msg("   ^  ") is None
+    assert filter_msg("[http_client.request] ...") is None
+    assert filter_msg("Found 3 servers") == "Found 3 servers"
+
+
+def test_lazy_formats_on_str():
+    calls = []
+
+    def fmt(value):
+        calls.append(value)
+        return f"<{value}>"
+
+    lazy = Lazy(fmt, 1)
+    assert calls == []
+    assert str(lazy) == "<1>"
+    assert calls == [1]
+
+
+def make_record(msg):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_pipeline_writes_batches_and_rotates(tmp_path):
+    path = str(tmp_path / "log.log")
+    console = io.StringIO()
+    pipeline = LogPipeline(path, max_bytes=200, backups=2, console=console)
+    try:
+        for i in range(20):
+            pipeline.queue.put(make_record(f"line {i}"))
+        pipeline.queue.put(make_record("heartbeat"))
+        pipeline.write_console("hello\n")
+        assert pipeline.flush()
+    finally:
+        pipeline.close()
+
+    assert console.getvalue() == "hello\n"
+    assert pipeline.dropped == 1
+    assert pipeline.rotations >= 1
+    with gzip.open(path + ".1.gz", "rt") as f:
+        assert "line" in f.read()
+
+
+def test_tail(tmp_path):
+    path = tmp_path / "out.log"
+    path.write_text("first line\nsecond line\nthird\n")
+
+    assert tail(str(path), 1000) == "first line\nsecond line\nthird\n"
+    assert tail(str(path), 15) == "third\n"
+
+
+class Response:
+    def __init__(self, status, headers=None, data=None):
+        self.status = status
+        self.headers = headers or {}
+        self.data = data
+
+    async def json(self):
+        return self.data
+
+
+class HTTP:
+    def __init__(self, responses):
+        self.responses = responses
+        self.posts = []
+
+    @asynccontextmanager
+    async def post(self, url, json=None):
+        self.posts.append(json["content"])
+        yield self.responses.pop(0)
+
+
+class Owner:
+    def __init__(self, http):
+        self.http = http
+
+
+def test_sink_coalesces_and_chunks():
+    sink = WebhookSink("url", Owner(None), max_length=20)
+    sink.closed = True  # no thread
+    for _ in range(3):
+        sink.put("boom")
+    sink.put("other error")
+    sink.put("x" * 30)
+
+    assert sink.chunks(sink.pending) == ["boom (x3)", "other error", "x" * 17 + "..."]
+    assert sink.coalesced == 2
+
+
+def test_sink_retries_after_429():
+    http = HTTP(
+        [
+            Response(429, data={"retry_after": 0.01}),
+            Response(204, headers={"X-RateLimit-Remaining": "0"}),
+        ]
+    )
+    sink = WebhookSink("url", Owner(http))
+
+    asyncio.run(sink._send("hello"))
+
+    assert http.posts == ["hello", "hello"]
+    assert sink.sent == 1
+    assert sink.blocked_until > 0
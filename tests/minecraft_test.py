@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+from mcstatus.protocol.connection import Connection
+
+try:
+    from pyutils.cache import TTLCache
+    from pyutils.minecraft import Minecraft
+    from pyutils.protocol import pack_packet
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.cache import TTLCache
+    from pyutils.minecraft import Minecraft
+    from pyutils.protocol import pack_packet
+
+
+class Log:
+    def __getattr__(self, _):
+        return lambda *_, **__: None
+
+
+class Writer:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data: bytes):
+        self.data += bytes(data)
+
+    async def drain(self):
+        pass
+
+
+def login(*packets: bytes) -> tuple[Minecraft.ServerType, bytes]:
+    mc = Minecraft.__new__(Minecraft)
+    mc.logger = Log()
+    mc.timeout = 1.0
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(packets))
+        reader.feed_eof()
+        writer = Writer()
+        s_type = await mc._login(
+            reader,
+            writer,
+            ip="1.2.3.4",
+            port=25565,
+            player_username="Alice",
+            mine_token="token",
+            version=47,
+            _duuid="0" * 32,
+        )
+        return s_type, writer.data
+
+    return asyncio.run(run())
+
+
+def disconnect(reason: str) -> bytes:
+    packet = Connection()
+    packet.write_varint(0x00)
+    packet.write_utf(json.dumps({"text": reason}))
+    return bytes(packet.flush())
+
+
+def test_login_success_is_cracked():
+    s_type, sent = login(pack_packet(b"\x02"))
+
+    assert s_type.status == "CRACKED"
+    # the handshake goes out first, with the login intention
+    handshake = Connection()
+    handshake.receive(sent)
+    handshake.read_varint()  # length
+    assert handshake.read_varint() == 0
+    assert handshake.read_varint() == 47
+    assert handshake.read_utf() == "1.2.3.4"
+
+
+def test_login_reads_compressed_packets():
+    compression = Connection()
+    compression.write_varint(0x03)
+    compression.write_varint(16)
+
+    s_type, _ = login(
+        pack_packet(compression.flush()),
+        pack_packet(disconnect("You are not whitelisted on this server!"), 16),
+    )
+
+    assert s_type.status == "WHITELISTED"
+
+
+def test_login_without_response_is_offline():
+    s_type, _ = login()
+
+    assert s_type.status == "OFFLINE"
+
+
+class Response:
+    def __init__(self, data, status=200):
+        self.data = data
+        self.status = status
+
+    async def json(self):
+        return self.data
+
+
+class HTTP:
+    """Answers the profile endpoint, for the token "good" only"""
+
+    def __init__(self):
+        self.calls = 0
+
+    @asynccontextmanager
+    async def get(self, url, headers=None, **_):
+        self.calls += 1
+        if headers["Authorization"] == "Bearer good":
+            yield Response({"id": "069a79f444e94726a5befca90e38aaf5", "name": "A"})
+        else:
+            yield Response({}, 401)
+
+
+class Player:
+    async def async_get_uuid(self, name):
+        raise AssertionError("the account uuid comes from its token")
+
+
+def test_join_uses_the_profile_of_the_token():
+    mc = Minecraft.__new__(Minecraft)
+    mc.logger = Log()
+    mc.http = HTTP()
+    mc.player = Player()
+    mc.uuids = TTLCache(maxsize=64, ttl=60)
+
+    assert asyncio.run(mc.profile_uuid("good")) == "069a79f444e94726a5befca90e38aaf5"
+    assert asyncio.run(mc.profile_uuid("good")) == "069a79f444e94726a5befca90e38aaf5"
+    assert mc.http.calls == 1
+
+    s_type = asyncio.run(mc.join("1.2.3.4", 25565, "Alice", "bad", version=47))
+    assert s_type.status == "bad uuid"
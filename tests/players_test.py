@@ -0,0 +1,101 @@
+import os
+import sys
+
+try:
+    from pyutils.players import Players
+    from pyutils.stats import FAKE_ID
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.players import Players
+    from pyutils.stats import FAKE_ID
+
+
+class Writer:
+    def __init__(self):
+        self.puts = []
+
+    def put(self, query, update, key=None):
+        self.puts.append((query, update))
+
+
+def test_dashed():
+    uuid = "069A79F444E94726A5BEFCA90E38AAF5"
+    assert Players.dashed(uuid) == "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+    assert Players.dashed(Players.dashed(uuid)) == Players.dashed(uuid)
+
+
+def test_is_online_uuid():
+    assert Players.is_online_uuid("069a79f4-44e9-4726-a5be-fca90e38aaf5")
+    # offline mode uuids are version 3
+    assert not Players.is_online_uuid("b50ad385-829d-3141-a216-7e7d7539ba7f")
+    assert not Players.is_online_uuid("notch")
+
+
+def test_servers_match_groups_by_port():
+    servers = [
+        {"ip": "1.1.1.1", "port": 25565},
+        {"ip": "2.2.2.2", "port": 25565},
+        {"ip": "1.1.1.1", "port": 25566},
+    ]
+
+    assert Players.servers_match(servers) == {
+        "$or": [
+            {"ip": {"$in": ["1.1.1.1", "2.2.2.2"]}, "port": 25565},
+            {"ip": {"$in": ["1.1.1.1"]}, "port": 25566},
+        ]
+    }
+    assert Players.servers_match([]) == {"_id": None}
+
+
+def test_record_only_players_of_the_scan():
+    players = Players(None, None)
+    players.writer = Writer()
+    doc = {
+        "ip": "1.2.3.4",
+        "port": 25565,
+        "lastSeen": 10000,
+        "players": {
+            "sample": [
+                {"id": "a", "name": "Alice", "lastSeen": 10000},
+                {"id": "b", "name": "Bob", "lastSeen": 100},
+                {"id": FAKE_ID, "name": "Hidden", "lastSeen": 10000},
+            ]
+        },
+    }
+
+    assert players.record(doc) == 1
+    query, update = players.writer.puts[0]
+    assert query == {"uuid": "a", "ip": "1.2.3.4", "port": 25565}
+    assert update["$set"] == {"name": "Alice", "nameLower": "alice"}
+    assert update["$max"] == {"lastSeen": 10000}
+
+
+def test_merge_sample_latest_wins_and_caps():
+    old = [
+        {"id": "a", "name": "Alice", "lastSeen": 5},
+        {"id": "b", "name": "Bob", "lastSeen": 4},
+        {"id": "c", "name": "Carl", "lastSeen": 1},
+    ]
+    new = [
+        {"id": "b", "name": "Bobby", "lastSeen": 9},
+        {"id": "d", "name": "Dan", "lastSeen": 9},
+    ]
+
+    kept, dropped = Players.merge_sample(old, new, cap=3)
+
+    assert [(i["id"], i["name"]) for i in kept] == [
+        ("b", "Bobby"),
+        ("d", "Dan"),
+        ("a", "Alice"),
+    ]
+    assert dropped == [{"id": "c", "name": "Carl", "lastSeen": 1}]
+
+
+def test_merge_sample_keeps_newer_stored_entry():
+    kept, dropped = Players.merge_sample(
+        [{"id": "a", "name": "Alice", "lastSeen": 9}],
+        [{"id": "a", "name": "Old", "lastSeen": 1}],
+    )
+
+    assert kept == [{"id": "a", "name": "Alice", "lastSeen": 9}]
+    assert dropped == []
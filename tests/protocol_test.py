@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+
+try:
+    from pyutils.protocol import (
+        pack_packet,
+        pack_varint,
+        read_packet,
+        read_varint,
+        unpack_packet,
+    )
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.protocol import (
+        pack_packet,
+        pack_varint,
+        read_packet,
+        read_varint,
+        unpack_packet,
+    )
+
+
+def read(data: bytes, func):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await func(reader)
+
+    return asyncio.run(run())
+
+
+def test_pack_varint():
+    assert pack_varint(0) == b"\x00"
+    assert pack_varint(127) == b"\x7f"
+    assert pack_varint(300) == b"\xac\x02"
+    assert pack_varint(-1) == b"\xff\xff\xff\xff\x0f"
+
+
+def test_varint_round_trip():
+    for value in (0, 1, 127, 128, 25565, 2**31 - 1, -1, -(2**31)):
+        assert read(pack_varint(value), read_varint) == value
+
+
+def test_read_packet():
+    packet = read(pack_varint(3) + b"\x00ab", read_packet)
+
+    assert packet.read_varint() == 0
+    assert packet.read(2) == b"ab"
+
+
+def test_packet_compression_round_trip():
+    small = b"\x02" + b"a" * 10
+    large = b"\x02" + b"a" * 1000
+
+    for data in (small, large):
+        for threshold in (0, 256):
+            framed = pack_packet(data, threshold)
+            frame = read(framed, read_packet)
+            packet = unpack_packet(frame.read(frame.remaining()), threshold)
+
+            assert packet.read(packet.remaining()) == data
+
+    # large packets are compressed
+    assert len(pack_packet(large, 256)) < len(large)
+
+
+class Xor:
+    """A stream cipher stand in, CFB8 is byte granular like this"""
+
+    def __init__(self, key: int):
+        self.key = key
+
+    def update(self, data: bytes) -> bytes:
+        return bytes(i ^ self.key for i in data)
+
+
+def test_read_encrypted_compressed_packet():
+    data = b"\x02" + b"a" * 1000
+    encrypted = Xor(0x5A).update(pack_packet(data, 256))
+
+    packet = read(
+        encrypted,
+        lambda reader: read_packet(reader, threshold=256, decryptor=Xor(0x5A)),
+    )
+
+    assert packet.read(packet.remaining()) == data
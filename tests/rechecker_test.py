@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+try:
+    from pyutils.rechecker import Account, AccountPool, Rechecker
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.rechecker import Account, AccountPool, Rechecker
+
+
+def test_whitelist_value():
+    assert Rechecker.whitelist_value("WHITELISTED") is True
+    assert Rechecker.whitelist_value("HONEY_POT") is True
+    assert Rechecker.whitelist_value("PREMIUM") is False
+    assert Rechecker.whitelist_value("MODDED") is False
+    assert Rechecker.whitelist_value("OFFLINE") is None
+
+
+def test_is_unreachable():
+    assert Rechecker.is_unreachable("OFFLINE")
+    assert Rechecker.is_unreachable("OFFLINE:Timeout")
+    assert Rechecker.is_unreachable("ERROR")
+    assert not Rechecker.is_unreachable("PREMIUM")
+    assert not Rechecker.is_unreachable("UNKNOWN")
+
+
+def test_account_pool_round_robin():
+    pool = AccountPool([Account("a", ""), Account("b", "")], interval=60)
+
+    async def run():
+        return [(await pool.acquire()).name for _ in range(2)]
+
+    assert sorted(asyncio.run(run())) == ["a", "b"]
+
+
+def test_account_pool_disable():
+    account = Account("a", "")
+    pool = AccountPool([account], interval=0)
+    pool.disable(account)
+
+    assert len(pool) == 0
+    assert asyncio.run(pool.acquire()) is None
@@ -78,3 +78,15 @@ def test_large_subnet_fix():
             j += 1
         j = 0
         i += 1
+
+
+def test_next_batch():
+    logger = logging.getLogger("test_next_batch")
+    scanner = Scanner(logger_func=logger, serverLib=None)
+
+    for i in range(5):
+        scanner.que.put(f"10.0.0.{i}:25565")
+
+    assert scanner.next_batch(3, timeout=0.1) == [f"10.0.0.{i}:25565" for i in range(3)]
+    assert len(scanner.next_batch(10, timeout=0.1)) == 2
+    assert scanner.next_batch(10, timeout=0.1) == []
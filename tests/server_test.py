@@ -0,0 +1,41 @@
+import os
+import sys
+
+try:
+    from pyutils.server import Server
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.server import Server
+
+
+def test_upsert_update_keeps_paths_apart():
+    doc = {"_id": 1, "rand": 0.5, "ip": "1.2.3.4", "port": 25565, "lastSeen": 10}
+
+    update = Server.upsert_update(doc)
+
+    assert not set(update["$set"]) & set(update["$setOnInsert"])
+    assert "_id" not in update["$set"]
+    assert update["$set"]["lastSeen"] == 10
+    assert "_id" in doc and "rand" in doc
+
+
+def test_save_geo_is_one_bulk_update():
+    class Db:
+        def __init__(self):
+            self.calls = []
+
+        def bulk_update(self, updates):
+            self.calls.append(updates)
+
+    server = Server.__new__(Server)
+    server.db = Db()
+    server.geo_fields = lambda geo: {"geo": geo}
+
+    server._save_geo({"1.1.1.1": {"country": "US"}, "2.2.2.2": {}, "3.3.3.3": {"a": 1}})
+
+    assert server.db.calls == [
+        [
+            ({"ip": "1.1.1.1"}, {"$set": {"geo": {"country": "US"}}}),
+            ({"ip": "3.3.3.3"}, {"$set": {"geo": {"a": 1}}}),
+        ]
+    ]
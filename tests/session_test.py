@@ -0,0 +1,75 @@
+import os
+import sys
+
+try:
+    from pyutils.session import SessionStore
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.session import SessionStore
+
+
+class Log:
+    def warning(self, *_):
+        pass
+
+
+PIPELINE = [{"$match": {"cracked": True}}, {"$sort": {"lastSeen": -1}}]
+
+
+def test_get_returns_copies():
+    store = SessionStore(Log(), cache_path=None)
+    store.set(1, PIPELINE, 3)
+
+    session = store.get(1)
+    session["pipeline"].append({"$limit": 1})
+
+    assert store.get(1) == {
+        "pipeline": PIPELINE,
+        "index": 3,
+        "doc": None,
+    }
+    assert store.get(2) is None
+
+
+def test_doc_is_dropped_with_a_new_index():
+    store = SessionStore(Log(), cache_path=None)
+    store.set(1, PIPELINE, 0)
+    store.set_doc(1, {"ip": "10.0.0.1"})
+
+    store.set(1, PIPELINE, 0)
+    assert store.get(1)["doc"] == {"ip": "10.0.0.1"}
+
+    store.set(1, PIPELINE, 1)
+    assert store.get(1)["doc"] is None
+
+
+def test_sessions_persist(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SessionStore(Log(), cache_path=path)
+    store.set(1, PIPELINE, 5)
+    # written by the writer thread, or on exit
+    store.flush()
+
+    session = SessionStore(Log(), cache_path=path).get(1)
+
+    assert session["pipeline"] == PIPELINE
+    assert session["index"] == 5
+
+
+def test_unchanged_sessions_are_written_once(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SessionStore(Log(), cache_path=path, interval=3600)
+
+    # a render sets its session twice, the fast and the full embed
+    store.set(1, PIPELINE, 0)
+    store.set(1, PIPELINE, 0)
+    assert store.flush() == 1
+
+    store.set(1, PIPELINE, 0)
+    assert store.flush() == 0
+
+    # the queued rows of a message are coalesced
+    store.set(1, PIPELINE, 1)
+    store.set(1, PIPELINE, 2)
+    assert store.flush() == 1
+    assert SessionStore(Log(), cache_path=path).get(1)["index"] == 2
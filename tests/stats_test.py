@@ -0,0 +1,92 @@
+import os
+import sys
+
+try:
+    from pyutils.stats import FAKE_ID, Stats
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.stats import FAKE_ID, Stats
+
+
+class Log:
+    def print(self, *_):
+        pass
+
+    error = print
+
+
+def server(**fields):
+    doc = {
+        "ip": "10.0.0.1",
+        "port": 25565,
+        "version": {"name": "Paper 1.8.8", "protocol": 47},
+        "players": {"online": 5, "max": 20},
+    }
+    doc.update(fields)
+    return doc
+
+
+def test_encode_round_trip():
+    for value in ("1.8.8", "$weird.org", "plain"):
+        name = Stats.encode(value)
+        assert "." not in name and not name.startswith("$")
+        assert Stats.decode(name) == value
+
+
+def test_contribution():
+    doc = server(
+        org="AS1 Example",
+        cracked=True,
+        whitelist=None,
+        players={"online": 5, "sample": [{"id": FAKE_ID}, {"id": "abc"}]},
+    )
+
+    out = Stats.contribution(doc)
+
+    assert out["servers"] == 1
+    assert out["players"] == 5
+    assert out["versions.Paper 1．8．8"] == 1
+    assert out["protocols.47"] == 1
+    assert out["orgs.AS1 Example"] == 1
+    assert (out["samplePlayers"], out["realPlayers"], out["fakePlayers"]) == (2, 1, 1)
+    assert out["cracked"] == 1
+    assert out["whitelistKnown"] == 1 and out["whitelisted"] == 0
+
+
+def test_contribution_skips_invalid_versions():
+    out = Stats.contribution(server(version={"name": "UNKNOWN", "protocol": -1}))
+
+    assert out["players"] == 0
+    assert not [k for k in out if k.startswith("versions.")]
+    assert Stats.contribution(None) == {}
+
+
+def test_record_diffs_the_stored_doc():
+    stats = Stats(None, Log())
+    stats._start = lambda: None
+    key = ("10.0.0.1", 25565)
+
+    # a new server
+    stats.seen(key, None)
+    stats.record(key, server())
+    # then 2 more players and cracked
+    stats.record(key, server(players={"online": 7}, cracked=True))
+
+    deltas = {k: v for k, v in stats.deltas.items() if v}
+    assert deltas == {
+        "servers": 1,
+        "players": 7,
+        "versions.Paper 1．8．8": 1,
+        "protocols.47": 1,
+        "cracked": 1,
+    }
+
+
+def test_record_unknown_doc_waits_for_reconcile():
+    stats = Stats(None, Log())
+    stats._start = lambda: None
+
+    stats.record(("10.0.0.1", 25565), server())
+
+    assert not stats.deltas
+    assert stats.untracked == 1
@@ -0,0 +1,107 @@
+import os
+import re
+import sys
+
+import pytest
+
+try:
+    from pyutils.text import Text
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.text import Text
+
+
+def test_ip_int():
+    assert Text.ip_int("0.0.0.0") == 0
+    assert Text.ip_int("1.2.3.4") == 16909060
+    assert Text.ip_int("255.255.255.255") == 2**32 - 1
+    # the ints of range files
+    assert Text.ip_int("16909060") == 16909060
+    assert Text.ip_int(16909060) == 16909060
+
+    with pytest.raises(ValueError):
+        Text.ip_int("example.com")
+
+
+def test_parse_cidrs():
+    assert Text.parse_cidrs("10.0.0.0/24") == [(167772160, 167772415)]
+    assert Text.parse_cidrs("1.2.3.4") == [(16909060, 16909060)]
+    # host bits are ignored
+    assert Text.parse_cidrs("10.0.0.7/24") == [(167772160, 167772415)]
+    # any mask works, not just octets
+    assert Text.parse_cidrs("10.0.0.0/22") == [(167772160, 167773183)]
+
+
+def test_parse_cidrs_merges():
+    # adjacent and overlapping ranges are merged
+    assert Text.parse_cidrs("10.0.1.0/24, 10.0.0.0/24") == [(167772160, 167772671)]
+    assert Text.parse_cidrs("10.0.0.0/16,10.0.5.0/24") == [(167772160, 167837695)]
+    assert Text.parse_cidrs("10.0.0.0/24,10.0.2.0/24") == [
+        (167772160, 167772415),
+        (167772672, 167772927),
+    ]
+
+
+def test_parse_cidrs_invalid():
+    for cidr in ("10.0.0.0/33", "abc/24", ","):
+        with pytest.raises(ValueError):
+            Text.parse_cidrs(cidr)
+
+
+def test_trigrams():
+    assert Text.trigrams("Hello") == ["ell", "hel", "llo"]
+    assert Text.trigrams("ab") == []
+    # both the raw and the colorless text are indexed
+    grams = Text.trigrams("§aHi there")
+    assert "hi " in grams and "§ah" in grams
+
+
+def test_regex_grams():
+    assert Text.regex_grams("hello") == ["ell", "hel", "llo"]
+    assert Text.regex_grams("a.b") == []
+    # optional chars and classes are not required
+    assert Text.regex_grams("colou?r") == ["col", "olo"]
+    assert Text.regex_grams("[abc]def\\d+ghi") == ["def", "ghi"]
+    # alternation has no required grams
+    assert Text.regex_grams("hello|world") == []
+    # groups can be optional or repeated, and (?...) is not literal
+    assert Text.regex_grams("(hello)?world") == ["orl", "rld", "wor"]
+    assert Text.regex_grams("(abc)*def") == ["def"]
+    assert Text.regex_grams("x(?:abc)?yz") == []
+    assert Text.regex_grams("(a[)]b(c))cde") == ["cde"]
+
+
+def test_regex_grams_match():
+    # every gram of a pattern is a gram of the text it matches
+    cases = [
+        ("Hypixel Network", "hypixel\\s+net"),
+        ("§6Welcome to §lSKYBLOCK", "welcome.*skyblock"),
+        ("a server (1.8-1.20)", "server \\(1\\.8"),
+        ("world", "(hello)?world"),
+        ("def", "(abc)*def"),
+        ("xyz", "x(?:abc)?yz"),
+        ("hi there", "hi(?= )\\s+there"),
+    ]
+    for text, pattern in cases:
+        assert re.search(pattern, text, re.I)
+        assert set(Text.regex_grams(pattern)) <= set(Text.trigrams(text))
+
+
+def test_search_grams():
+    doc = {
+        "description": {"text": "Hello", "extra": [{"text": "World"}]},
+        "world": {"signs": [{"text": "Sign"}]},
+    }
+    grams = Text.search_grams(doc)
+    assert {"hel", "wor"} <= set(grams["motdGrams"])
+    assert grams["signGrams"] == ["ign", "sig"]
+    assert Text.search_grams({"description": "abc"}) == {
+        "motdGrams": ["abc"],
+        "signGrams": [],
+    }
+
+
+def test_sample_names():
+    doc = {"players": {"sample": [{"name": "Notch"}, {"name": "notch"}, {"id": "x"}]}}
+    assert Text.sample_names(doc) == ["notch"]
+    assert Text.sample_names({"players": {}}) == []
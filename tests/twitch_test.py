@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+try:
+    from pyutils.twitch import Twitch
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.twitch import Twitch
+
+
+class Log:
+    def __getattr__(self, _):
+        return lambda *_, **__: None
+
+
+class Response:
+    def __init__(self, data, status=200):
+        self.data = data
+        self.status = status
+
+    async def json(self):
+        return self.data
+
+
+class HTTP:
+    """Answers the twitch endpoints and counts the calls"""
+
+    def __init__(self, logins):
+        self.logins = logins
+        self.calls = {"token": 0, "users": 0, "streams": 0}
+
+    @asynccontextmanager
+    async def post(self, url, **_):
+        self.calls["token"] += 1
+        yield Response({"access_token": "abc", "expires_in": 3600})
+
+    @asynccontextmanager
+    async def get(self, url, params=None, **_):
+        if url.endswith("/streams"):
+            self.calls["streams"] += 1
+            names = [value for key, value in params if key == "user_login"]
+            yield Response(
+                {
+                    "data": [
+                        {"user_login": name, "game_id": "27471"}
+                        for name in names
+                        if name in self.logins
+                    ]
+                }
+            )
+            return
+
+        self.calls["users"] += 1
+        names = [value for key, value in params if key == "login"]
+        yield Response(
+            {"data": [{"login": name} for name in names if name in self.logins]}
+        )
+
+
+def test_is_twitch_user_caches_names_and_token():
+    http = HTTP({"alice"})
+    twitch = Twitch(Log(), "id", "secret", http=http)
+
+    assert asyncio.run(twitch.is_twitch_user("Alice", "bob")) == [True, False]
+    assert asyncio.run(twitch.is_twitch_user("bob", "ALICE", "alice")) == [
+        False,
+        True,
+        True,
+    ]
+    assert http.calls == {"token": 1, "users": 1, "streams": 0}
+
+
+def test_live_streams_reads_the_index():
+    twitch = Twitch(Log(), None, None, http=HTTP(set()))
+    twitch.live = {"alice": {"user_login": "Alice"}}
+
+    assert twitch.live_streams("ALICE", "alice", "bob") == [{"user_login": "Alice"}]
+
+
+def test_live_streams_fall_back_to_twitch_when_stale():
+    http = HTTP({"alice"})
+    twitch = Twitch(Log(), "id", "secret", http=http)
+    twitch._start = lambda: True
+
+    streams = asyncio.run(twitch.async_live_streams("Alice", "bob"))
+    assert streams == [{"user_login": "alice", "game_id": "27471"}]
+    assert http.calls["streams"] == 1
+
+    # a fresh index answers without twitch
+    twitch.live = {"bob": {"user_login": "bob"}}
+    twitch.live_updated = time.time()
+    assert asyncio.run(twitch.async_live_streams("bob")) == [{"user_login": "bob"}]
+    assert http.calls["streams"] == 1
@@ -0,0 +1,122 @@
+import os
+import sys
+import threading
+
+from pymongo.errors import BulkWriteError
+
+try:
+    from pyutils.writer import BulkWriter
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from pyutils.writer import BulkWriter
+
+
+class Log:
+    def __getattr__(self, _):
+        return lambda *_, **__: None
+
+
+def test_merge_set():
+    merged = BulkWriter.merge(
+        {"$set": {"a": 1, "b": 1}},
+        {"$set": {"b": 2, "c": 3}},
+    )
+
+    assert merged == {"$set": {"a": 1, "b": 2, "c": 3}}
+
+
+def test_merge_set_on_insert_keeps_first():
+    merged = BulkWriter.merge(
+        {"$setOnInsert": {"a": 1}},
+        {"$setOnInsert": {"a": 2, "b": 2}},
+    )
+
+    assert merged == {"$setOnInsert": {"a": 1, "b": 2}}
+
+
+def test_merge_inc_sums():
+    merged = BulkWriter.merge({"$inc": {"a": 1}}, {"$inc": {"a": 2, "b": 1}})
+
+    assert merged == {"$inc": {"a": 3, "b": 1}}
+
+
+def test_merge_max_min_keep_bounds():
+    merged = BulkWriter.merge(
+        {"$max": {"lastSeen": 5}, "$min": {"firstSeen": 5}},
+        {"$max": {"lastSeen": 3}, "$min": {"firstSeen": 3}},
+    )
+
+    assert merged == {"$max": {"lastSeen": 5}, "$min": {"firstSeen": 3}}
+
+
+def test_merge_does_not_mutate():
+    old = {"$set": {"a": 1}}
+    BulkWriter.merge(old, {"$set": {"a": 2}})
+
+    assert old == {"$set": {"a": 1}}
+
+
+def test_callbacks_get_the_written_upserts():
+    class Col:
+        def bulk_write(self, requests, ordered=True):
+            self.requests = requests
+
+    writer = BulkWriter(Col(), Log())
+    written = []
+    writer.callbacks.append(written.extend)
+    writer.pending[1] = ({"ip": "1.1.1.1"}, {"$set": {"a": 1}})
+    writer.pending[2] = ({"ip": "2.2.2.2"}, {"$set": {"a": 2}})
+
+    # nothing is reported before the flush
+    assert written == []
+    assert writer.flush() == 2
+    assert written == [
+        ({"ip": "1.1.1.1"}, {"$set": {"a": 1}}),
+        ({"ip": "2.2.2.2"}, {"$set": {"a": 2}}),
+    ]
+
+
+def test_partial_failure_counts_only_the_applied_upserts():
+    class Col:
+        def bulk_write(self, requests, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "dup"}]})
+
+    writer = BulkWriter(Col(), Log())
+    written = []
+    writer.callbacks.append(written.extend)
+    writer.pending[1] = ({"ip": "1.1.1.1"}, {"$set": {"a": 1}})
+    writer.pending[2] = ({"ip": "2.2.2.2"}, {"$set": {"a": 2}})
+    writer.pending[3] = ({"ip": "3.3.3.3"}, {"$set": {"a": 3}})
+
+    writer.flush()
+
+    assert written == [
+        ({"ip": "1.1.1.1"}, {"$set": {"a": 1}}),
+        ({"ip": "3.3.3.3"}, {"$set": {"a": 3}}),
+    ]
+    assert writer.stats()["written"] == 2
+    assert writer.stats()["errors"] == 1
+
+
+def test_put_after_close_writes_outside_the_lock():
+    writer = None
+    acquired = []
+
+    class Col:
+        def bulk_write(self, requests, ordered=True):
+            # another producer can take the condition during the write
+            def producer():
+                if writer.cond.acquire(timeout=1):
+                    acquired.append(True)
+                    writer.cond.release()
+
+            thread = threading.Thread(target=producer)
+            thread.start()
+            thread.join()
+
+    writer = BulkWriter(Col(), Log())
+    writer.closed = True
+    writer.put({"ip": "1.1.1.1"}, {"$set": {"a": 1}})
+
+    assert acquired == [True]
+    assert writer.stats()["written"] == 1